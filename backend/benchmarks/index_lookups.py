@@ -0,0 +1,139 @@
+"""Benchmark of the hot lookups with and without the lookup indexes.
+
+Seeds a temporary SQLite database with 100k feedback answers and times the
+queries used by the feedback and IAgo routers, first without the indexes
+and then with them.
+
+Usage:
+    python -m benchmarks.index_lookups [--answers 100000]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session, joinedload
+
+from src.database.models import (
+    Feedback,
+    FeedbackAnswer,
+    IAMessageStore,
+    User,
+    table_registry,
+)
+
+QUESTIONS = 10
+LOOKUP_INDEXES = [
+    'uq_feedback_user_id_auto_feedback',
+    'uq_feedback_answers_feedback_id_question_number',
+    'ix_ia_message_store_user_id_created_at',
+]
+
+
+def seed(session: Session, answers: int):
+    users = answers // (QUESTIONS * 2)
+    session.execute(
+        insert(User),
+        [
+            {
+                'name': f'user {i}',
+                'password': 'x',
+                'email': f'user{i}@gocase.com',
+                'is_leader': False,
+            }
+            for i in range(users)
+        ],
+    )
+    session.execute(
+        insert(Feedback),
+        [
+            {'user_id': user_id, 'auto_feedback': auto}
+            for user_id in range(1, users + 1)
+            for auto in (True, False)
+        ],
+    )
+    session.execute(
+        insert(FeedbackAnswer),
+        [
+            {
+                'feedback_id': feedback_id,
+                'question_number': question,
+                'answer': random.randint(1, 5),
+                'explanation': 'justificativa',
+            }
+            for feedback_id in range(1, users * 2 + 1)
+            for question in range(1, QUESTIONS + 1)
+        ],
+    )
+    session.execute(
+        insert(IAMessageStore),
+        [
+            {'user_id': user_id, 'message': 'pdi', 'score': False}
+            for user_id in range(1, users + 1)
+            for _ in range(2)
+        ],
+    )
+    session.commit()
+    return users
+
+
+def run_lookups(session: Session, user_ids: list[int]) -> float:
+    start = time.perf_counter()
+    for user_id in user_ids:
+        session.scalars(
+            select(Feedback)
+            .where(Feedback.user_id == user_id)
+            .options(joinedload(Feedback.answers))
+        ).unique().all()
+        session.scalar(
+            select(Feedback).where(
+                (Feedback.user_id == user_id) & (Feedback.auto_feedback)
+            )
+        )
+        session.scalar(
+            select(IAMessageStore)
+            .where(IAMessageStore.user_id == user_id)
+            .order_by(IAMessageStore.created_at.desc())
+            .limit(1)
+        )
+        session.expunge_all()
+    return (time.perf_counter() - start) / len(user_ids) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--answers', type=int, default=100_000)
+    parser.add_argument('--lookups', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f'sqlite:///{os.path.join(tmp, "bench.db")}')
+        table_registry.metadata.create_all(engine)
+        with engine.begin() as conn:
+            for index in LOOKUP_INDEXES:
+                conn.exec_driver_sql(f'DROP INDEX {index}')
+
+        with Session(engine) as session:
+            users = seed(session, args.answers)
+            user_ids = random.sample(range(1, users + 1), args.lookups)
+
+            without_indexes = run_lookups(session, user_ids)
+
+            for table in table_registry.metadata.sorted_tables:
+                for index in table.indexes:
+                    if index.name in LOOKUP_INDEXES:
+                        index.create(session.connection())
+            session.commit()
+
+            with_indexes = run_lookups(session, user_ids)
+
+    print(f'{args.answers} answers, {users} users, {args.lookups} lookups')
+    print(f'without indexes: {without_indexes:.3f} ms/lookup')
+    print(f'with indexes:    {with_indexes:.3f} ms/lookup')
+
+
+if __name__ == '__main__':
+    main()
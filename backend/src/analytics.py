@@ -0,0 +1,260 @@
+"""This module contains the analytics rollups: per question count, sum and
+histogram of the auto answers, the leader answers and the final scores.
+
+The rollups are kept up to date incrementally, by applying the difference
+of every change to the `question_stats` rows, so reading them costs the
+same no matter how many answers exist. `rebuild_question_stats` recomputes
+them from scratch."""
+
+import enum
+from collections import defaultdict
+from typing import Any, DefaultDict, Dict, Iterable, List, Tuple
+
+from sqlalchemy import (
+    Float,
+    Numeric,
+    bindparam,
+    case,
+    cast,
+    delete,
+    func,
+    insert,
+    literal,
+    select,
+    union_all,
+    update,
+)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from src.database.models import (
+    Feedback,
+    FeedbackAnswer,
+    FinalScore,
+    QuestionStats,
+)
+
+BUCKETS = range(1, 6)
+# Casas usadas antes de escolher a faixa, para o erro de ponto flutuante
+# não jogar um valor como 2.9999999999999996 na faixa de baixo
+BUCKET_DIGITS = 6
+COUNTERS = ['count', 'total', *(f'count_{bucket}' for bucket in BUCKETS)]
+
+
+class StatKind(str, enum.Enum):
+    AUTO = 'auto'  # respostas do auto-feedback
+    LEADER = 'leader'  # respostas do feedback do líder
+    FINAL = 'final'  # pontuações finais
+
+
+def feedback_kind(auto_feedback: bool) -> str:
+    return StatKind.AUTO.value if auto_feedback else StatKind.LEADER.value
+
+
+def score_bucket(value: float) -> int:
+    """Histogram bucket of an answer or final score: 1 <= value < 2 is 1,
+    and so on, up to 5.
+
+    Raises:
+        ValueError: If the value is outside the 1 to 5 scale, which the
+        feedback schema already rejects.
+    """
+    value = round(value, BUCKET_DIGITS)
+    if not BUCKETS[0] <= value <= BUCKETS[-1]:
+        raise ValueError(f'Score out of the 1 to 5 scale: {value}')
+    return int(value)
+
+
+def _bucket_expression(value):
+    # Mesmo critério de score_bucket, portável entre SQLite e PostgreSQL
+    # O PostgreSQL só arredonda com casas decimais valores NUMERIC
+    value = func.round(cast(value, Numeric), BUCKET_DIGITS)
+    return case(
+        *((value < bucket + 1, bucket) for bucket in BUCKETS[:-1]),
+        else_=BUCKETS[-1],
+    )
+
+
+def update_question_stats(
+    session: Session,
+    kind: str,
+    removed: Iterable[Tuple[int, float]] = (),
+    added: Iterable[Tuple[int, float]] = (),
+):
+    """
+    Applies a change of answers or final scores to the rollups, in the
+    session transaction.
+
+    Args:
+        session (Session): The database session.
+        kind (str): A `StatKind` value.
+        removed (Iterable[Tuple[int, float]]): The (question number, value)
+        pairs that no longer exist, or the old values of updated ones.
+        added (Iterable[Tuple[int, float]]): The new (question number,
+        value) pairs.
+    """
+    deltas: DefaultDict[int, DefaultDict[str, float]] = defaultdict(
+        lambda: defaultdict(float)
+    )
+    for sign, values in ((-1, removed), (1, added)):
+        for question_number, value in values:
+            delta = deltas[int(question_number)]
+            delta['count'] += sign
+            delta['total'] += sign * float(value)
+            delta[f'count_{score_bucket(value)}'] += sign
+    if not deltas:
+        return
+
+    existing = set(
+        session.scalars(
+            select(QuestionStats.question_number).where(
+                (QuestionStats.kind == kind)
+                & (QuestionStats.question_number.in_(deltas))
+            )
+        )
+    )
+    for question_number in deltas.keys() - existing:
+        # Outra transação pode ter criado a linha ao mesmo tempo
+        try:
+            with session.begin_nested():
+                session.add(
+                    QuestionStats(kind=kind, question_number=question_number)
+                )
+        except IntegrityError:
+            pass
+
+    # Os incrementos são feitos pelo banco (col = col + delta), então
+    # atualizações concorrentes não se sobrescrevem
+    table = QuestionStats.__table__
+    session.connection().execute(
+        update(table)
+        .where(
+            (table.c.kind == bindparam('b_kind'))
+            & (table.c.question_number == bindparam('b_question_number'))
+        )
+        .values({
+            column: table.c[column] + bindparam(f'd_{column}')
+            for column in COUNTERS
+        }),
+        [
+            {
+                'b_kind': kind,
+                'b_question_number': question_number,
+                **{
+                    f'd_{column}': (
+                        delta[column]
+                        if column == 'total'
+                        else int(delta[column])
+                    )
+                    for column in COUNTERS
+                },
+            }
+            for question_number, delta in deltas.items()
+        ],
+    )
+
+
+def rebuild_question_stats(session: Session) -> int:
+    """
+    Recomputes every rollup from the feedback answers and the final scores
+    in a single transaction. Run it after `rebuild_final_scores`.
+
+    Returns:
+        int: The number of rollup rows stored.
+    """
+    answer_kind = case(
+        (Feedback.auto_feedback, StatKind.AUTO.value),
+        else_=StatKind.LEADER.value,
+    )
+    sources = [
+        (
+            select(
+                answer_kind.label('kind'),
+                FeedbackAnswer.question_number,
+                cast(FeedbackAnswer.answer, Float).label('value'),
+            ).join(Feedback, Feedback.id == FeedbackAnswer.feedback_id)
+        ),
+        select(
+            literal(StatKind.FINAL.value).label('kind'),
+            FinalScore.question_number,
+            FinalScore.final_score.label('value'),
+        ),
+    ]
+    values = union_all(*sources).subquery()
+    bucket = _bucket_expression(values.c.value)
+
+    session.execute(delete(QuestionStats))
+    rows = session.execute(
+        select(
+            values.c.kind,
+            values.c.question_number,
+            func.count().label('count'),
+            func.sum(values.c.value).label('total'),
+            *(
+                func.sum(case((bucket == b, 1), else_=0)).label(f'count_{b}')
+                for b in BUCKETS
+            ),
+        ).group_by(values.c.kind, values.c.question_number)
+    ).all()
+    if rows:
+        session.execute(insert(QuestionStats), [row._asdict() for row in rows])
+    session.commit()
+    return len(rows)
+
+
+def _stats_row(stats) -> Dict[str, Any]:
+    return {
+        'count': stats.count,
+        'mean': stats.total / stats.count if stats.count else None,
+        'histogram': {
+            bucket: getattr(stats, f'count_{bucket}') for bucket in BUCKETS
+        },
+    }
+
+
+def get_question_stats(
+    session: Session, kind: str | None = None
+) -> List[Dict[str, Any]]:
+    """
+    Reads the rollups, ordered by kind and question number.
+
+    Returns:
+        List[Dict[str, Any]]: The count, mean and histogram of each kind
+        and question.
+    """
+    query = select(QuestionStats).order_by(
+        QuestionStats.kind, QuestionStats.question_number
+    )
+    if kind is not None:
+        query = query.where(QuestionStats.kind == kind)
+
+    return [
+        {
+            'kind': stats.kind,
+            'question_number': stats.question_number,
+            **_stats_row(stats),
+        }
+        for stats in session.scalars(query)
+    ]
+
+
+def get_stats_summary(session: Session) -> List[Dict[str, Any]]:
+    """
+    Sums the rollups of every question, giving the overall count, mean and
+    histogram of each kind.
+
+    Returns:
+        List[Dict[str, Any]]: The summary of each kind.
+    """
+    rows = session.execute(
+        select(
+            QuestionStats.kind,
+            *(
+                func.sum(getattr(QuestionStats, column)).label(column)
+                for column in COUNTERS
+            ),
+        )
+        .group_by(QuestionStats.kind)
+        .order_by(QuestionStats.kind)
+    ).all()
+    return [{'kind': row.kind, **_stats_row(row)} for row in rows]
@@ -1,13 +1,58 @@
+import logging
+from contextlib import asynccontextmanager
 from http import HTTPStatus
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
 
-from src.routers import auth, collaborators, feedback, iago, leaders, users
+from src.assistant.cache import GenerationCache
+from src.assistant.jobs import JobRunner
+from src.assistant.registry import AssistantRegistry
+from src.instrumentation import InstrumentationMiddleware
+from src.logs import RequestIdMiddleware, configure_logging
+from src.password_hashing import PasswordHashingPool
+from src.routers import (
+    analytics,
+    auth,
+    collaborators,
+    export,
+    feedback,
+    iago,
+    leaders,
+    metrics,
+    users,
+)
 from src.schemas.message import Message
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_listener = configure_logging()
+    # O assistente é criado uma única vez e reaproveitado pelas requisições
+    registry = AssistantRegistry()
+    try:
+        registry.get_assistant()
+    except Exception:
+        logger.warning('IAgo assistant warm up failed', exc_info=True)
+    generation_cache = GenerationCache()
+    job_runner = JobRunner(registry, generation_cache)
+    await job_runner.start()
+    password_hashing_pool = PasswordHashingPool()
+
+    app.state.assistant_registry = registry
+    app.state.generation_cache = generation_cache
+    app.state.job_runner = job_runner
+    app.state.password_hashing_pool = password_hashing_pool
+    yield
+    await job_runner.stop()
+    password_hashing_pool.shutdown()
+    log_listener.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # 🚀 Adiciona CORS para permitir requisições do frontend
 app.add_middleware(
@@ -18,12 +63,20 @@ app.add_middleware(
     allow_headers=['*'],  # Permite todos os headers
 )
 
+# O último middleware adicionado é o mais externo: o id da requisição já
+# está definido quando a instrumentação registra uma requisição lenta
+app.add_middleware(InstrumentationMiddleware)
+app.add_middleware(RequestIdMiddleware)
+
 app.include_router(collaborators.router)
 app.include_router(leaders.router)
 app.include_router(auth.router)
 app.include_router(feedback.router)
 app.include_router(iago.router)
 app.include_router(users.router)
+app.include_router(metrics.router)
+app.include_router(analytics.router)
+app.include_router(export.router)
 
 
 @app.get(
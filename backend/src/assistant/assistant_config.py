@@ -1,24 +1,45 @@
 """This module contains the IeeeAssistant class, which initializes and manages
 the configuration and execution of an assistant model."""
 
+import asyncio
 import dataclasses
+import logging
 import os
-from typing import Any, Dict, List
+import time
+from typing import Any, AsyncIterator, Dict, List
 
 from langchain.chat_models.base import BaseChatModel
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import SystemMessage
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.outputs import ChatGeneration, LLMResult
 from langchain_core.prompts import (
     ChatPromptTemplate,
     HumanMessagePromptTemplate,
     SystemMessagePromptTemplate,
 )
-from langchain_google_genai import ChatGoogleGenerativeAI
 
-from src.settings import Settings
+from src.assistant.prompt import (
+    apply_token_budget,
+    build_prompt_inputs,
+    estimate_tokens,
+)
+from src.assistant.providers import create_llm, get_context_cache
+from src.assistant.resilience import get_resilient_llm
+from src.instrumentation import (
+    count_llm_tokens,
+    record_prompt_tokens,
+    track_llm_call,
+)
+from src.settings import get_settings
 from src.utils.yaml import read_yaml_file
 
 # ASSISTANT_CONFIG_PATH = Settings().ASSISTANT_CONFIG_PATH
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_PROMPT = 'Gere o feedback para o colaborador'
+
 
 @dataclasses.dataclass
 class LLMConfig:
@@ -30,11 +51,42 @@ class LLMConfig:
         model (str): The name or identifier of the language model.
         temperature (float): The temperature parameter for the language model,
         which controls the randomness of the output.
+        options (Dict[str, Any]): Provider specific options, from
+        `model_options`.
+        questions (List[str]): The titles of the feedback questions, in
+        order, rendered in the prompt evaluation table.
+        user_prompt (str): The template of the user message, with the
+        variables of every request.
     """
 
     sys_prompt: str
     model: str
     temperature: float
+    options: Dict[str, Any] = dataclasses.field(default_factory=dict)
+    questions: List[str] = dataclasses.field(default_factory=list)
+    user_prompt: str = DEFAULT_USER_PROMPT
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Counts the tokens reported by the language model in every response."""
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any):
+        for generations in response.generations:
+            for generation in generations:
+                if not isinstance(generation, ChatGeneration):
+                    continue
+                usage = getattr(generation.message, 'usage_metadata', None)
+                if usage:
+                    details = usage.get('input_token_details') or {}
+                    count_llm_tokens(
+                        self.model,
+                        usage.get('input_tokens', 0),
+                        usage.get('output_tokens', 0),
+                        details.get('cache_read', 0),
+                    )
 
 
 class IAgoAssistant:
@@ -69,19 +121,33 @@ class IAgoAssistant:
             Runs the assistant with the given input and retrieves the response.
     """
 
-    def __init__(self):
-        self.configs = self.get_configs()
+    def __init__(self, config_path: str | None = None):
+        self.configs = self.get_configs(
+            config_path or get_settings().ASSISTANT_CONFIG_PATH
+        )
         self.assistant_config = self.get_assistant_config()
         self.llm_config = LLMConfig(
             sys_prompt=self.assistant_config.get('system_message'),
             model=self.assistant_config.get('model'),
             temperature=self.assistant_config.get('temperature'),
+            options=self.assistant_config.get('model_options') or {},
+            questions=self.assistant_config.get('questions') or [],
+            user_prompt=self.assistant_config.get('user_message')
+            or DEFAULT_USER_PROMPT,
         )
         self.tools = self.assistant_config.get('tools')
+        # O prompt de sistema é fixo: os tokens são estimados uma única vez
+        self.template_tokens = estimate_tokens(
+            self.llm_config.sys_prompt
+        ) + estimate_tokens(self.llm_config.user_prompt)
+        self.context_cache_expires_at: float | None = None
+        # Timeouts, retentativas e circuit breaker das chamadas ao LLM,
+        # compartilhados pelas reconstruções do assistente
+        self.resilience = get_resilient_llm(self.llm_config.model)
 
     @staticmethod
     def get_configs(
-        config_path: str = Settings().ASSISTANT_CONFIG_PATH,  # type: ignore
+        config_path: str = get_settings().ASSISTANT_CONFIG_PATH,  # type: ignore
     ) -> List[Dict[str, Any]]:
         """
         Retrieves configuration data from YAML files located at the specified
@@ -123,32 +189,23 @@ class IAgoAssistant:
 
     def get_llm_model(self) -> BaseChatModel:
         """
-        Returns the appropriate LLM model instance based on the configuration.
-
-        If the model specified in the configuration is 'gemini', it returns an
-        instance
-        of ChatGoogleGenerativeAI with the specified model and temperature
-        settings.
-        Otherwise, it raises a ValueError indicating that the model is invalid
-        or not supported.
+        Returns the LLM client of the provider of the configured model,
+        e.g. ChatGoogleGenerativeAI for 'gemini-*' models or the local
+        FakeChatModel for 'fake*' models. The `model_options` of the
+        configuration are passed to the provider.
 
         Returns:
-            str: An instance of ChatGoogleGenerativeAI if the model is 'gemini'
+            BaseChatModel: The chat model client.
 
         Raises:
             ValueError: If the model specified in the configuration is invalid
             or not supported.
         """
-        if 'gemini' in self.llm_config.model:
-            return ChatGoogleGenerativeAI(
-                model=f'{self.llm_config.model}',
-                temperature=self.llm_config.temperature,
-                api_key=Settings().GOOGLE_API_KEY,  # type: ignore
-            )
-        else:
-            raise ValueError(
-                f'Invalid LLM model: {self.llm_config.model}, or not supported'
-            )
+        return create_llm(
+            self.llm_config.model,
+            self.llm_config.temperature,
+            self.llm_config.options,
+        )
 
     def get_assistant(self):
         """
@@ -160,15 +217,14 @@ class IAgoAssistant:
         1. Retrieves the LLM model using the `get_llm_model` method and
         assigns it to `self._llm`.
 
-        2. Constructs a list of message templates for the assistant's prompt,
-        including system and human message templates.
+        2. Constructs the messages of the assistant's prompt: the fixed
+        system message, built once or cached on the provider, and the human
+        message template with the variables of every request.
 
-        3. Defines the input variables required for the prompt.
+        3. Creates a `ChatPromptTemplate` using the defined messages, whose
+        input variables are inferred from the templates.
 
-        4. Creates a `ChatPromptTemplate` using the defined messages and
-        input variables.
-
-        5. Initializes the assistant by creating a document chain with the
+        4. Initializes the assistant by creating a document chain with the
         LLM and the prompt template.
 
         Returns:
@@ -176,84 +232,150 @@ class IAgoAssistant:
         """
         if not hasattr(self, 'assistant') or not hasattr(self, '_llm'):
             llm = self.get_llm_model()
-            self._llm = llm
 
-            messages = [
-                SystemMessagePromptTemplate.from_template(
-                    self.llm_config.sys_prompt
-                ),
+            system_prompt = SystemMessagePromptTemplate.from_template(
+                self.llm_config.sys_prompt
+            )
+            if system_prompt.input_variables:
+                # Prompt de sistema com variáveis: formatado a cada chamada
+                messages = [system_prompt]
+            elif (cached_llm := self._cache_static_prefix(llm)) is not None:
+                # O provedor já tem o prompt de sistema em cache
+                llm, messages = cached_llm, []
+            else:
+                # A mensagem fixa é montada uma única vez, sem template
+                messages = [SystemMessage(content=self.llm_config.sys_prompt)]
+            messages.append(
                 HumanMessagePromptTemplate.from_template(
-                    'Gere o feedback para o colaborador'
-                ),
-                # MessagesPlaceholder(variable_name="agent_scratchpad"),
-            ]
-            input_variables = [
-                'colaborador_q1',
-                'colaborador_q1_justificativa',
-                'colaborador_q2',
-                'colaborador_q2_justificativa',
-                'colaborador_q3',
-                'colaborador_q3_justificativa',
-                'colaborador_q4',
-                'colaborador_q4_justificativa',
-                'colaborador_q5',
-                'colaborador_q5_justificativa',
-                'colaborador_q6',
-                'colaborador_q6_justificativa',
-                'colaborador_q7',
-                'colaborador_q7_justificativa',
-                'colaborador_q8',
-                'colaborador_q8_justificativa',
-                'colaborador_q9',
-                'colaborador_q9_justificativa',
-                'colaborador_q10',
-                'colaborador_q10_justificativa',
-                'gestor_q1',
-                'gestor_q1_justificativa',
-                'gestor_q2',
-                'gestor_q2_justificativa',
-                'gestor_q3',
-                'gestor_q3_justificativa',
-                'gestor_q4',
-                'gestor_q4_justificativa',
-                'gestor_q5',
-                'gestor_q5_justificativa',
-                'gestor_q6',
-                'gestor_q6_justificativa',
-                'gestor_q7',
-                'gestor_q7_justificativa',
-                'gestor_q8',
-                'gestor_q8_justificativa',
-                'gestor_q9',
-                'gestor_q9_justificativa',
-                'gestor_q10',
-                'gestor_q10_justificativa',
-                'final_q1',
-                'final_q2',
-                'final_q3',
-                'final_q4',
-                'final_q5',
-                'final_q6',
-                'final_q7',
-                'final_q8',
-                'final_q9',
-                'final_q10',
-                'nome_colaborador',
-            ]
-
-            _prompt = ChatPromptTemplate(
-                messages=messages, input_variables=input_variables
+                    self.llm_config.user_prompt
+                )
             )
+            self._llm = llm
+
+            # As variáveis (nome_colaborador e avaliacao) são inferidas dos
+            # templates
+            _prompt = ChatPromptTemplate(messages=messages)
 
             self.assistant = _prompt | self._llm | StrOutputParser()
-            print('Assistant initialized')
+            logger.info('Assistant initialized')
+
+    def _cache_static_prefix(self, llm: BaseChatModel) -> BaseChatModel | None:
+        """
+        Caches the system prompt on the provider, when it supports context
+        caching and IAGO_CONTEXT_CACHE is enabled.
+
+        Returns:
+            BaseChatModel | None: The LLM using the cached prompt, or None
+            to send the prompt in every request.
+        """
+        settings = get_settings()
+        cache_context = get_context_cache(self.llm_config.model)
+        if not settings.IAGO_CONTEXT_CACHE or cache_context is None:
+            return None
+        # Os provedores recusam caches menores que um mínimo de tokens
+        prefix_tokens = estimate_tokens(self.llm_config.sys_prompt)
+        if prefix_tokens < settings.IAGO_CONTEXT_CACHE_MIN_TOKENS:
+            return None
+
+        ttl = settings.IAGO_CONTEXT_CACHE_TTL_SECONDS
+        try:
+            cached_llm = cache_context(llm, self.llm_config.sys_prompt, ttl)
+        except Exception:
+            logger.warning(
+                'Context cache creation failed',
+                exc_info=True,
+                extra={'model': self.llm_config.model},
+            )
+            return None
+        # Reconstruído antes de expirar, pelo AssistantRegistry
+        self.context_cache_expires_at = time.monotonic() + ttl * 0.9
+        logger.info(
+            'Context cache created',
+            extra={
+                'model': self.llm_config.model,
+                'prefix_tokens': prefix_tokens,
+                'ttl_seconds': ttl,
+            },
+        )
+        return cached_llm
+
+    def context_cache_expired(self) -> bool:
+        """Returns whether the provider cache of the system prompt expired."""
+        return (
+            self.context_cache_expires_at is not None
+            and time.monotonic() >= self.context_cache_expires_at
+        )
+
+    def get_prompt_inputs(self, inputs: dict) -> Dict[str, Any]:
+        """
+        Maps the given inputs to the variables expected by the prompt: the
+        collaborator name and the evaluation table with the answers. The
+        longest explanations are truncated to keep the prompt within
+        IAGO_PROMPT_TOKEN_BUDGET tokens; a budget smaller than the fixed
+        part of the prompt is logged and not applied.
+
+        Args:
+            inputs (dict): The assistant inputs.
+
+        Returns:
+            Dict[str, Any]: The prompt variables.
+        """
+        budget = get_settings().IAGO_PROMPT_TOKEN_BUDGET
+        inputs, tokens = apply_token_budget(
+            self.template_tokens, self.llm_config.questions, inputs, budget
+        )
+        record_prompt_tokens(
+            self.llm_config.model, tokens.final, tokens.truncated
+        )
+        if budget and tokens.fixed >= budget:
+            logger.warning(
+                'Prompt token budget smaller than the fixed prompt, '
+                'explanations kept',
+                extra={
+                    'budget_tokens': budget,
+                    'fixed_tokens': tokens.fixed,
+                    'prompt_tokens': tokens.final,
+                },
+            )
+        if tokens.truncated:
+            logger.info(
+                'Prompt explanations truncated',
+                extra={
+                    'original_tokens': tokens.original,
+                    'prompt_tokens': tokens.final,
+                    'truncated': tokens.truncated,
+                },
+            )
+        return build_prompt_inputs(self.llm_config.questions, inputs)
+
+    def _run_config(self) -> Dict[str, Any]:
+        # Contabiliza os tokens de cada chamada nas métricas
+        return {'callbacks': [TokenUsageCallback(self.llm_config.model)]}
 
     def run_assistant(self, inputs: dict):
         """
         Runs the assistant with the given input string.
 
-        This method retrieves relevant documents based on the input string and
-        invokes the assistant with the input and the retrieved context.
+        The call runs `arun_assistant` in a new event loop, so it gets the
+        same deadline, retries and circuit breaker; it cannot be called from
+        a running event loop.
+
+        Args:
+            inputs (dict): The input string to process.
+
+        Returns:
+            The response from the assistant.
+
+        Raises:
+            ValueError: If the assistant is not initialized.
+            LLMUnavailableError: If the LLM could not answer.
+        """
+        return asyncio.run(self.arun_assistant(inputs))
+
+    async def arun_assistant(self, inputs: dict):
+        """
+        Async version of `run_assistant`, which awaits the LLM instead of
+        blocking the calling thread.
 
         Args:
             inputs (dict): The input string to process.
@@ -263,82 +385,46 @@ class IAgoAssistant:
 
         Raises:
             ValueError: If the assistant is not initialized.
+            LLMUnavailableError: If the LLM could not answer.
         """
         if not hasattr(self, 'assistant'):
             raise ValueError('Assistant not initialized')
-        # print('Contexto:', docs)
-
-        response = self.assistant.invoke({
-            'colaborador_q1': inputs.get('colaborador_q1'),
-            'colaborador_q1_justificativa': inputs.get(
-                'colaborador_q1_justificativa'
-            ),
-            'colaborador_q2': inputs.get('colaborador_q2'),
-            'colaborador_q2_justificativa': inputs.get(
-                'colaborador_q2_justificativa'
-            ),
-            'colaborador_q3': inputs.get('colaborador_q3'),
-            'colaborador_q3_justificativa': inputs.get(
-                'colaborador_q3_justificativa'
-            ),
-            'colaborador_q4': inputs.get('colaborador_q4'),
-            'colaborador_q4_justificativa': inputs.get(
-                'colaborador_q4_justificativa'
-            ),
-            'colaborador_q5': inputs.get('colaborador_q5'),
-            'colaborador_q5_justificativa': inputs.get(
-                'colaborador_q5_justificativa'
-            ),
-            'colaborador_q6': inputs.get('colaborador_q6'),
-            'colaborador_q6_justificativa': inputs.get(
-                'colaborador_q6_justificativa'
-            ),
-            'colaborador_q7': inputs.get('colaborador_q7'),
-            'colaborador_q7_justificativa': inputs.get(
-                'colaborador_q7_justificativa'
-            ),
-            'colaborador_q8': inputs.get('colaborador_q8'),
-            'colaborador_q8_justificativa': inputs.get(
-                'colaborador_q8_justificativa'
-            ),
-            'colaborador_q9': inputs.get('colaborador_q9'),
-            'colaborador_q9_justificativa': inputs.get(
-                'colaborador_q9_justificativa'
-            ),
-            'colaborador_q10': inputs.get('colaborador_q10'),
-            'colaborador_q10_justificativa': inputs.get(
-                'colaborador_q10_justificativa'
-            ),
-            'gestor_q1': inputs.get('gestor_q1'),
-            'gestor_q1_justificativa': inputs.get('gestor_q1_justificativa'),
-            'gestor_q2': inputs.get('gestor_q2'),
-            'gestor_q2_justificativa': inputs.get('gestor_q2_justificativa'),
-            'gestor_q3': inputs.get('gestor_q3'),
-            'gestor_q3_justificativa': inputs.get('gestor_q3_justificativa'),
-            'gestor_q4': inputs.get('gestor_q4'),
-            'gestor_q4_justificativa': inputs.get('gestor_q4_justificativa'),
-            'gestor_q5': inputs.get('gestor_q5'),
-            'gestor_q5_justificativa': inputs.get('gestor_q5_justificativa'),
-            'gestor_q6': inputs.get('gestor_q6'),
-            'gestor_q6_justificativa': inputs.get('gestor_q6_justificativa'),
-            'gestor_q7': inputs.get('gestor_q7'),
-            'gestor_q7_justificativa': inputs.get('gestor_q7_justificativa'),
-            'gestor_q8': inputs.get('gestor_q8'),
-            'gestor_q8_justificativa': inputs.get('gestor_q8_justificativa'),
-            'gestor_q9': inputs.get('gestor_q9'),
-            'gestor_q9_justificativa': inputs.get('gestor_q9_justificativa'),
-            'gestor_q10': inputs.get('gestor_q10'),
-            'gestor_q10_justificativa': inputs.get('gestor_q10_justificativa'),
-            'final_q1': inputs.get('final_q1'),
-            'final_q2': inputs.get('final_q2'),
-            'final_q3': inputs.get('final_q3'),
-            'final_q4': inputs.get('final_q4'),
-            'final_q5': inputs.get('final_q5'),
-            'final_q6': inputs.get('final_q6'),
-            'final_q7': inputs.get('final_q7'),
-            'final_q8': inputs.get('final_q8'),
-            'final_q9': inputs.get('final_q9'),
-            'final_q10': inputs.get('final_q10'),
-            'nome_colaborador': inputs.get('nome_colaborador'),
-        })
+
+        prompt_inputs = self.get_prompt_inputs(inputs)
+        with track_llm_call(self.llm_config.model, 'ainvoke'):
+            response = await self.resilience.acall(
+                lambda: self.assistant.ainvoke(
+                    prompt_inputs, config=self._run_config()
+                ),
+                'ainvoke',
+            )
         return response
+
+    async def astream_assistant(self, inputs: dict) -> AsyncIterator[str]:
+        """
+        Runs the assistant and yields the response chunks as they are
+        produced by the language model.
+
+        Args:
+            inputs (dict): The input string to process.
+
+        Yields:
+            str: The response chunks.
+
+        Raises:
+            ValueError: If the assistant is not initialized.
+            LLMUnavailableError: If the LLM could not answer or the stream
+            was interrupted.
+        """
+        if not hasattr(self, 'assistant'):
+            raise ValueError('Assistant not initialized')
+
+        prompt_inputs = self.get_prompt_inputs(inputs)
+        with track_llm_call(self.llm_config.model, 'astream'):
+            async for chunk in self.resilience.astream(
+                lambda: self.assistant.astream(
+                    prompt_inputs, config=self._run_config()
+                ),
+                'astream',
+            ):
+                yield chunk
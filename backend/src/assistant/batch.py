@@ -0,0 +1,196 @@
+"""This module contains the batch generation of PDI messages, used to
+generate the PDIs of many collaborators at once."""
+
+import asyncio
+import dataclasses
+from typing import Any, Dict, List, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from src.assistant.assistant_config import IAgoAssistant
+from src.assistant.cache import GenerationCache, make_cache_key
+from src.assistant.pdi import PDIGenerationError, build_assistant_input
+from src.database.database import engine
+from src.database.models import IAMessageStore, User
+from src.database.queries import get_users_feedbacks
+from src.settings import get_settings
+
+
+@dataclasses.dataclass
+class BatchItem:
+    """
+    BatchItem holds the state of the generation of one collaborator PDI in
+    a batch.
+
+    Attributes:
+        user_id (int): The collaborator id.
+        status (str): 'generated', 'cached', 'failed' or 'pending'.
+        detail (str | None): The error message, if the generation failed.
+    """
+
+    user_id: int
+    status: str = 'pending'
+    detail: str | None = None
+    assistant_input: Dict[str, Any] | None = dataclasses.field(
+        default=None, repr=False
+    )
+    input_hash: str | None = dataclasses.field(default=None, repr=False)
+    message: str | None = dataclasses.field(default=None, repr=False)
+    is_stored: bool = dataclasses.field(default=False, repr=False)
+
+
+def load_batch(
+    session: Session,
+    IAgo: IAgoAssistant,
+    user_ids: Sequence[int] | None,
+    generation_cache: GenerationCache,
+    use_cache: bool = True,
+) -> List[BatchItem]:
+    """
+    Loads the users, their feedbacks and answers and the stored messages
+    with a fixed number of set-based queries, and builds the assistant
+    inputs of every collaborator.
+
+    Args:
+        session (Session): The database session.
+        IAgo (IAgoAssistant): The assistant used to build the cache keys.
+        user_ids (Sequence[int] | None): The collaborators to generate the
+        PDI for, or None for all collaborators.
+        generation_cache (GenerationCache): The generation cache.
+        use_cache (bool): Whether cached messages can be reused.
+
+    Returns:
+        List[BatchItem]: One item per requested user.
+    """
+    query = select(User)
+    if user_ids is None:
+        query = query.where(~User.is_leader)
+    else:
+        query = query.where(User.id.in_(user_ids))
+    users = {user.id: user for user in session.scalars(query)}
+
+    requested_ids = list(users) if user_ids is None else list(user_ids)
+    items = {user_id: BatchItem(user_id=user_id) for user_id in requested_ids}
+
+    feedbacks = get_users_feedbacks(session, users)
+
+    for item in items.values():
+        user = users.get(item.user_id)
+        if user is None:
+            item.status, item.detail = 'failed', 'User not found'
+            continue
+        if user.is_leader:
+            item.status, item.detail = 'failed', 'User is a leader'
+            continue
+        try:
+            auto, leader = feedbacks[user.id].auto, feedbacks[user.id].leader
+            item.assistant_input = build_assistant_input(
+                user,
+                auto.answers if auto else None,
+                leader.answers if leader else None,
+            )
+        except PDIGenerationError as e:
+            item.status, item.detail = 'failed', str(e)
+            continue
+        item.input_hash = make_cache_key(item.assistant_input, IAgo.llm_config)
+
+    pending = [item for item in items.values() if item.status == 'pending']
+    stored_messages = {
+        (message.user_id, message.input_hash): message.message
+        for message in session.scalars(
+            select(IAMessageStore).where(
+                IAMessageStore.user_id.in_([i.user_id for i in pending])
+                & IAMessageStore.input_hash.in_([
+                    i.input_hash for i in pending
+                ])
+            )
+        )
+    }
+    for item in pending:
+        stored = stored_messages.get((item.user_id, item.input_hash))
+        item.is_stored = stored is not None
+        if use_cache:
+            item.message = generation_cache.get_or_load(
+                item.input_hash,  # type: ignore
+                lambda stored=stored: stored,
+            )
+        if item.message is not None:
+            item.status = 'cached'
+
+    return list(items.values())
+
+
+def store_batch(session: Session, items: Sequence[BatchItem]):
+    """
+    Inserts every new message of the batch into the IAMessageStore in a
+    single transaction.
+    """
+    session.add_all([
+        IAMessageStore(
+            user_id=item.user_id,
+            message=item.message,  # type: ignore
+            score=0,  # type: ignore
+            input_hash=item.input_hash,
+        )
+        for item in items
+        if item.status in {'generated', 'cached'} and not item.is_stored
+    ])
+    session.commit()
+
+
+async def agenerate_batch(
+    IAgo: IAgoAssistant,
+    user_ids: Sequence[int] | None,
+    generation_cache: GenerationCache,
+    use_cache: bool = True,
+    concurrency: int | None = None,
+) -> List[BatchItem]:
+    """
+    Generates the PDI of many collaborators, fanning the LLM calls out with
+    bounded concurrency.
+
+    Args:
+        IAgo (IAgoAssistant): The assistant.
+        user_ids (Sequence[int] | None): The collaborators to generate the
+        PDI for, or None for all collaborators.
+        generation_cache (GenerationCache): The generation cache.
+        use_cache (bool): Whether cached messages can be reused.
+        concurrency (int | None): Maximum number of simultaneous LLM calls.
+
+    Returns:
+        List[BatchItem]: The status of each collaborator.
+    """
+    concurrency = concurrency or get_settings().IAGO_BATCH_CONCURRENCY
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def _load():
+        with Session(engine) as session:
+            return load_batch(
+                session, IAgo, user_ids, generation_cache, use_cache
+            )
+
+    def _store(items):
+        with Session(engine) as session:
+            store_batch(session, items)
+
+    items = await asyncio.to_thread(_load)
+
+    async def _generate(item: BatchItem):
+        async with semaphore:
+            try:
+                item.message = await IAgo.arun_assistant(
+                    item.assistant_input  # type: ignore
+                )
+            except Exception as e:
+                item.status, item.detail = 'failed', str(e)
+                return
+        generation_cache.set(item.input_hash, item.message)  # type: ignore
+        item.status = 'generated'
+
+    await asyncio.gather(*[
+        _generate(item) for item in items if item.status == 'pending'
+    ])
+
+    await asyncio.to_thread(_store, items)
+    return items
@@ -0,0 +1,173 @@
+"""This module contains the GenerationCache class, a content-addressed cache
+for the messages generated by the IAgo assistant."""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+from fastapi import Request
+
+from src.assistant.assistant_config import LLMConfig
+from src.settings import get_settings
+
+
+def make_cache_key(assistant_input: Dict[str, Any], llm_config: LLMConfig):
+    """
+    Builds a stable hash for a generation request.
+
+    Args:
+        assistant_input (Dict[str, Any]): The inputs sent to the prompt.
+        llm_config (LLMConfig): The system and user prompts, model,
+        temperature and question titles.
+
+    Returns:
+        str: The SHA-256 hex digest identifying the generation.
+    """
+    payload = json.dumps(
+        {
+            'inputs': assistant_input,
+            'sys_prompt': llm_config.sys_prompt,
+            'model': llm_config.model,
+            'temperature': llm_config.temperature,
+            'questions': llm_config.questions,
+            'user_prompt': llm_config.user_prompt,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class GenerationCache:
+    """
+    GenerationCache keeps generated messages in memory, keyed by the hash of
+    their inputs, with TTL and LRU eviction.
+
+    Attributes:
+        max_size (int): Maximum number of cached messages.
+        ttl_seconds (float): Time a message stays valid in the cache.
+        hits (int): Lookups answered from memory.
+        store_hits (int): Lookups answered from the message store.
+        misses (int): Lookups that required a new generation.
+
+    Methods:
+        get(key: str) -> str | None:
+            Returns the cached message, if present and not expired.
+
+        set(key: str, message: str):
+            Stores a message, evicting the least recently used one if full.
+
+        get_or_load(key: str, loader: Callable) -> str | None:
+            Looks up memory first and falls back to the given loader.
+
+        discard(key: str):
+            Removes a message, so the next lookup generates it again.
+
+        stats() -> Dict[str, Any]:
+            Returns the cache counters.
+    """
+
+    def __init__(
+        self,
+        max_size: int | None = None,
+        ttl_seconds: float | None = None,
+    ):
+        settings = get_settings()
+        self.max_size = max_size or settings.IAGO_CACHE_MAX_SIZE
+        self.ttl_seconds = ttl_seconds or settings.IAGO_CACHE_TTL_SECONDS
+        self._entries: OrderedDict[str, Tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    def _lookup(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, message = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return message
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            message = self._lookup(key)
+            if message is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return message
+
+    def set(self, key: str, message: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, message)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_load(
+        self, key: str, loader: Callable[[], str | None]
+    ) -> str | None:
+        """
+        Returns the message for the given key, looking at memory first and
+        then at the loader (usually the message store).
+
+        Args:
+            key (str): The generation hash.
+            loader (Callable[[], str | None]): Fallback lookup.
+
+        Returns:
+            str | None: The cached message, or None on a miss.
+        """
+        with self._lock:
+            message = self._lookup(key)
+            if message is not None:
+                self.hits += 1
+                return message
+
+        message = loader()
+        with self._lock:
+            if message is None:
+                self.misses += 1
+                return None
+            self.store_hits += 1
+        self.set(key, message)
+        return message
+
+    def discard(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'store_hits': self.store_hits,
+                'misses': self.misses,
+            }
+
+
+def get_generation_cache(request: Request) -> GenerationCache:
+    """
+    FastAPI dependency that returns the cache created in the app lifespan.
+    A cache is created on demand if the lifespan did not run.
+    """
+    cache = getattr(request.app.state, 'generation_cache', None)
+    if cache is None:
+        cache = GenerationCache()
+        request.app.state.generation_cache = cache
+    return cache
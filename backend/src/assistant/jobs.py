@@ -0,0 +1,260 @@
+"""This module contains the background job queue used to generate PDI
+messages without holding a request worker while the LLM responds."""
+
+import abc
+import asyncio
+import dataclasses
+import enum
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict
+from zoneinfo import ZoneInfo
+
+from fastapi import Request
+
+from src.assistant.cache import GenerationCache
+from src.assistant.pdi import agenerate_message
+from src.assistant.registry import AssistantRegistry
+from src.settings import get_settings
+
+
+class JobStatus(str, enum.Enum):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+class JobQueueFullError(Exception):
+    """Raised when the job queue cannot accept more jobs."""
+
+
+@dataclasses.dataclass
+class GenerationJob:
+    """
+    GenerationJob holds the state of a PDI generation submitted to the
+    queue.
+
+    Attributes:
+        user_id (int): The collaborator the PDI is generated for.
+        use_cache (bool): Whether a cached message can be reused.
+        id (str): The job identifier returned to the client.
+        status (JobStatus): The current job status.
+        message (str | None): The generated message, once done.
+        error (str | None): The error message, if the job failed.
+    """
+
+    user_id: int
+    use_cache: bool = True
+    id: str = dataclasses.field(default_factory=lambda: uuid.uuid4().hex)
+    status: JobStatus = JobStatus.PENDING
+    message: str | None = None
+    error: str | None = None
+    created_at: datetime = dataclasses.field(
+        default_factory=lambda: datetime.now(tz=ZoneInfo('UTC'))
+    )
+    finished_at: datetime | None = None
+    done: asyncio.Event = dataclasses.field(
+        default_factory=asyncio.Event, repr=False
+    )
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in {JobStatus.PENDING, JobStatus.RUNNING}
+
+
+JobHandler = Callable[[GenerationJob], Awaitable[None]]
+
+
+class JobBackend(abc.ABC):
+    """
+    JobBackend defines where submitted jobs wait and which workers execute
+    them. A backend backed by an external broker can be plugged in to run
+    the jobs in a separate worker process.
+    """
+
+    @abc.abstractmethod
+    async def start(self, handler: JobHandler): ...
+
+    @abc.abstractmethod
+    async def stop(self): ...
+
+    @abc.abstractmethod
+    def enqueue(self, job: GenerationJob):
+        """
+        Raises:
+            JobQueueFullError: If the job cannot be accepted.
+        """
+
+    @abc.abstractmethod
+    def queue_size(self) -> int: ...
+
+
+class InProcessJobBackend(JobBackend):
+    """
+    InProcessJobBackend runs the jobs in the application event loop, using
+    a bounded asyncio queue consumed by a fixed number of worker tasks.
+
+    The queue and the job status live in the memory of a single process, so
+    this backend requires the API to run with one worker: with more, a job
+    submitted to one worker is unknown to the others.
+    """
+
+    def __init__(self, concurrency: int, max_queue_size: int):
+        self.concurrency = concurrency
+        self._queue: asyncio.Queue[GenerationJob] = asyncio.Queue(
+            maxsize=max_queue_size
+        )
+        self._workers: list[asyncio.Task] = []
+
+    async def _worker(self, handler: JobHandler):
+        while True:
+            job = await self._queue.get()
+            try:
+                await handler(job)
+            finally:
+                self._queue.task_done()
+
+    async def start(self, handler: JobHandler):
+        self._workers = [
+            asyncio.create_task(self._worker(handler))
+            for _ in range(self.concurrency)
+        ]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def enqueue(self, job: GenerationJob):
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFullError('Generation queue is full')
+
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+
+JOB_BACKENDS: Dict[str, Callable[..., JobBackend]] = {
+    'inprocess': InProcessJobBackend,
+}
+
+
+class JobRunner:
+    """
+    JobRunner submits PDI generations to a JobBackend and keeps track of
+    their status, persisting the results into the IAMessageStore.
+
+    The job status and the per-user deduplication are kept in memory, so
+    they are only visible to the process that accepted the job. Run the API
+    with a single worker, or behind sticky sessions, while it is in use.
+
+    Methods:
+        submit(user_id: int, use_cache: bool) -> GenerationJob:
+            Queues a generation, reusing an active job of the same user.
+
+        get(job_id: str) -> GenerationJob | None:
+            Returns a job by its id.
+
+        wait(job: GenerationJob, timeout: float) -> GenerationJob:
+            Waits for a job to finish, up to the given timeout.
+    """
+
+    def __init__(
+        self,
+        assistant_registry: AssistantRegistry,
+        generation_cache: GenerationCache,
+        backend: JobBackend | None = None,
+    ):
+        settings = get_settings()
+        self.assistant_registry = assistant_registry
+        self.generation_cache = generation_cache
+        self.backend = backend or JOB_BACKENDS[settings.IAGO_JOB_BACKEND](
+            concurrency=settings.IAGO_JOB_CONCURRENCY,
+            max_queue_size=settings.IAGO_JOB_QUEUE_SIZE,
+        )
+        self.retention = settings.IAGO_JOB_RETENTION
+        self._jobs: OrderedDict[str, GenerationJob] = OrderedDict()
+        self._active_by_user: Dict[int, GenerationJob] = {}
+
+    async def start(self):
+        await self.backend.start(self._run)
+
+    async def stop(self):
+        await self.backend.stop()
+
+    def get(self, job_id: str) -> GenerationJob | None:
+        return self._jobs.get(job_id)
+
+    def get_active_job(self, user_id: int) -> GenerationJob | None:
+        return self._active_by_user.get(user_id)
+
+    def submit(self, user_id: int, use_cache: bool = True) -> GenerationJob:
+        """
+        Queues a PDI generation for the given user.
+
+        Raises:
+            JobQueueFullError: If the backend cannot accept more jobs.
+        """
+        active_job = self._active_by_user.get(user_id)
+        if active_job is not None:
+            return active_job
+
+        job = GenerationJob(user_id=user_id, use_cache=use_cache)
+        self.backend.enqueue(job)
+        self._jobs[job.id] = job
+        self._active_by_user[user_id] = job
+        self._prune()
+        return job
+
+    @staticmethod
+    async def wait(job: GenerationJob, timeout: float) -> GenerationJob:
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    async def _run(self, job: GenerationJob):
+        job.status = JobStatus.RUNNING
+        try:
+            IAgo = await asyncio.to_thread(
+                self.assistant_registry.get_assistant
+            )
+            job.message = await agenerate_message(
+                IAgo, job.user_id, self.generation_cache, job.use_cache
+            )
+            job.status = JobStatus.DONE
+        except Exception as e:
+            job.error = str(e)
+            job.status = JobStatus.FAILED
+        finally:
+            job.finished_at = datetime.now(tz=ZoneInfo('UTC'))
+            if self._active_by_user.get(job.user_id) is job:
+                del self._active_by_user[job.user_id]
+            job.done.set()
+
+    def _prune(self):
+        # Mantém apenas os jobs mais recentes já finalizados
+        finished = [
+            job_id for job_id, job in self._jobs.items() if not job.is_active
+        ]
+        for job_id in finished[: max(len(self._jobs) - self.retention, 0)]:
+            del self._jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {status.value: 0 for status in JobStatus}
+        for job in self._jobs.values():
+            counts[job.status.value] += 1
+        return {'queue_size': self.backend.queue_size(), **counts}
+
+
+def get_job_runner(request: Request) -> JobRunner:
+    """
+    FastAPI dependency that returns the job runner started in the app
+    lifespan.
+    """
+    return request.app.state.job_runner
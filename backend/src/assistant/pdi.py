@@ -0,0 +1,356 @@
+"""This module contains the steps used to generate a PDI message for a
+collaborator: loading the feedback inputs, looking up previously generated
+messages and storing new ones in the IAMessageStore."""
+
+import asyncio
+import dataclasses
+import logging
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src.assistant.assistant_config import IAgoAssistant
+from src.assistant.cache import GenerationCache, make_cache_key
+from src.database.database import SyncSessionAdapter, engine
+from src.database.models import FeedbackAnswer, IAMessageStore, User
+from src.database.queries import (
+    final_score as weighted_final_score,
+)
+from src.database.queries import (
+    get_user_feedbacks,
+)
+
+T = TypeVar('T')
+logger = logging.getLogger(__name__)
+
+
+class PDIGenerationError(ValueError):
+    """Raised when the PDI inputs cannot be built for a user."""
+
+
+def build_assistant_input(
+    user: User,
+    auto_feedback_answers: Sequence[FeedbackAnswer] | None,
+    leader_feedback_answers: Sequence[FeedbackAnswer] | None,
+) -> Dict[str, Any]:
+    """
+    Builds the inputs sent to the assistant prompt from the answers of the
+    auto and leader feedback: the collaborator name and, for every
+    question, both answers and explanations and the final score, ordered
+    by question number.
+
+    Args:
+        user (User): The collaborator to generate the PDI for.
+        auto_feedback_answers (Sequence[FeedbackAnswer] | None): The auto
+        feedback answers, None if the auto feedback does not exist.
+        leader_feedback_answers (Sequence[FeedbackAnswer] | None): The
+        leader feedback answers, None if the leader feedback does not exist.
+
+    Returns:
+        Dict[str, Any]: The assistant inputs.
+
+    Raises:
+        PDIGenerationError: If any of the feedbacks is missing or they do
+        not match.
+    """
+    if auto_feedback_answers is None:
+        raise PDIGenerationError('Feedback for this user does not exist')
+    if not auto_feedback_answers:
+        raise PDIGenerationError(
+            'Feedback answers for this user does not exist'
+        )
+    if leader_feedback_answers is None:
+        raise PDIGenerationError('Feedback for this user does not exist')
+
+    auto_answers = {af.question_number: af for af in auto_feedback_answers}
+    leader_answers = {lf.question_number: lf for lf in leader_feedback_answers}
+    if auto_answers.keys() != leader_answers.keys():
+        raise PDIGenerationError(
+            'Feedback answers for this user does not match'
+        )
+
+    answers = []
+    for question_number in sorted(auto_answers):
+        auto, leader = (
+            auto_answers[question_number],
+            leader_answers[question_number],
+        )
+        answers.append({
+            'question_number': question_number,
+            'auto_answer': auto.answer,
+            'auto_explanation': auto.explanation,
+            'leader_answer': leader.answer,
+            'leader_explanation': leader.explanation,
+            'final_score': weighted_final_score(auto.answer, leader.answer),
+        })
+    return {'collaborator_name': user.name, 'answers': answers}
+
+
+def load_assistant_input(session: Session, user: User) -> Dict[str, Any]:
+    """
+    Loads the auto and leader feedback of a collaborator and builds the
+    inputs sent to the assistant prompt.
+
+    Args:
+        session (Session): The database session.
+        user (User): The collaborator to generate the PDI for.
+
+    Returns:
+        Dict[str, Any]: The assistant inputs.
+
+    Raises:
+        PDIGenerationError: If any of the feedbacks is missing or they do
+        not match.
+    """
+    feedbacks = get_user_feedbacks(session, user.id)
+    auto_feedback, leader_feedback = feedbacks.auto, feedbacks.leader
+    logger.debug(
+        'Loaded PDI inputs',
+        extra={
+            'user_id': user.id,
+            'auto_feedback_id': auto_feedback.id if auto_feedback else None,
+            'leader_feedback_id': (
+                leader_feedback.id if leader_feedback else None
+            ),
+        },
+    )
+
+    return build_assistant_input(
+        user,
+        auto_feedback.answers if auto_feedback else None,
+        leader_feedback.answers if leader_feedback else None,
+    )
+
+
+def lookup_message(  # noqa: PLR0913, PLR0917
+    session: Session,
+    user_id: int,
+    input_hash: str,
+    generation_cache: GenerationCache,
+    use_cache: bool = True,
+) -> Tuple[str | None, IAMessageStore | None]:
+    """
+    Looks for a message already generated for the same inputs.
+
+    Returns:
+        Tuple[str | None, IAMessageStore | None]: The cached message (None
+        on a miss) and the message stored for this user with the same
+        inputs, if any.
+    """
+    stored_message = session.scalar(
+        select(IAMessageStore)
+        .where(
+            (IAMessageStore.user_id == user_id)
+            & (IAMessageStore.input_hash == input_hash)
+        )
+        .order_by(desc(IAMessageStore.id))
+        .limit(1)
+    )
+
+    message = None
+    if use_cache:
+        message = generation_cache.get_or_load(
+            input_hash,
+            lambda: stored_message.message if stored_message else None,
+        )
+    return message, stored_message
+
+
+def store_message(
+    session: Session, user_id: int, message: str, input_hash: str
+) -> str:
+    """
+    Inserts a generated message into the IAMessageStore.
+
+    Returns:
+        str: The stored message.
+    """
+    message_store = IAMessageStore(
+        user_id=user_id,
+        message=message,
+        score=0,  # type: ignore
+        input_hash=input_hash,
+    )
+    session.add(message_store)
+    session.commit()
+    session.refresh(message_store)
+    logger.info(
+        'PDI message stored',
+        extra={'user_id': user_id, 'message_id': message_store.id},
+    )
+    return message_store.message
+
+
+@dataclasses.dataclass
+class PreparedGeneration:
+    """
+    PreparedGeneration holds what is known about a generation before the
+    LLM is called.
+
+    Attributes:
+        assistant_input (Dict[str, Any]): The assistant inputs.
+        input_hash (str): The generation hash.
+        message (str | None): The cached message, None on a miss.
+        is_stored (bool): Whether the cached message is already saved for
+        this user.
+    """
+
+    assistant_input: Dict[str, Any]
+    input_hash: str
+    message: str | None
+    is_stored: bool
+
+
+def prepare_generation(  # noqa: PLR0913, PLR0917
+    session: Session,
+    IAgo: IAgoAssistant,
+    user_id: int,
+    generation_cache: GenerationCache,
+    use_cache: bool = True,
+) -> PreparedGeneration:
+    """
+    Loads the assistant inputs of a collaborator and looks up a cached
+    message, before the LLM is called.
+
+    Raises:
+        PDIGenerationError: If the user does not exist or the assistant
+        inputs cannot be built.
+    """
+    user = session.get(User, user_id)
+    if not user:
+        raise PDIGenerationError('User not found')
+    assistant_input = load_assistant_input(session, user)
+    input_hash = make_cache_key(assistant_input, IAgo.llm_config)
+    message, stored_message = lookup_message(
+        session, user_id, input_hash, generation_cache, use_cache
+    )
+    return PreparedGeneration(
+        assistant_input=assistant_input,
+        input_hash=input_hash,
+        message=message,
+        is_stored=stored_message is not None,
+    )
+
+
+async def _run_db(
+    session: AsyncSession | SyncSessionAdapter | None,
+    fn: Callable[..., T],
+    *args,
+) -> T:
+    """
+    Runs a sync database function on the request session, or in a worker
+    thread with its own session when there is no request session (jobs and
+    streamed responses outlive the request).
+    """
+    if session is not None:
+        return await session.run_sync(fn, *args)
+
+    def _call():
+        with Session(engine) as own_session:
+            return fn(own_session, *args)
+
+    return await asyncio.to_thread(_call)
+
+
+async def aprepare_generation(  # noqa: PLR0913, PLR0917
+    IAgo: IAgoAssistant,
+    user_id: int,
+    generation_cache: GenerationCache,
+    use_cache: bool = True,
+    session: AsyncSession | SyncSessionAdapter | None = None,
+) -> PreparedGeneration:
+    """
+    Async version of `prepare_generation`.
+
+    Raises:
+        PDIGenerationError: If the user does not exist or the assistant
+        inputs cannot be built.
+    """
+    return await _run_db(
+        session, prepare_generation, IAgo, user_id, generation_cache, use_cache
+    )
+
+
+async def astore_message(
+    user_id: int,
+    message: str,
+    input_hash: str,
+    session: AsyncSession | SyncSessionAdapter | None = None,
+) -> str:
+    """
+    Async version of `store_message`.
+    """
+    return await _run_db(session, store_message, user_id, message, input_hash)
+
+
+async def agenerate_message(  # noqa: PLR0913, PLR0917
+    IAgo: IAgoAssistant,
+    user_id: int,
+    generation_cache: GenerationCache,
+    use_cache: bool = True,
+    session: AsyncSession | SyncSessionAdapter | None = None,
+) -> str:
+    """
+    Returns the PDI message of a collaborator, reusing a previously
+    generated one when the same inputs were already sent to the LLM.
+    Database work runs on the given session or in a worker thread, and the
+    LLM is awaited without holding a thread or a connection.
+
+    Raises:
+        PDIGenerationError: If the user does not exist or the assistant
+        inputs cannot be built.
+    """
+    prepared = await aprepare_generation(
+        IAgo, user_id, generation_cache, use_cache, session
+    )
+
+    message = prepared.message
+    if message is None:
+        message = await IAgo.arun_assistant(prepared.assistant_input)
+        generation_cache.set(prepared.input_hash, message)
+    elif prepared.is_stored:
+        return message
+
+    return await astore_message(user_id, message, prepared.input_hash, session)
+
+
+async def astream_message(
+    IAgo: IAgoAssistant,
+    prepared: PreparedGeneration,
+    user_id: int,
+    generation_cache: GenerationCache,
+) -> AsyncIterator[str]:
+    """
+    Streams the PDI message as the LLM produces it. The full message is
+    cached and stored in the IAMessageStore once the stream ends; an
+    interrupted stream is not stored.
+
+    Yields:
+        str: The message chunks.
+    """
+    if prepared.message is not None:
+        yield prepared.message
+        if not prepared.is_stored:
+            await astore_message(
+                user_id, prepared.message, prepared.input_hash
+            )
+        return
+
+    chunks = []
+    async for chunk in IAgo.astream_assistant(prepared.assistant_input):
+        chunks.append(chunk)
+        yield chunk
+
+    message = ''.join(chunks)
+    generation_cache.set(prepared.input_hash, message)
+    await astore_message(user_id, message, prepared.input_hash)
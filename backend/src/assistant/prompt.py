@@ -0,0 +1,236 @@
+"""This module renders the feedback answers of a collaborator into the
+variables of the assistant prompt.
+
+The answers of every question are sent as a single compact table, with
+one row per question, instead of one prompt variable per answer. The
+question titles come from the `questions` list of the assistant
+configuration, so the question set can change without code edits.
+
+The prompt is kept within a token budget by truncating the longest
+explanations. Tokens are estimated locally from the text length, so the
+budget needs no call to the provider and is deterministic."""
+
+import dataclasses
+import math
+from typing import Any, Dict, List, Sequence, Tuple
+
+# Média aproximada para texto em português nos tokenizadores dos LLMs
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARK = ' [...]'
+EXPLANATION_FIELDS = ('auto_explanation', 'leader_explanation')
+
+EVALUATION_HEADER = (
+    '| Critério | Nota auto | Justificativa auto | Nota gestor '
+    '| Justificativa gestor | Pontuação final |'
+)
+
+
+def question_title(questions: Sequence[str], question_number: int) -> str:
+    """
+    Returns the title of a question, numbered from 1, or a generic title
+    for questions missing from the configuration.
+    """
+    if 1 <= question_number <= len(questions):
+        return f'{question_number}. {questions[question_number - 1]}'
+    return f'{question_number}. Pergunta {question_number}'
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return f'{value:.2f}'.rstrip('0').rstrip('.')
+    # Quebras de linha e barras quebrariam a linha da tabela
+    return ' '.join(str(value).split()).replace('|', '/')
+
+
+def render_evaluation(
+    questions: Sequence[str], answers: Sequence[Dict[str, Any]]
+) -> str:
+    """
+    Renders the answers as a markdown table, one row per question.
+
+    Args:
+        questions (Sequence[str]): The question titles, in order.
+        answers (Sequence[Dict[str, Any]]): The `answers` of the assistant
+        input.
+
+    Returns:
+        str: The evaluation table.
+    """
+    rows = [EVALUATION_HEADER, '|---|---|---|---|---|---|']
+    for answer in sorted(answers, key=lambda a: a['question_number']):
+        cells = [
+            question_title(questions, answer['question_number']),
+            answer['auto_answer'],
+            answer['auto_explanation'],
+            answer['leader_answer'],
+            answer['leader_explanation'],
+            answer['final_score'],
+        ]
+        rows.append('| ' + ' | '.join(_cell(cell) for cell in cells) + ' |')
+    return '\n'.join(rows)
+
+
+def build_prompt_inputs(
+    questions: Sequence[str], assistant_input: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Maps an assistant input to the variables expected by the prompt.
+
+    Args:
+        questions (Sequence[str]): The question titles, in order.
+        assistant_input (Dict[str, Any]): The input built from the feedback
+        answers.
+
+    Returns:
+        Dict[str, Any]: The prompt variables.
+    """
+    return {
+        'nome_colaborador': assistant_input.get('collaborator_name'),
+        'avaliacao': render_evaluation(
+            questions, assistant_input.get('answers', [])
+        ),
+    }
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimates the number of tokens of a text from its length."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """
+    Truncates a text to about `max_tokens` tokens, at a word boundary, and
+    marks the cut.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    kept = text[: max(max_chars - len(TRUNCATION_MARK), 0)]
+    if ' ' in kept:
+        kept = kept.rsplit(' ', 1)[0]
+    return kept.rstrip() + TRUNCATION_MARK
+
+
+def fair_share(sizes: Sequence[int], budget: int) -> int | None:
+    """
+    Returns the largest size limit that makes the sizes fit in the budget,
+    so only the largest items are cut and all of them to the same size.
+
+    Returns:
+        int | None: The limit, or None if everything already fits.
+    """
+    if sum(sizes) <= budget:
+        return None
+    remaining, count = budget, len(sizes)
+    for size in sorted(sizes):
+        share = remaining // count
+        if size > share:
+            return share
+        remaining -= size
+        count -= 1
+    return remaining
+
+
+@dataclasses.dataclass
+class PromptTokens:
+    """
+    PromptTokens is the token estimate of a prompt.
+
+    Attributes:
+        original (int): Tokens before the budget was applied.
+        final (int): Tokens sent to the LLM.
+        truncated (int): Number of explanations truncated.
+        fixed (int): Tokens of the templates, the table and the scores,
+        which are never truncated.
+    """
+
+    original: int
+    final: int
+    truncated: int
+    fixed: int = 0
+
+
+def apply_token_budget(
+    template_tokens: int,
+    questions: Sequence[str],
+    assistant_input: Dict[str, Any],
+    budget: int,
+) -> Tuple[Dict[str, Any], PromptTokens]:
+    """
+    Truncates the longest explanations of an assistant input so the prompt
+    fits in the token budget. The template, the table and the scores are
+    always kept; the remaining budget is shared by the explanations. If
+    the fixed part alone does not fit, the budget is too small to be met
+    and nothing is truncated.
+
+    Args:
+        template_tokens (int): The tokens of the prompt templates, without
+        the variables.
+        questions (Sequence[str]): The question titles, in order.
+        assistant_input (Dict[str, Any]): The input built from the feedback
+        answers.
+        budget (int): The maximum prompt tokens; 0 disables the budget.
+
+    Returns:
+        Tuple[Dict[str, Any], PromptTokens]: The input to send, a copy when
+        something was truncated, and its token estimate.
+    """
+    answers: List[Dict[str, Any]] = assistant_input.get('answers', [])
+    without_explanations = [
+        {**answer, **dict.fromkeys(EXPLANATION_FIELDS)} for answer in answers
+    ]
+    fixed_tokens = template_tokens + estimate_tokens(
+        render_evaluation(questions, without_explanations)
+        + str(assistant_input.get('collaborator_name') or '')
+    )
+    explanations = [
+        ' '.join(str(answer[field]).split())
+        for answer in answers
+        for field in EXPLANATION_FIELDS
+        if answer.get(field)
+    ]
+    sizes = [estimate_tokens(text) for text in explanations]
+    original = fixed_tokens + sum(sizes)
+
+    # Sem espaço para as justificativas, cortá-las todas não cumpriria o
+    # orçamento e tiraria o conteúdo do PDI
+    limit = (
+        fair_share(sizes, budget - fixed_tokens)
+        if budget and fixed_tokens < budget
+        else None
+    )
+    if limit is None:
+        return assistant_input, PromptTokens(
+            original, original, 0, fixed_tokens
+        )
+
+    truncated_answers = [
+        {
+            **answer,
+            **{
+                field: truncate_text(
+                    ' '.join(str(answer[field]).split()), limit
+                )
+                for field in EXPLANATION_FIELDS
+                if answer.get(field)
+            },
+        }
+        for answer in answers
+    ]
+    final_sizes = [
+        estimate_tokens(answer[field])
+        for answer in truncated_answers
+        for field in EXPLANATION_FIELDS
+        if answer.get(field)
+    ]
+    return (
+        {**assistant_input, 'answers': truncated_answers},
+        PromptTokens(
+            original=original,
+            final=fixed_tokens + sum(final_sizes),
+            truncated=sum(size > limit for size in sizes),
+            fixed=fixed_tokens,
+        ),
+    )
@@ -0,0 +1,358 @@
+"""This module contains the registry of the language model providers used
+by the IAgo assistant, chosen from the `model` field of the assistant
+configuration, and a local fake model for load tests.
+
+The fake model answers without network access, with a deterministic text
+and a configurable latency and token rate, so the overhead of the API and
+its behaviour under concurrency can be measured offline."""
+
+import asyncio
+import hashlib
+import random
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    TypeVar,
+)
+
+from langchain.chat_models.base import BaseChatModel
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    SystemMessage,
+)
+from langchain_core.messages.ai import UsageMetadata
+from langchain_core.outputs import (
+    ChatGeneration,
+    ChatGenerationChunk,
+    ChatResult,
+)
+from langchain_google_genai import ChatGoogleGenerativeAI
+from pydantic import PrivateAttr
+
+from src.settings import get_settings
+
+T = TypeVar('T')
+ProviderFactory = Callable[..., BaseChatModel]
+ContextCacheFactory = Callable[[BaseChatModel, str, int], BaseChatModel]
+
+# Prefixo do nome do modelo -> função que cria o cliente
+_PROVIDERS: Dict[str, ProviderFactory] = {}
+# Prefixo do nome do modelo -> função que guarda o prompt de sistema no
+# provedor
+_CONTEXT_CACHES: Dict[str, ContextCacheFactory] = {}
+
+_FAKE_WORDS = (
+    'desenvolvimento comunicação liderança feedback objetivo meta '
+    'colaborador equipe entrega qualidade autonomia aprendizado '
+    'planejamento prioridade resultado evolução ponto forte melhoria '
+    'curso mentoria prazo acompanhamento'
+).split()
+
+
+def register_provider(prefix: str):
+    """
+    Registers a provider factory for the models whose name starts with the
+    given prefix. The factory receives the model name, the temperature and
+    the `model_options` of the configuration as keyword arguments.
+
+    Args:
+        prefix (str): The model name prefix, e.g. 'gemini'.
+    """
+
+    def decorator(factory: ProviderFactory) -> ProviderFactory:
+        _PROVIDERS[prefix] = factory
+        return factory
+
+    return decorator
+
+
+def register_context_cache(prefix: str):
+    """
+    Registers how the system prompt is cached on the provider for the
+    models whose name starts with the given prefix. The function receives
+    the chat model, the system prompt and the TTL in seconds, and returns a
+    chat model that uses the cached prompt, which is then left out of the
+    requests.
+
+    Args:
+        prefix (str): The model name prefix, e.g. 'gemini'.
+    """
+
+    def decorator(factory: ContextCacheFactory) -> ContextCacheFactory:
+        _CONTEXT_CACHES[prefix] = factory
+        return factory
+
+    return decorator
+
+
+def _match_prefix(registry: Dict[str, T], model: str) -> T | None:
+    name = model.rsplit('/', 1)[-1]
+    prefixes = [prefix for prefix in registry if name.startswith(prefix)]
+    return registry[max(prefixes, key=len)] if prefixes else None
+
+
+def get_provider(model: str) -> ProviderFactory:
+    """
+    Returns the factory of the provider of a model. The longest matching
+    prefix wins; a path before the name, as in 'models/gemini-1.5-pro',
+    is ignored.
+
+    Raises:
+        ValueError: If no provider supports the model.
+    """
+    provider = _match_prefix(_PROVIDERS, model)
+    if provider is None:
+        raise ValueError(f'Invalid LLM model: {model}, or not supported')
+    return provider
+
+
+def get_context_cache(model: str) -> ContextCacheFactory | None:
+    """
+    Returns how the system prompt is cached on the provider of a model, or
+    None if the provider has no context caching.
+    """
+    return _match_prefix(_CONTEXT_CACHES, model)
+
+
+def create_llm(
+    model: str, temperature: float, options: Dict[str, Any] | None = None
+) -> BaseChatModel:
+    """
+    Creates the chat model client of the provider of a model.
+
+    Args:
+        model (str): The model name from the assistant configuration.
+        temperature (float): The sampling temperature.
+        options (Dict[str, Any] | None): Provider specific options.
+
+    Returns:
+        BaseChatModel: The chat model client.
+
+    Raises:
+        ValueError: If no provider supports the model.
+    """
+    return get_provider(model)(
+        model=model, temperature=temperature, **(options or {})
+    )
+
+
+@register_provider('gemini')
+def create_gemini(
+    model: str, temperature: float, **options: Any
+) -> BaseChatModel:
+    return ChatGoogleGenerativeAI(
+        model=model,
+        temperature=temperature,
+        api_key=get_settings().GOOGLE_API_KEY,  # type: ignore
+        **options,
+    )
+
+
+@register_context_cache('gemini')
+def cache_gemini_context(
+    llm: BaseChatModel, system_prompt: str, ttl_seconds: int
+) -> BaseChatModel:
+    # O conteúdo em cache substitui a system instruction, que não pode ser
+    # enviada junto com ele
+    name = llm.create_cached_content(  # type: ignore
+        [SystemMessage(content=system_prompt)],
+        display_name='iago-system-prompt',
+        ttl=ttl_seconds,
+    )
+    return llm.model_copy(update={'cached_content': name})
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    FakeChatModel is a local chat model for load tests and benchmarks. The
+    response is built from a hash of the prompt, so the same prompt always
+    gets the same answer, and is produced at a fixed token rate.
+
+    Attributes:
+        model (str): The configured model name.
+        latency_ms (float): Time before the first token.
+        tokens_per_second (float): Output rate; 0 returns at once.
+        response_tokens (int): Number of words in every response.
+        cached_context (str | None): System prompt held in the fake
+        context cache, prepended to every request.
+        error_rate (float): Share of the requests that fail with a
+        ConnectionError before the first token.
+        latency_jitter_ms (float): Maximum random latency added before the
+        first token.
+        seed (int | None): Seed of the failures and of the jitter.
+    """
+
+    model: str = 'fake'
+    latency_ms: float = 200
+    tokens_per_second: float = 50
+    response_tokens: int = 200
+    cached_context: str | None = None
+    error_rate: float = 0
+    latency_jitter_ms: float = 0
+    seed: int | None = None
+
+    _rng: random.Random = PrivateAttr()
+
+    def model_post_init(self, __context: Any):
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return 'fake'
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {
+            'model': self.model,
+            'latency_ms': self.latency_ms,
+            'tokens_per_second': self.tokens_per_second,
+            'response_tokens': self.response_tokens,
+            'error_rate': self.error_rate,
+            'latency_jitter_ms': self.latency_jitter_ms,
+        }
+
+    def _contents(self, messages: List[BaseMessage]) -> List[str]:
+        contents = [str(message.content) for message in messages]
+        if self.cached_context is not None:
+            contents.insert(0, self.cached_context)
+        return contents
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        prompt = '\n'.join(self._contents(messages))
+        seed = hashlib.sha256(prompt.encode('utf-8')).digest()
+        rng = random.Random(seed)
+        words = rng.choices(_FAKE_WORDS, k=self.response_tokens)
+        return [words[0], *(f' {word}' for word in words[1:])]
+
+    def _usage(
+        self, messages: List[BaseMessage], output_tokens: int
+    ) -> UsageMetadata:
+        # Aproximação: uma palavra por token
+        input_tokens = sum(
+            len(content.split()) for content in self._contents(messages)
+        )
+        usage = UsageMetadata(
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            total_tokens=input_tokens + output_tokens,
+        )
+        if self.cached_context is not None:
+            usage['input_token_details'] = {
+                'cache_read': len(self.cached_context.split())
+            }
+        return usage
+
+    def _token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second else 0
+
+    def _first_token_delay(self) -> float:
+        """
+        Returns the latency of a request, or raises the injected failure.
+
+        Raises:
+            ConnectionError: For a share `error_rate` of the requests.
+        """
+        if self.error_rate and self._rng.random() < self.error_rate:
+            raise ConnectionError('Fake provider unavailable')
+        jitter = self._rng.uniform(0, self.latency_jitter_ms)
+        return (self.latency_ms + jitter) / 1000
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: List[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._tokens(messages)
+        time.sleep(
+            self._first_token_delay() + len(tokens) * self._token_delay()
+        )
+        message = AIMessage(
+            content=''.join(tokens),
+            usage_metadata=self._usage(messages, len(tokens)),
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: List[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._tokens(messages)
+        await asyncio.sleep(
+            self._first_token_delay() + len(tokens) * self._token_delay()
+        )
+        message = AIMessage(
+            content=''.join(tokens),
+            usage_metadata=self._usage(messages, len(tokens)),
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: List[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        tokens = self._tokens(messages)
+        time.sleep(self._first_token_delay())
+        for token in tokens:
+            time.sleep(self._token_delay())
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content='', usage_metadata=self._usage(messages, len(tokens))
+            )
+        )
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: List[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self._first_token_delay())
+        for token in tokens:
+            await asyncio.sleep(self._token_delay())
+            if run_manager:
+                await run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content='', usage_metadata=self._usage(messages, len(tokens))
+            )
+        )
+
+
+@register_provider('fake')
+def create_fake(
+    model: str, temperature: float, **options: Any
+) -> BaseChatModel:
+    # A temperatura é ignorada: a resposta depende apenas do prompt
+    return FakeChatModel(model=model, **options)
+
+
+@register_context_cache('fake')
+def cache_fake_context(
+    llm: BaseChatModel, system_prompt: str, ttl_seconds: int
+) -> BaseChatModel:
+    return llm.model_copy(update={'cached_context': system_prompt})
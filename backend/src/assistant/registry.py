@@ -0,0 +1,124 @@
+"""This module contains the AssistantRegistry class, which keeps a single,
+ready-to-use IAgoAssistant for the whole process."""
+
+import os
+import threading
+from typing import Tuple
+
+from fastapi import Request
+
+from src.assistant.assistant_config import IAgoAssistant
+from src.settings import get_settings
+
+
+class AssistantRegistry:
+    """
+    AssistantRegistry holds a warm IAgoAssistant (configs, LLM client and
+    prompt chain already built) and hands it out to every request.
+
+    The assistant is only rebuilt when the YAML configuration changes on
+    disk, which is detected through the files modification time and size,
+    or when the provider cache of its system prompt is about to expire.
+
+    Attributes:
+        config_path (str): Path to the assistant YAML file or directory.
+
+    Methods:
+        get_assistant() -> IAgoAssistant:
+            Returns the prepared assistant, rebuilding it if the config
+            changed since the last build.
+
+        reload() -> IAgoAssistant:
+            Forces the assistant to be rebuilt.
+    """
+
+    def __init__(self, config_path: str | None = None):
+        self.config_path = config_path or get_settings().ASSISTANT_CONFIG_PATH
+        self._lock = threading.Lock()
+        self._assistant: IAgoAssistant | None = None
+        self._fingerprint: Tuple | None = None
+
+    def _config_fingerprint(self) -> Tuple:
+        """
+        Builds a cheap fingerprint of the configuration files, so changes
+        can be detected without re-reading and re-parsing the YAML.
+
+        Returns:
+            Tuple: (path, mtime_ns, size) for every YAML config file.
+        """
+        if os.path.isdir(self.config_path):
+            paths = sorted(
+                os.path.join(self.config_path, filename)
+                for filename in os.listdir(self.config_path)
+                if filename.endswith('.yaml')
+            )
+        else:
+            paths = [self.config_path]
+
+        fingerprint = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                fingerprint.append((path, None, None))
+            else:
+                fingerprint.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(fingerprint)
+
+    def _is_current(self, fingerprint: Tuple) -> bool:
+        assistant = self._assistant
+        return (
+            assistant is not None
+            and fingerprint == self._fingerprint
+            and not assistant.context_cache_expired()
+        )
+
+    def _build(self, fingerprint: Tuple) -> IAgoAssistant:
+        assistant = IAgoAssistant(self.config_path)
+        assistant.get_assistant()
+        self._assistant = assistant
+        self._fingerprint = fingerprint
+        return assistant
+
+    def get_assistant(self) -> IAgoAssistant:
+        """
+        Returns the prepared assistant, rebuilding it only when the
+        configuration files changed or its context cache expired.
+
+        Returns:
+            IAgoAssistant: An assistant with its chain already initialized.
+
+        Raises:
+            ValueError: If the configuration is invalid or the model is not
+            supported.
+        """
+        fingerprint = self._config_fingerprint()
+        if self._is_current(fingerprint):
+            return self._assistant  # type: ignore
+
+        with self._lock:
+            if self._is_current(fingerprint):
+                return self._assistant  # type: ignore
+            return self._build(fingerprint)
+
+    def reload(self) -> IAgoAssistant:
+        """
+        Forces the assistant to be rebuilt from the configuration files.
+
+        Returns:
+            IAgoAssistant: The newly built assistant.
+        """
+        with self._lock:
+            return self._build(self._config_fingerprint())
+
+
+def get_assistant_registry(request: Request) -> AssistantRegistry:
+    """
+    FastAPI dependency that returns the registry created in the app
+    lifespan. A registry is created on demand if the lifespan did not run.
+    """
+    registry = getattr(request.app.state, 'assistant_registry', None)
+    if registry is None:
+        registry = AssistantRegistry()
+        request.app.state.assistant_registry = registry
+    return registry
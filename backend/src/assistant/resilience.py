@@ -0,0 +1,440 @@
+"""This module contains the resilience policy of the LLM calls: a deadline
+per call, retries with exponential backoff on transient errors, a circuit
+breaker that fails fast while the provider is down, a cap on concurrent
+calls and optional hedged requests for the slowest calls.
+
+Every step is exported on /metrics, and the policy can be exercised
+offline with the fake provider (`error_rate` and `latency_jitter_ms`
+model options)."""
+
+import asyncio
+import contextlib
+import enum
+import logging
+import random
+import threading
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Tuple,
+    Type,
+    TypeVar,
+)
+
+from src.instrumentation import (
+    LLM_CIRCUIT_REJECTIONS,
+    LLM_CIRCUIT_STATE,
+    LLM_HEDGES,
+    LLM_IN_FLIGHT,
+    LLM_RETRIES,
+    LLM_TIMEOUTS,
+)
+from src.settings import Settings, get_settings
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:  # pragma: no cover
+    google_exceptions = None
+
+T = TypeVar('T')
+logger = logging.getLogger(__name__)
+
+# Erros em que uma nova tentativa pode dar certo
+TRANSIENT_ERRORS: Tuple[Type[Exception], ...] = (TimeoutError, ConnectionError)
+if google_exceptions is not None:
+    TRANSIENT_ERRORS += (
+        google_exceptions.TooManyRequests,
+        google_exceptions.InternalServerError,
+        google_exceptions.BadGateway,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.GatewayTimeout,
+        google_exceptions.DeadlineExceeded,
+    )
+
+
+class LLMUnavailableError(RuntimeError):
+    """
+    Raised when the LLM cannot answer: the circuit breaker is open, the
+    deadline passed or the transient errors outlasted the retries.
+    """
+
+
+class CircuitState(str, enum.Enum):
+    CLOSED = 'closed'  # chamadas liberadas
+    HALF_OPEN = 'half_open'  # uma chamada de teste liberada
+    OPEN = 'open'  # chamadas recusadas até o reset
+
+
+_STATE_VALUES = {
+    CircuitState.CLOSED: 0,
+    CircuitState.HALF_OPEN: 1,
+    CircuitState.OPEN: 2,
+}
+
+
+class CircuitBreaker:
+    """
+    CircuitBreaker opens after consecutive failed calls and rejects calls
+    until the reset time passes. Then a single probe call is let through:
+    its success closes the circuit and its failure opens it again. A call
+    fails once, after its retries, however many attempts it made.
+
+    Attributes:
+        failure_threshold (int): Consecutive failed calls that open the
+        circuit.
+        reset_seconds (float): Time the circuit stays open.
+        state (CircuitState): The current state.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def admit(self) -> Tuple[bool, bool]:
+        """
+        Decides whether a call may run.
+
+        Returns:
+            Tuple[bool, bool]: Whether the call is allowed and whether it is
+            the half open probe, which must be released when it ends.
+        """
+        with self._lock:
+            if self.state == CircuitState.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    return False, False
+                self.state = CircuitState.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == CircuitState.HALF_OPEN:
+                if self._probe_in_flight:
+                    return False, False
+                self._probe_in_flight = True
+                return True, True
+            return True, False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CircuitState.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if (
+                self.state == CircuitState.HALF_OPEN
+                or self._failures >= self.failure_threshold
+            ):
+                self.state = CircuitState.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def release_probe(self):
+        """Frees the probe slot of a call that ended without a result."""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+class ResilientLLM:
+    """
+    ResilientLLM runs the LLM calls of a model under the resilience policy
+    configured in the settings. Calls are given as functions that start a
+    new request, so they can be retried and hedged.
+
+    Attributes:
+        model (str): The model name, used in the metrics.
+        timeout_seconds (float): Deadline of a call, retries included.
+        max_retries (int): Retries after a transient error.
+        backoff_seconds (float): Base delay of the exponential backoff.
+        backoff_max_seconds (float): Maximum delay between retries.
+        hedge_after_seconds (float): Time after which a second, hedged
+        request is sent; 0 disables hedging.
+        max_concurrency (int): Calls running at the same time, per event
+        loop; the others wait, within their deadline.
+        breaker (CircuitBreaker): The circuit breaker of the model.
+    """
+
+    def __init__(self, model: str, settings: Settings | None = None):
+        settings = settings or get_settings()
+        self.model = model
+        self.timeout_seconds = settings.IAGO_LLM_TIMEOUT_SECONDS
+        self.max_retries = settings.IAGO_LLM_MAX_RETRIES
+        self.backoff_seconds = settings.IAGO_LLM_BACKOFF_SECONDS
+        self.backoff_max_seconds = settings.IAGO_LLM_BACKOFF_MAX_SECONDS
+        self.hedge_after_seconds = settings.IAGO_LLM_HEDGE_AFTER_SECONDS
+        self.max_concurrency = settings.IAGO_LLM_MAX_CONCURRENCY
+        self.breaker = CircuitBreaker(
+            settings.IAGO_LLM_CIRCUIT_FAILURES,
+            settings.IAGO_LLM_CIRCUIT_RESET_SECONDS,
+        )
+        self._semaphores: dict[asyncio.AbstractEventLoop, asyncio.Semaphore]
+        self._semaphores = {}
+        self._publish_state()
+
+    def _publish_state(self):
+        LLM_CIRCUIT_STATE.set(_STATE_VALUES[self.breaker.state], self.model)
+
+    def _admit(self) -> bool:
+        allowed, is_probe = self.breaker.admit()
+        self._publish_state()
+        if not allowed:
+            LLM_CIRCUIT_REJECTIONS.inc(self.model)
+            raise LLMUnavailableError('LLM circuit breaker is open')
+        return is_probe
+
+    def _record(self, success: bool):
+        if success:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        self._publish_state()
+
+    @staticmethod
+    def _remaining(deadline: float) -> float:
+        return max(deadline - time.monotonic(), 0)
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Um semáforo asyncio só pode ser usado no loop em que foi criado
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            self._semaphores = {
+                known: value
+                for known, value in self._semaphores.items()
+                if not known.is_closed()
+            }
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    @contextlib.asynccontextmanager
+    async def _slot(self, deadline: float, operation: str):
+        semaphore = self._semaphore()
+        try:
+            await asyncio.wait_for(
+                semaphore.acquire(), self._remaining(deadline)
+            )
+        except TimeoutError as e:
+            LLM_TIMEOUTS.inc(self.model, operation)
+            raise LLMUnavailableError('LLM concurrency limit reached') from e
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    async def _retry_or_raise(
+        self, error: Exception, attempt: int, deadline: float, operation: str
+    ) -> int:
+        """
+        Waits before the next attempt after a transient error. The call is
+        recorded as failed in the circuit breaker only when it gives up.
+
+        Returns:
+            int: The number of the next attempt.
+
+        Raises:
+            LLMUnavailableError: If no attempt is left before the deadline,
+            or the circuit was opened by other calls.
+        """
+        if isinstance(error, TimeoutError):
+            LLM_TIMEOUTS.inc(self.model, operation)
+
+        # Backoff exponencial com jitter completo
+        delay = random.uniform(
+            0,
+            min(self.backoff_max_seconds, self.backoff_seconds * 2**attempt),
+        )
+        if attempt >= self.max_retries or (
+            time.monotonic() + delay >= deadline
+        ):
+            self._record(success=False)
+            raise LLMUnavailableError(f'LLM call failed: {error!r}') from error
+        if self.breaker.state == CircuitState.OPEN:
+            self._record(success=False)
+            raise LLMUnavailableError('LLM circuit breaker is open') from error
+
+        LLM_RETRIES.inc(self.model, operation)
+        logger.warning(
+            'LLM call failed, retrying',
+            extra={
+                'model': self.model,
+                'operation': operation,
+                'attempt': attempt + 1,
+                'delay_seconds': round(delay, 3),
+                'error': repr(error),
+            },
+        )
+        await asyncio.sleep(delay)
+        return attempt + 1
+
+    async def _hedged(self, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs a call and, if it has not answered after
+        `hedge_after_seconds`, a second identical one. The first successful
+        answer wins and the other request is cancelled.
+        """
+        if not self.hedge_after_seconds:
+            return await call()
+
+        primary = asyncio.ensure_future(call())
+        done, _ = await asyncio.wait(
+            {primary}, timeout=self.hedge_after_seconds
+        )
+        if done:
+            return primary.result()
+
+        hedge = asyncio.ensure_future(call())
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                # As duas podem terminar juntas: um sucesso vale mais que
+                # o erro da outra
+                for task in done:
+                    if task.exception() is None:
+                        winner = 'primary' if task is primary else 'hedge'
+                        LLM_HEDGES.inc(self.model, winner)
+                        return task.result()
+            # Ambas falharam: o erro da requisição original é propagado
+            return primary.result()
+        finally:
+            for task in (primary, hedge):
+                task.cancel()
+
+    async def acall(
+        self, call: Callable[[], Awaitable[T]], operation: str
+    ) -> T:
+        """
+        Runs an LLM call under the resilience policy.
+
+        Args:
+            call (Callable[[], Awaitable[T]]): Starts a new request.
+            operation (str): The operation name, used in the metrics.
+
+        Returns:
+            T: The call result.
+
+        Raises:
+            LLMUnavailableError: If the circuit is open, the deadline passed
+            or every attempt failed with a transient error.
+        """
+        is_probe = self._admit()
+        deadline = time.monotonic() + self.timeout_seconds
+        LLM_IN_FLIGHT.inc(self.model)
+        try:
+            async with self._slot(deadline, operation):
+                attempt = 0
+                while True:
+                    try:
+                        result = await asyncio.wait_for(
+                            self._hedged(call), self._remaining(deadline)
+                        )
+                    except TRANSIENT_ERRORS as e:
+                        attempt = await self._retry_or_raise(
+                            e, attempt, deadline, operation
+                        )
+                        continue
+                    self._record(success=True)
+                    return result
+        finally:
+            if is_probe:
+                self.breaker.release_probe()
+            LLM_IN_FLIGHT.inc(self.model, amount=-1)
+
+    async def astream(
+        self, stream: Callable[[], AsyncIterator[T]], operation: str
+    ) -> AsyncIterator[T]:
+        """
+        Runs a streamed LLM call under the resilience policy. The deadline
+        and the retries apply until the first chunk arrives; after that the
+        chunks are already with the client, so an error ends the stream.
+        Streams are not hedged.
+
+        Args:
+            stream (Callable[[], AsyncIterator[T]]): Starts a new stream.
+            operation (str): The operation name, used in the metrics.
+
+        Yields:
+            T: The stream chunks.
+
+        Raises:
+            LLMUnavailableError: If the circuit is open, the first chunk did
+            not arrive before the deadline, every attempt failed with a
+            transient error or the stream was interrupted.
+        """
+        is_probe = self._admit()
+        deadline = time.monotonic() + self.timeout_seconds
+        iterator: AsyncIterator[T] | None = None
+        LLM_IN_FLIGHT.inc(self.model)
+        try:
+            async with self._slot(deadline, operation):
+                attempt = 0
+                while True:
+                    iterator = stream()
+                    try:
+                        first = await asyncio.wait_for(
+                            anext(iterator), self._remaining(deadline)
+                        )
+                    except StopAsyncIteration:
+                        self._record(success=True)
+                        return
+                    except TRANSIENT_ERRORS as e:
+                        await _aclose(iterator)
+                        attempt = await self._retry_or_raise(
+                            e, attempt, deadline, operation
+                        )
+                        continue
+                    break
+
+                yield first
+                try:
+                    async for chunk in iterator:
+                        yield chunk
+                except TRANSIENT_ERRORS as e:
+                    self._record(success=False)
+                    raise LLMUnavailableError(
+                        f'LLM stream interrupted: {e!r}'
+                    ) from e
+                self._record(success=True)
+        finally:
+            # Fecha o stream também quando o cliente desiste no meio
+            if iterator is not None:
+                await _aclose(iterator)
+            if is_probe:
+                self.breaker.release_probe()
+            LLM_IN_FLIGHT.inc(self.model, amount=-1)
+
+
+async def _aclose(iterator: AsyncIterator[Any]):
+    aclose = getattr(iterator, 'aclose', None)
+    if aclose is not None:
+        with contextlib.suppress(Exception):
+            await aclose()
+
+
+_CLIENTS: Dict[str, ResilientLLM] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_resilient_llm(model: str) -> ResilientLLM:
+    """
+    Returns the ResilientLLM of a model, shared by the whole process. The
+    assistant is rebuilt when its configuration changes or its context
+    cache expires; sharing the client keeps an open circuit open and a
+    single concurrency limit across the rebuilds.
+    """
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(model)
+        if client is None:
+            client = _CLIENTS[model] = ResilientLLM(model)
+        return client
@@ -0,0 +1,244 @@
+"""Command line entry point for the backend maintenance tasks.
+
+Usage:
+    python -m src.cli generate-pdis --all
+    python -m src.cli generate-pdis --user-id 1 --user-id 2 --no-cache
+    python -m src.cli import-users users.csv
+    python -m src.cli import-users leaders.jsonl --leaders
+    python -m src.cli rebuild-scores
+    python -m src.cli rebuild-analytics
+    python -m src.cli export feedback --format parquet -o feedback.parquet
+"""
+
+import argparse
+import asyncio
+import sys
+from collections import Counter
+
+from sqlalchemy.orm import Session
+
+from src.analytics import rebuild_question_stats
+from src.assistant.batch import agenerate_batch
+from src.assistant.cache import GenerationCache
+from src.assistant.registry import AssistantRegistry
+from src.database.database import engine
+from src.export import (
+    ExportDataset,
+    ExportError,
+    ExportFormat,
+    check_format,
+    stream_export,
+)
+from src.scoring import rebuild_final_scores
+from src.user_import import UserImportFormatError, detect_format, import_users
+
+
+def generate_pdis(args: argparse.Namespace) -> int:
+    IAgo = AssistantRegistry().get_assistant()
+    user_ids = None if args.all else args.user_ids
+
+    items = asyncio.run(
+        agenerate_batch(
+            IAgo,
+            user_ids,
+            GenerationCache(),
+            use_cache=not args.no_cache,
+            concurrency=args.concurrency,
+        )
+    )
+
+    for item in items:
+        detail = f' ({item.detail})' if item.detail else ''
+        print(f'{item.user_id}\t{item.status}{detail}')
+
+    totals = Counter(item.status for item in items)
+    print(', '.join(f'{status}: {count}' for status, count in totals.items()))
+    return 1 if totals.get('failed') else 0
+
+
+def import_users_file(args: argparse.Namespace) -> int:
+    try:
+        file_format = detect_format(args.path, args.format)
+    except UserImportFormatError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    with (
+        open(args.path, encoding='utf-8-sig', newline='') as stream,
+        Session(engine) as session,
+    ):
+        report = import_users(
+            session,
+            stream,
+            file_format,
+            is_leader=args.leaders,
+            batch_size=args.batch_size,
+            workers=args.workers,
+        )
+
+    for error in report.errors:
+        print(f'{error.row}\t{error.email or "-"}\t{error.detail}')
+    print(f'created: {report.created}, failed: {report.failed}')
+    return 1 if report.failed else 0
+
+
+def rebuild_scores(args: argparse.Namespace) -> int:
+    with Session(engine) as session:
+        total = rebuild_final_scores(session, batch_size=args.batch_size)
+    print(f'final scores: {total}')
+    return 0
+
+
+def rebuild_analytics(args: argparse.Namespace) -> int:
+    with Session(engine) as session:
+        if not args.skip_scores:
+            rebuild_final_scores(session)
+        total = rebuild_question_stats(session)
+    print(f'question stats: {total}')
+    return 0
+
+
+def export_dataset(args: argparse.Namespace) -> int:
+    file_format = ExportFormat(args.format)
+    try:
+        check_format(file_format)
+    except ExportError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    chunks = stream_export(
+        engine,
+        ExportDataset(args.dataset),
+        file_format,
+        chunk_size=args.chunk_size,
+    )
+    if args.output == '-':
+        for chunk in chunks:
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+        return 0
+
+    with open(args.output, 'wb') as output:
+        for chunk in chunks:
+            output.write(chunk)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m src.cli')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    pdis = subparsers.add_parser(
+        'generate-pdis', help='Generate the PDI of many collaborators.'
+    )
+    target = pdis.add_mutually_exclusive_group(required=True)
+    target.add_argument(
+        '--user-id',
+        dest='user_ids',
+        type=int,
+        action='append',
+        help='Collaborator id, can be repeated.',
+    )
+    target.add_argument(
+        '--all', action='store_true', help='Generate for all collaborators.'
+    )
+    pdis.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Always call the LLM, ignoring stored messages.',
+    )
+    pdis.add_argument(
+        '--concurrency',
+        type=int,
+        default=None,
+        help='Maximum number of simultaneous LLM calls.',
+    )
+    pdis.set_defaults(func=generate_pdis)
+
+    users = subparsers.add_parser(
+        'import-users', help='Import collaborators or leaders from a file.'
+    )
+    users.add_argument('path', help='CSV or JSONL file.')
+    users.add_argument(
+        '--format',
+        choices=['csv', 'jsonl'],
+        default=None,
+        help='File format, taken from the extension by default.',
+    )
+    users.add_argument(
+        '--leaders',
+        action='store_true',
+        help='Import rows without an is_leader column as leaders.',
+    )
+    users.add_argument(
+        '--batch-size',
+        type=int,
+        default=None,
+        help='Rows inserted per transaction.',
+    )
+    users.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='Number of password hashing threads.',
+    )
+    users.set_defaults(func=import_users_file)
+
+    scores = subparsers.add_parser(
+        'rebuild-scores', help='Recompute the final scores of everyone.'
+    )
+    scores.add_argument(
+        '--batch-size',
+        type=int,
+        default=None,
+        help='Collaborators computed per transaction.',
+    )
+    scores.set_defaults(func=rebuild_scores)
+
+    analytics = subparsers.add_parser(
+        'rebuild-analytics',
+        help='Recompute the final scores and the analytics rollups.',
+    )
+    analytics.add_argument(
+        '--skip-scores',
+        action='store_true',
+        help='Only recompute the rollups from the stored final scores.',
+    )
+    analytics.set_defaults(func=rebuild_analytics)
+
+    export = subparsers.add_parser(
+        'export', help='Export the feedback answers or the generated PDIs.'
+    )
+    export.add_argument(
+        'dataset', choices=[dataset.value for dataset in ExportDataset]
+    )
+    export.add_argument(
+        '--format',
+        choices=[file_format.value for file_format in ExportFormat],
+        default=ExportFormat.CSV.value,
+        help='File format, csv by default.',
+    )
+    export.add_argument(
+        '-o',
+        '--output',
+        default='-',
+        help='Output file, the standard output by default.',
+    )
+    export.add_argument(
+        '--chunk-size',
+        type=int,
+        default=None,
+        help='Rows fetched and written per chunk.',
+    )
+    export.set_defaults(func=export_dataset)
+
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,279 @@
-from sqlalchemy import create_engine
+import threading
+from typing import Any, Callable, Dict, Iterable, TypeVar
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Engine, create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine,
+)
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+
+from src.instrumentation import instrument_engine
+from src.settings import Settings, get_settings
+
+T = TypeVar('T')
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+class PoolMetrics:
+    """
+    PoolMetrics counts the connection pool events of an engine.
+
+    Attributes:
+        connects (int): Connections opened by the pool.
+        checkouts (int): Connections handed out to sessions.
+        checkins (int): Connections returned to the pool.
+        invalidations (int): Connections invalidated (e.g. failed pre-ping).
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+
+        event.listen(engine, 'connect', self._on('connects'))
+        event.listen(engine, 'checkout', self._on('checkouts'))
+        event.listen(engine, 'checkin', self._on('checkins'))
+        event.listen(engine, 'invalidate', self._on('invalidations'))
+
+    def _on(self, counter: str):
+        def listener(*args):
+            with self._lock:
+                setattr(self, counter, getattr(self, counter) + 1)
+
+        return listener
+
+    def stats(self) -> Dict[str, Any]:
+        pool = self.engine.pool
+        stats: Dict[str, Any] = {
+            'pool_class': type(pool).__name__,
+            'connects': self.connects,
+            'checkouts': self.checkouts,
+            'checkins': self.checkins,
+            'invalidations': self.invalidations,
+        }
+        if isinstance(pool, QueuePool):
+            stats.update({
+                'size': pool.size(),
+                'checked_in': pool.checkedin(),
+                'checked_out': pool.checkedout(),
+                'overflow': pool.overflow(),
+            })
+        return stats
+
+
+def _sqlite_pragmas(settings: Settings):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(
+            f'PRAGMA busy_timeout = {settings.DB_STATEMENT_TIMEOUT_MS}'
+        )
+        cursor.execute(f'PRAGMA journal_mode = {settings.DB_SQLITE_JOURNAL}')
+        cursor.execute(f'PRAGMA synchronous = {settings.DB_SQLITE_SYNC}')
+        cursor.close()
+
+    return set_pragmas
+
+
+def _engine_options(settings: Settings, is_async: bool = False):
+    url = make_url(settings.DATABASE_URL)
+    backend = url.get_backend_name()
+    in_memory = backend == 'sqlite' and url.database in {None, '', ':memory:'}
+
+    engine_kwargs: Dict[str, Any] = {
+        'pool_pre_ping': settings.DB_POOL_PRE_PING,
+    }
+    connect_args: Dict[str, Any] = {}
+
+    if not in_memory:
+        engine_kwargs.update({
+            'pool_size': settings.DB_POOL_SIZE,
+            'max_overflow': settings.DB_MAX_OVERFLOW,
+            'pool_timeout': settings.DB_POOL_TIMEOUT,
+            'pool_recycle': settings.DB_POOL_RECYCLE,
+        })
+
+    if backend == 'sqlite':
+        # As sessões são usadas pelas threads do threadpool do FastAPI
+        connect_args['check_same_thread'] = False
+        connect_args['timeout'] = settings.DB_STATEMENT_TIMEOUT_MS / 1000
+    elif backend == 'postgresql' and settings.DB_STATEMENT_TIMEOUT_MS:
+        if is_async:
+            connect_args['server_settings'] = {
+                'statement_timeout': str(settings.DB_STATEMENT_TIMEOUT_MS)
+            }
+        else:
+            connect_args['options'] = (
+                f'-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}'
+            )
+
+    if is_async:
+        url = url.set(drivername=ASYNC_DRIVERS.get(backend, url.drivername))
+
+    engine_kwargs['connect_args'] = connect_args
+    return url, backend, engine_kwargs
+
+
+def create_db_engine(settings: Settings | None = None) -> Engine:
+    """
+    Creates the application engine from the settings: pool size, overflow,
+    pre-ping and recycle for every backend, WAL mode and busy timeout on
+    SQLite, and a statement timeout on PostgreSQL.
+
+    Args:
+        settings (Settings | None): The settings to use, loaded from the
+        environment if not given.
+
+    Returns:
+        Engine: The configured engine.
+    """
+    settings = settings or get_settings()
+    url, backend, engine_kwargs = _engine_options(settings)
+    engine = create_engine(url, **engine_kwargs)
+
+    if backend == 'sqlite':
+        event.listen(engine, 'connect', _sqlite_pragmas(settings))
+
+    return engine
 
-from src.settings import Settings
 
-engine = create_engine(Settings().DATABASE_URL)  # type: ignore
+def create_async_db_engine(settings: Settings | None = None) -> AsyncEngine:
+    """
+    Creates the async engine, with the same pool and connection settings
+    as `create_db_engine`, using aiosqlite on SQLite and asyncpg on
+    PostgreSQL.
+
+    Args:
+        settings (Settings | None): The settings to use, loaded from the
+        environment if not given.
+
+    Returns:
+        AsyncEngine: The configured async engine.
+    """
+    settings = settings or get_settings()
+    url, backend, engine_kwargs = _engine_options(settings, is_async=True)
+    async_engine = create_async_engine(url, **engine_kwargs)
+
+    if backend == 'sqlite':
+        event.listen(
+            async_engine.sync_engine, 'connect', _sqlite_pragmas(settings)
+        )
+
+    return async_engine
+
+
+class SyncSessionAdapter:
+    """
+    SyncSessionAdapter exposes a sync Session with the AsyncSession
+    interface used by the routers, running every database call in the
+    FastAPI threadpool. It is used when ASYNC_DATABASE is disabled, so the
+    same async handlers run on the sync engine.
+
+    Attributes:
+        sync_session (Session): The wrapped session.
+    """
+
+    def __init__(self, sync_session: Session):
+        self.sync_session = sync_session
+
+    def add(self, instance: Any):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances: Iterable[Any]):
+        self.sync_session.add_all(instances)
+
+    async def delete(self, instance: Any):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def get(self, entity: Any, ident: Any, **kwargs):
+        return await run_in_threadpool(
+            self.sync_session.get, entity, ident, **kwargs
+        )
+
+    async def execute(self, statement: Any, params: Any = None, **kwargs):
+        return await run_in_threadpool(
+            self.sync_session.execute, statement, params, **kwargs
+        )
+
+    async def scalar(self, statement: Any, params: Any = None, **kwargs):
+        return await run_in_threadpool(
+            self.sync_session.scalar, statement, params, **kwargs
+        )
+
+    async def scalars(self, statement: Any, params: Any = None, **kwargs):
+        # Carrega as linhas na thread, como o AsyncSession faz
+        frozen = await run_in_threadpool(
+            lambda: self.sync_session.execute(
+                statement, params, **kwargs
+            ).freeze()
+        )
+        return frozen().scalars()
+
+    async def flush(self):
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def refresh(self, instance: Any):
+        await run_in_threadpool(self.sync_session.refresh, instance)
+
+    async def run_sync(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+
+engine = create_db_engine()
+pool_metrics = PoolMetrics(engine)
+instrument_engine(engine)
+
+async_engine = (
+    create_async_db_engine() if get_settings().ASYNC_DATABASE else None
+)
+async_pool_metrics = (
+    PoolMetrics(async_engine.sync_engine) if async_engine else None
+)
+if async_engine is not None:
+    instrument_engine(async_engine.sync_engine)
 
 
 def get_session():  # pragma: no cover
     with Session(engine) as session:
         yield session
+
+
+async def get_async_session():  # pragma: no cover
+    """
+    Yields the session used by the async routers: an AsyncSession on the
+    async engine, or the sync session wrapped in a `SyncSessionAdapter`
+    when ASYNC_DATABASE is disabled. Objects are not expired on commit, so
+    they can be read after the commit without lazy loading.
+    """
+    if async_engine is None:
+        session = SyncSessionAdapter(Session(engine, expire_on_commit=False))
+        try:
+            yield session
+        finally:
+            await session.close()
+        return
+
+    async with AsyncSession(
+        async_engine, expire_on_commit=False
+    ) as async_session:
+        yield async_session
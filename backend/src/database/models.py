@@ -1,7 +1,7 @@
 from datetime import datetime
 
-from sqlalchemy import CheckConstraint, ForeignKey, func
-from sqlalchemy.orm import Mapped, mapped_column, registry
+from sqlalchemy import CheckConstraint, ForeignKey, Index, func
+from sqlalchemy.orm import Mapped, mapped_column, registry, relationship
 
 table_registry = registry()
 
@@ -9,6 +9,11 @@ table_registry = registry()
 @table_registry.mapped_as_dataclass
 class User:
     __tablename__ = 'users'
+    __table_args__ = (
+        # Paginação por cursor da listagem de colaboradores, ordenada por
+        # (name, id)
+        Index('ix_users_is_leader_name_id', 'is_leader', 'name', 'id'),
+    )
     id: Mapped[int] = mapped_column(init=False, primary_key=True)
     name: Mapped[str]
     password: Mapped[str]
@@ -44,6 +49,15 @@ class User:
 @table_registry.mapped_as_dataclass
 class Feedback:
     __tablename__ = 'feedback'
+    # Cada usuário tem no máximo um auto-feedback e um feedback do líder
+    __table_args__ = (
+        Index(
+            'uq_feedback_user_id_auto_feedback',
+            'user_id',
+            'auto_feedback',
+            unique=True,
+        ),
+    )
     id: Mapped[int] = mapped_column(init=False, primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
     auto_feedback: Mapped[bool]
@@ -53,11 +67,25 @@ class Feedback:
     updated_at: Mapped[datetime] = mapped_column(
         init=False, server_default=func.now(), onupdate=func.now()
     )
+    answers: Mapped[list['FeedbackAnswer']] = relationship(
+        init=False,
+        repr=False,
+        back_populates='feedback',
+        order_by='FeedbackAnswer.question_number',
+    )
 
 
 @table_registry.mapped_as_dataclass
 class FeedbackAnswer:
     __tablename__ = 'feedback_answers'
+    __table_args__ = (
+        Index(
+            'uq_feedback_answers_feedback_id_question_number',
+            'feedback_id',
+            'question_number',
+            unique=True,
+        ),
+    )
     id: Mapped[int] = mapped_column(init=False, primary_key=True)
     feedback_id: Mapped[int] = mapped_column(ForeignKey('feedback.id'))
     question_number: Mapped[int]
@@ -71,15 +99,78 @@ class FeedbackAnswer:
     updated_at: Mapped[datetime] = mapped_column(
         init=False, server_default=func.now(), onupdate=func.now()
     )
+    feedback: Mapped[Feedback] = relationship(
+        init=False, repr=False, back_populates='answers'
+    )
+
+
+@table_registry.mapped_as_dataclass
+class FinalScore:
+    __tablename__ = 'final_scores'
+    # Pontuação final materializada de cada pergunta, recalculada quando as
+    # respostas do colaborador ou do líder mudam (ver src/scoring.py)
+    __table_args__ = (
+        Index(
+            'uq_final_scores_user_id_question_number',
+            'user_id',
+            'question_number',
+            unique=True,
+        ),
+    )
+    id: Mapped[int] = mapped_column(init=False, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
+    question_number: Mapped[int]
+    auto_answer: Mapped[int]
+    leader_answer: Mapped[int]
+    final_score: Mapped[float]
+    updated_at: Mapped[datetime] = mapped_column(
+        init=False, server_default=func.now(), onupdate=func.now()
+    )
+
+
+@table_registry.mapped_as_dataclass
+class QuestionStats:
+    __tablename__ = 'question_stats'
+    # Agregados por pergunta, atualizados de forma incremental (ver
+    # src/analytics.py). kind: 'auto', 'leader' ou 'final'
+    __table_args__ = (
+        Index(
+            'uq_question_stats_kind_question_number',
+            'kind',
+            'question_number',
+            unique=True,
+        ),
+    )
+    id: Mapped[int] = mapped_column(init=False, primary_key=True)
+    kind: Mapped[str]
+    question_number: Mapped[int]
+    count: Mapped[int] = mapped_column(default=0)
+    total: Mapped[float] = mapped_column(default=0.0)
+    # Histograma: quantidade de valores em cada faixa [n, n + 1)
+    count_1: Mapped[int] = mapped_column(default=0)
+    count_2: Mapped[int] = mapped_column(default=0)
+    count_3: Mapped[int] = mapped_column(default=0)
+    count_4: Mapped[int] = mapped_column(default=0)
+    count_5: Mapped[int] = mapped_column(default=0)
+    updated_at: Mapped[datetime] = mapped_column(
+        init=False, server_default=func.now(), onupdate=func.now()
+    )
 
 
 @table_registry.mapped_as_dataclass
 class IAMessageStore:
     __tablename__ = 'ia_message_store'
+    __table_args__ = (
+        Index(
+            'ix_ia_message_store_user_id_created_at', 'user_id', 'created_at'
+        ),
+    )
     id: Mapped[int] = mapped_column(init=False, primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
     message: Mapped[str]
     score: Mapped[bool]  # good or bad response
+    # hash dos inputs usados na geração (cache de mensagens)
+    input_hash: Mapped[str | None] = mapped_column(default=None, index=True)
     created_at: Mapped[datetime] = mapped_column(
         init=False, server_default=func.now()
     )
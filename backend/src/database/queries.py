@@ -0,0 +1,266 @@
+"""Shared data-access helpers used by the routers to load feedbacks with a
+fixed number of queries."""
+
+import dataclasses
+import enum
+from typing import Any, Dict, Iterable, Sequence
+
+from sqlalchemy import (
+    ColumnElement,
+    Float,
+    Numeric,
+    Select,
+    Subquery,
+    case,
+    cast,
+    exists,
+    func,
+    select,
+    tuple_,
+)
+from sqlalchemy.orm import Session, joinedload
+
+from src.database.models import (
+    Feedback,
+    FeedbackAnswer,
+    FinalScore,
+    IAMessageStore,
+    User,
+)
+
+
+@dataclasses.dataclass
+class UserFeedbacks:
+    """
+    UserFeedbacks holds the auto and leader feedback of a collaborator,
+    with their answers already loaded and ordered by question number.
+
+    Attributes:
+        auto (Feedback | None): The collaborator auto feedback.
+        leader (Feedback | None): The feedback given by the leader.
+    """
+
+    auto: Feedback | None = None
+    leader: Feedback | None = None
+
+
+def get_users_feedbacks(
+    session: Session, user_ids: Iterable[int]
+) -> Dict[int, UserFeedbacks]:
+    """
+    Loads the auto and leader feedback, with answers, of many users in a
+    single joined query.
+
+    Args:
+        session (Session): The database session.
+        user_ids (Iterable[int]): The users to load.
+
+    Returns:
+        Dict[int, UserFeedbacks]: The feedbacks of each requested user.
+    """
+    user_ids = list(user_ids)
+    feedbacks = {user_id: UserFeedbacks() for user_id in user_ids}
+    if not user_ids:
+        return feedbacks
+
+    for feedback in session.scalars(
+        select(Feedback)
+        .where(Feedback.user_id.in_(user_ids))
+        .options(joinedload(Feedback.answers))
+    ).unique():
+        if feedback.auto_feedback:
+            feedbacks[feedback.user_id].auto = feedback
+        else:
+            feedbacks[feedback.user_id].leader = feedback
+    return feedbacks
+
+
+def get_user_feedbacks(session: Session, user_id: int) -> UserFeedbacks:
+    """
+    Loads the auto and leader feedback, with answers, of a single user.
+
+    Args:
+        session (Session): The database session.
+        user_id (int): The user to load.
+
+    Returns:
+        UserFeedbacks: The user feedbacks.
+    """
+    return get_users_feedbacks(session, [user_id])[user_id]
+
+
+class FeedbackStatus(str, enum.Enum):
+    PENDING = 'pending'  # nenhum feedback
+    AUTO = 'auto'  # apenas o auto-feedback
+    LEADER = 'leader'  # apenas o feedback do líder
+    COMPLETE = 'complete'  # os dois feedbacks
+
+
+def _has_feedback(auto_feedback: bool):
+    return exists().where(
+        (Feedback.user_id == User.id)
+        & (Feedback.auto_feedback == auto_feedback)
+    )
+
+
+def collaborators_query(
+    name_prefix: str | None = None,
+    feedback_status: FeedbackStatus | None = None,
+) -> Select:
+    """
+    Builds the query of the collaborators matching the listing filters.
+
+    Args:
+        name_prefix (str | None): Only names starting with this prefix.
+        feedback_status (FeedbackStatus | None): Only collaborators with
+        this feedback status.
+
+    Returns:
+        Select: The query, without ordering or pagination.
+    """
+    query = select(User).where(~User.is_leader)
+    if name_prefix:
+        query = query.where(User.name.startswith(name_prefix, autoescape=True))
+
+    if feedback_status is not None:
+        has_auto, has_leader = _has_feedback(True), _has_feedback(False)
+        query = query.where(
+            {
+                FeedbackStatus.PENDING: ~has_auto & ~has_leader,
+                FeedbackStatus.AUTO: has_auto & ~has_leader,
+                FeedbackStatus.LEADER: ~has_auto & has_leader,
+                FeedbackStatus.COMPLETE: has_auto & has_leader,
+            }[feedback_status]
+        )
+    return query
+
+
+def collaborators_page(
+    query: Select, limit: int, after: Sequence[Any] | None = None
+) -> Select:
+    """
+    Orders the collaborators query by (name, id) and selects the page that
+    starts after the given key. One extra row is selected, so the caller
+    knows whether there is a next page.
+
+    Args:
+        query (Select): The collaborators query.
+        limit (int): The page size.
+        after (Sequence[Any] | None): The (name, id) of the last row of the
+        previous page.
+
+    Returns:
+        Select: The page query.
+    """
+    # Paginação por chave (name, id): cada página continua após a última
+    # linha da anterior, sem percorrer as linhas já lidas como o offset
+    query = query.order_by(User.name, User.id).limit(limit + 1)
+    if after is not None:
+        query = query.where(tuple_(User.name, User.id) > tuple_(*after))
+    return query
+
+
+FINAL_SCORE_DIGITS = 4
+
+
+def round_score(score):
+    """
+    Rounds a final score to `FINAL_SCORE_DIGITS` places. Works on numbers,
+    on pandas series and on SQL expressions.
+    """
+    if isinstance(score, ColumnElement):
+        # O PostgreSQL só arredonda com casas decimais valores NUMERIC
+        return func.round(
+            cast(score, Numeric), FINAL_SCORE_DIGITS, type_=Float
+        )
+    return round(score, FINAL_SCORE_DIGITS)
+
+
+def final_score(auto_answer, leader_answer):
+    """
+    Weighted final score of a question: 15% of the mean, 15% of the auto
+    feedback and 70% of the leader feedback, rounded by `round_score`.
+    Works on numbers, on pandas series and on SQL expressions.
+    """
+    mean = (auto_answer + leader_answer) * 0.5
+    # O arredondamento remove o erro de ponto flutuante (3 e 3 davam
+    # 2.9999999999999996), para que todos os caminhos guardem o mesmo valor
+    return round_score(
+        (mean * 0.15) + (auto_answer * 0.15) + (leader_answer * 0.7)
+    )
+
+
+def leader_dashboard_query(users: Subquery) -> Select:
+    """
+    Builds the dashboard query of a page of collaborators: one row per
+    collaborator and question, with the auto and leader answers, the final
+    score, whether each feedback exists and the PDI messages generated.
+
+    Everything is aggregated by the database in a single statement, which
+    only reads the messages of the page and the materialized final scores.
+    A feedback without answers yields a row with a null question number.
+
+    Args:
+        users (Subquery): The page of collaborators, with the `User`
+        columns.
+
+    Returns:
+        Select: The dashboard query, ordered like the page.
+    """
+    messages = (
+        select(
+            IAMessageStore.user_id,
+            func.count(IAMessageStore.id).label('pdi_count'),
+            func.max(IAMessageStore.created_at).label('pdi_last_created_at'),
+        )
+        # Só as mensagens da página, em vez de agrupar a tabela inteira
+        .where(IAMessageStore.user_id.in_(select(users.c.id)))
+        .group_by(IAMessageStore.user_id)
+        .subquery()
+    )
+    auto_answer = func.max(
+        case((Feedback.auto_feedback, FeedbackAnswer.answer))
+    )
+    leader_answer = func.max(
+        case((~Feedback.auto_feedback, FeedbackAnswer.answer))
+    )
+
+    return (
+        select(
+            users.c.id,
+            users.c.name,
+            users.c.email,
+            func.max(case((Feedback.auto_feedback, 1), else_=0)).label(
+                'has_auto_feedback'
+            ),
+            func.max(case((~Feedback.auto_feedback, 1), else_=0)).label(
+                'has_leader_feedback'
+            ),
+            FeedbackAnswer.question_number,
+            auto_answer.label('auto_answer'),
+            leader_answer.label('leader_answer'),
+            # Lida de final_scores; o arredondamento cobre linhas gravadas
+            # antes de final_score arredondar
+            round_score(func.max(FinalScore.final_score)).label('final_score'),
+            func.coalesce(messages.c.pdi_count, 0).label('pdi_count'),
+            messages.c.pdi_last_created_at,
+        )
+        .select_from(users)
+        .outerjoin(Feedback, Feedback.user_id == users.c.id)
+        .outerjoin(FeedbackAnswer, FeedbackAnswer.feedback_id == Feedback.id)
+        .outerjoin(
+            FinalScore,
+            (FinalScore.user_id == users.c.id)
+            & (FinalScore.question_number == FeedbackAnswer.question_number),
+        )
+        .outerjoin(messages, messages.c.user_id == users.c.id)
+        .group_by(
+            users.c.id,
+            users.c.name,
+            users.c.email,
+            FeedbackAnswer.question_number,
+            messages.c.pdi_count,
+            messages.c.pdi_last_created_at,
+        )
+        .order_by(users.c.name, users.c.id, FeedbackAnswer.question_number)
+    )
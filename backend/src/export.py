@@ -0,0 +1,202 @@
+"""This module contains the streaming export of the feedback answers and
+the generated PDIs as CSV or Parquet.
+
+Rows are read through a server-side cursor and encoded one chunk at a
+time, so memory use does not grow with the size of the export. Parquet
+needs the optional `pyarrow` package."""
+
+import csv
+import enum
+import io
+from datetime import datetime
+from typing import Any, Iterator, List, Sequence
+
+from sqlalchemy import Engine, Row, Select, select
+from sqlalchemy.engine import Connection
+
+from src.database.models import Feedback, FeedbackAnswer, IAMessageStore, User
+from src.settings import get_settings
+
+
+class ExportError(ValueError):
+    """Raised when an export cannot be produced."""
+
+
+class ExportDataset(str, enum.Enum):
+    FEEDBACK = 'feedback'  # feedbacks com as respostas, uma linha por resposta
+    PDIS = 'pdis'  # mensagens geradas pelo IAGO
+
+
+class ExportFormat(str, enum.Enum):
+    CSV = 'csv'
+    PARQUET = 'parquet'
+
+
+MEDIA_TYPES = {
+    ExportFormat.CSV: 'text/csv',
+    ExportFormat.PARQUET: 'application/vnd.apache.parquet',
+}
+
+
+def export_query(dataset: ExportDataset) -> Select:
+    """
+    Builds the query of a dataset, joined with the user data and ordered
+    so that exports are reproducible.
+    """
+    if dataset == ExportDataset.FEEDBACK:
+        return (
+            select(
+                User.id.label('user_id'),
+                User.name.label('user_name'),
+                User.email.label('user_email'),
+                Feedback.id.label('feedback_id'),
+                Feedback.auto_feedback,
+                FeedbackAnswer.question_number,
+                FeedbackAnswer.answer,
+                FeedbackAnswer.explanation,
+                FeedbackAnswer.updated_at.label('answered_at'),
+            )
+            .join(Feedback, Feedback.user_id == User.id)
+            .join(FeedbackAnswer, FeedbackAnswer.feedback_id == Feedback.id)
+            .order_by(Feedback.id, FeedbackAnswer.question_number)
+        )
+    return (
+        select(
+            User.id.label('user_id'),
+            User.name.label('user_name'),
+            User.email.label('user_email'),
+            IAMessageStore.id.label('message_id'),
+            IAMessageStore.message,
+            IAMessageStore.score,
+            IAMessageStore.created_at,
+        )
+        .join(IAMessageStore, IAMessageStore.user_id == User.id)
+        .order_by(IAMessageStore.id)
+    )
+
+
+def _load_pyarrow():
+    try:
+        import pyarrow as pa  # noqa: PLC0415
+        import pyarrow.parquet as pq  # noqa: PLC0415
+    except ImportError as e:
+        raise ExportError('Parquet export requires pyarrow') from e
+    return pa, pq
+
+
+def check_format(file_format: ExportFormat):
+    """
+    Checks that the format can be produced, before the export starts.
+
+    Raises:
+        ExportError: If the format dependencies are not installed.
+    """
+    if file_format == ExportFormat.PARQUET:
+        _load_pyarrow()
+
+
+def iter_partitions(
+    connection: Connection, query: Select, chunk_size: int
+) -> Iterator[Sequence[Row]]:
+    # stream_results usa um cursor do lado do servidor (no PostgreSQL), e
+    # yield_per busca chunk_size linhas por vez
+    result = connection.execution_options(
+        stream_results=True, yield_per=chunk_size
+    ).execute(query)
+    yield from result.partitions()
+
+
+def iter_csv(
+    query: Select, partitions: Iterator[Sequence[Row]]
+) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.name for column in query.selected_columns])
+    for partition in partitions:
+        writer.writerows(partition)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that keeps what was written until it is drained."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:  # noqa: PLR6301
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._chunks = b''.join(self._chunks), []
+        return data
+
+
+def iter_parquet(
+    query: Select, partitions: Iterator[Sequence[Row]]
+) -> Iterator[bytes]:
+    pa, pq = _load_pyarrow()
+    arrow_types: dict[type, Any] = {
+        int: pa.int64(),
+        float: pa.float64(),
+        str: pa.string(),
+        bool: pa.bool_(),
+        datetime: pa.timestamp('us'),
+    }
+    schema = pa.schema([
+        (column.name, arrow_types[column.type.python_type])
+        for column in query.selected_columns
+    ])
+
+    # Cada partição vira um row group, enviado assim que é escrito
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for partition in partitions:
+            writer.write_table(
+                pa.Table.from_pylist(
+                    [row._asdict() for row in partition], schema=schema
+                )
+            )
+            yield sink.drain()
+    yield sink.drain()
+
+
+def stream_export(
+    engine: Engine,
+    dataset: ExportDataset,
+    file_format: ExportFormat,
+    chunk_size: int | None = None,
+) -> Iterator[bytes]:
+    """
+    Streams a dataset encoded as CSV or Parquet. The connection is held
+    until the iterator is exhausted or closed.
+
+    Args:
+        engine (Engine): The engine to read from.
+        dataset (ExportDataset): The rows to export.
+        file_format (ExportFormat): The file format.
+        chunk_size (int | None): Rows fetched and encoded per chunk.
+
+    Yields:
+        bytes: The next part of the file.
+    """
+    chunk_size = chunk_size or get_settings().EXPORT_CHUNK_SIZE
+    query = export_query(dataset)
+    encode = iter_parquet if file_format == ExportFormat.PARQUET else iter_csv
+
+    with engine.connect() as connection:
+        yield from encode(
+            query, iter_partitions(connection, query, chunk_size)
+        )
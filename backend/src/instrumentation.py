@@ -0,0 +1,427 @@
+"""This module contains the request instrumentation: latency histograms
+per route, the number of queries and the database time of every request,
+and the duration and token usage of the LLM calls, exposed in the
+Prometheus text format.
+
+The query counts come from cursor events on the engines, attributed to
+the request running in the current context. Requests with too many
+queries, a common sign of N+1 loading, or slower than the threshold are
+logged."""
+
+import bisect
+import contextlib
+import dataclasses
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from sqlalchemy import Engine, event
+
+from src.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+LLM_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return f'{{{pairs}}}'
+
+
+class Counter:
+    """
+    Counter is a monotonically increasing Prometheus counter.
+
+    Attributes:
+        name (str): The metric name.
+        help (str): The metric description.
+        label_names (Sequence[str]): The label names.
+    """
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [
+            f'# HELP {self.name} {self.help}',
+            f'# TYPE {self.name} counter',
+        ]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(
+                    f'{self.name}'
+                    f'{_format_labels(self.label_names, labels)} {value}'
+                )
+        return lines
+
+
+class Gauge:
+    """
+    Gauge is a Prometheus gauge, a value that goes up and down.
+
+    Attributes:
+        name (str): The metric name.
+        help (str): The metric description.
+        label_names (Sequence[str]): The label names.
+    """
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [
+            f'# HELP {self.name} {self.help}',
+            f'# TYPE {self.name} gauge',
+        ]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(
+                    f'{self.name}'
+                    f'{_format_labels(self.label_names, labels)} {value}'
+                )
+        return lines
+
+
+class Histogram:
+    """
+    Histogram counts observations in cumulative buckets, like a Prometheus
+    histogram.
+
+    Attributes:
+        name (str): The metric name.
+        help (str): The metric description.
+        label_names (Sequence[str]): The label names.
+        buckets (Sequence[float]): The bucket upper bounds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Por label: contagem de cada bucket (não cumulativa), soma e total
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, totals = self._values.setdefault(
+                labels, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[index] += 1
+            totals[0] += value
+
+    def render(self) -> List[str]:
+        lines = [
+            f'# HELP {self.name} {self.help}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self._lock:
+            for labels, (counts, totals) in sorted(self._values.items()):
+                cumulative = 0
+                bounds = [*(str(bound) for bound in self.buckets), '+Inf']
+                for bound, count in zip(bounds, counts):
+                    cumulative += count
+                    bucket_labels = _format_labels(
+                        (*self.label_names, 'le'), (*labels, bound)
+                    )
+                    lines.append(
+                        f'{self.name}_bucket{bucket_labels} {cumulative}'
+                    )
+                label_text = _format_labels(self.label_names, labels)
+                lines.append(f'{self.name}_sum{label_text} {totals[0]}')
+                lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds',
+    'HTTP request latency by route.',
+    ('method', 'route', 'status'),
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries',
+    'Database queries executed per HTTP request.',
+    ('method', 'route'),
+    buckets=QUERY_BUCKETS,
+)
+REQUEST_DB_DURATION = Histogram(
+    'http_request_db_duration_seconds',
+    'Database time spent per HTTP request.',
+    ('method', 'route'),
+)
+LLM_DURATION = Histogram(
+    'llm_request_duration_seconds',
+    'LLM call latency.',
+    ('model', 'operation', 'outcome'),
+    buckets=LLM_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    'llm_tokens_total',
+    'LLM tokens used, by direction.',
+    ('model', 'type'),
+)
+LLM_PROMPT_TOKENS = Histogram(
+    'llm_prompt_tokens',
+    'Estimated prompt tokens per LLM call, after the token budget.',
+    ('model',),
+    buckets=(500, 1000, 2000, 4000, 8000, 16000, 32000),
+)
+LLM_TRUNCATED_EXPLANATIONS = Counter(
+    'llm_prompt_truncated_explanations_total',
+    'Explanations truncated to fit the prompt token budget.',
+    ('model',),
+)
+LLM_RETRIES = Counter(
+    'llm_retries_total',
+    'LLM calls retried after a transient error.',
+    ('model', 'operation'),
+)
+LLM_TIMEOUTS = Counter(
+    'llm_timeouts_total',
+    'LLM calls that exceeded their deadline.',
+    ('model', 'operation'),
+)
+LLM_CIRCUIT_STATE = Gauge(
+    'llm_circuit_state',
+    'LLM circuit breaker state: 0 closed, 1 half open, 2 open.',
+    ('model',),
+)
+LLM_CIRCUIT_REJECTIONS = Counter(
+    'llm_circuit_rejections_total',
+    'LLM calls rejected because the circuit breaker was open.',
+    ('model',),
+)
+LLM_HEDGES = Counter(
+    'llm_hedged_requests_total',
+    'Hedged LLM requests, by the request that answered first.',
+    ('model', 'winner'),
+)
+LLM_IN_FLIGHT = Gauge(
+    'llm_in_flight_requests',
+    'LLM calls running or waiting for a concurrency slot.',
+    ('model',),
+)
+METRICS = (
+    REQUEST_DURATION,
+    REQUEST_QUERIES,
+    REQUEST_DB_DURATION,
+    LLM_DURATION,
+    LLM_TOKENS,
+    LLM_PROMPT_TOKENS,
+    LLM_TRUNCATED_EXPLANATIONS,
+    LLM_RETRIES,
+    LLM_TIMEOUTS,
+    LLM_CIRCUIT_STATE,
+    LLM_CIRCUIT_REJECTIONS,
+    LLM_HEDGES,
+    LLM_IN_FLIGHT,
+)
+
+
+def render_metrics() -> str:
+    """Returns every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+@dataclasses.dataclass
+class RequestStats:
+    """
+    RequestStats accumulates the database usage of a request.
+
+    Attributes:
+        queries (int): Number of statements executed.
+        db_seconds (float): Time spent executing them.
+    """
+
+    queries: int = 0
+    db_seconds: float = 0.0
+    _lock: threading.Lock = dataclasses.field(
+        default_factory=threading.Lock, repr=False
+    )
+
+    def add_query(self, seconds: float):
+        with self._lock:
+            self.queries += 1
+            self.db_seconds += seconds
+
+
+request_stats_var: ContextVar[RequestStats | None] = ContextVar(
+    'request_stats', default=None
+)
+
+
+def _before_cursor_execute(  # noqa: PLR0913, PLR0917
+    conn, cursor, statement, params, context, many
+):
+    conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(  # noqa: PLR0913, PLR0917
+    conn, cursor, statement, params, context, many
+):
+    started_at = conn.info['query_started_at'].pop()
+    stats = request_stats_var.get()
+    if stats is not None:
+        stats.add_query(time.perf_counter() - started_at)
+
+
+def _discard_query_start(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('query_started_at'):
+        connection.info['query_started_at'].pop()
+
+
+def instrument_engine(engine: Engine):
+    """
+    Counts the statements executed through an engine, and their time, in
+    the stats of the request running in the current context. For an async
+    engine, pass its `sync_engine`.
+    """
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _discard_query_start)
+
+
+@contextlib.contextmanager
+def track_llm_call(model: str, operation: str) -> Iterator[None]:
+    """Records the duration and the outcome of an LLM call."""
+    started_at = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'success'
+    finally:
+        LLM_DURATION.observe(
+            time.perf_counter() - started_at, model, operation, outcome
+        )
+
+
+def count_llm_tokens(
+    model: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0
+):
+    LLM_TOKENS.inc(model, 'input', amount=input_tokens)
+    LLM_TOKENS.inc(model, 'output', amount=output_tokens)
+    if cached_tokens:
+        # Parte dos tokens de entrada lida do cache de contexto do provedor
+        LLM_TOKENS.inc(model, 'cache_read', amount=cached_tokens)
+
+
+def record_prompt_tokens(model: str, tokens: int, truncated: int):
+    LLM_PROMPT_TOKENS.observe(tokens, model)
+    if truncated:
+        LLM_TRUNCATED_EXPLANATIONS.inc(model, amount=truncated)
+
+
+def _route_template(scope) -> str:
+    endpoint = scope.get('endpoint')
+    app = scope.get('app')
+    if endpoint is None or app is None:
+        # Rotas inexistentes ficam agrupadas, para não criar uma série por
+        # URL
+        return 'unmatched'
+    for route in app.router.routes:
+        if getattr(route, 'endpoint', None) is endpoint:
+            return route.path
+    return 'unmatched'
+
+
+class InstrumentationMiddleware:
+    """
+    ASGI middleware that records the latency, the number of queries and
+    the database time of every request, and logs the requests slower than
+    SLOW_REQUEST_MS or with more than SLOW_REQUEST_QUERIES queries.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        settings = get_settings()
+        self.slow_request_seconds = settings.SLOW_REQUEST_MS / 1000
+        self.max_queries = settings.SLOW_REQUEST_QUERIES
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        token = request_stats_var.set(stats)
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            request_stats_var.reset(token)
+            self._record(scope, status, elapsed, stats)
+
+    def _record(self, scope, status: int, elapsed: float, stats: RequestStats):
+        method, route = scope['method'], _route_template(scope)
+        REQUEST_DURATION.observe(elapsed, method, route, str(status))
+        REQUEST_QUERIES.observe(stats.queries, method, route)
+        REQUEST_DB_DURATION.observe(stats.db_seconds, method, route)
+
+        if elapsed > self.slow_request_seconds or (
+            stats.queries > self.max_queries
+        ):
+            logger.warning(
+                'Slow request',
+                extra={
+                    'method': method,
+                    'route': route,
+                    'status': status,
+                    'duration_ms': round(elapsed * 1000, 1),
+                    'queries': stats.queries,
+                    'db_ms': round(stats.db_seconds * 1000, 1),
+                },
+            )
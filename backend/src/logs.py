@@ -0,0 +1,186 @@
+"""This module contains the structured logging setup: JSON log lines with
+the id of the request that produced them, sampling of the low level logs
+and a queue, so the request threads never wait on the log output.
+
+Modules log through `logging.getLogger(__name__)`, passing structured
+fields in `extra`."""
+
+import copy
+import json
+import logging
+import queue
+import sys
+import uuid
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict
+
+from src.settings import Settings, get_settings
+
+LOGGER_NAME = 'src'
+REQUEST_ID_HEADER = 'x-request-id'
+
+request_id_var: ContextVar[str | None] = ContextVar('request_id', default=None)
+
+# Atributos de todo LogRecord; o resto veio de `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {
+    'message',
+    'asctime',
+    'request_id',
+}
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds the id of the current request to the log records."""
+
+    def filter(self, record: logging.LogRecord) -> bool:  # noqa: PLR6301
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    SamplingFilter keeps the records below WARNING of only a fraction of
+    the requests. The decision is taken from the request id, so a sampled
+    request keeps all of its logs. Records outside a request are kept.
+
+    Attributes:
+        sample_rate (float): Fraction of the requests to keep, 0 to 1.
+    """
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.sample_rate >= 1:
+            return True
+        request_id = getattr(record, 'request_id', None)
+        if request_id is None:
+            return True
+        bucket = zlib.crc32(request_id.encode()) % 10_000
+        return bucket < self.sample_rate * 10_000
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a JSON line, with the `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'timestamp': datetime.fromtimestamp(
+                record.created, timezone.utc
+            ).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        entry.update({
+            key: value
+            for key, value in vars(record).items()
+            if key not in _RECORD_ATTRIBUTES
+        })
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class StructuredQueueHandler(QueueHandler):
+    """
+    QueueHandler that keeps the `extra` fields and the exception apart
+    from the message, so the listener can format them as JSON.
+    """
+
+    def prepare(  # noqa: PLR6301
+        self, record: logging.LogRecord
+    ) -> logging.LogRecord:
+        record = copy.copy(record)
+        # Formata os argumentos antes, como o QueueHandler padrão, pois
+        # podem não ser serializáveis ou mudar até o listener processar
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info
+            )
+            record.exc_info = None
+        return record
+
+
+def configure_logging(settings: Settings | None = None) -> QueueListener:
+    """
+    Configures the `src` loggers to write JSON lines to stdout through a
+    queue, drained by a background thread. Records are filtered by level
+    and sampled before being queued, so a disabled log costs only the
+    level check.
+
+    Args:
+        settings (Settings | None): The settings to use, loaded from the
+        environment if not given.
+
+    Returns:
+        QueueListener: The started listener; stop it on shutdown to flush
+        the queue.
+    """
+    settings = settings or get_settings()
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+
+    handler = StructuredQueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+    handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATE))
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    listener = QueueListener(log_queue, output)
+
+    logger = logging.getLogger(LOGGER_NAME)
+    for previous in list(logger.handlers):
+        if isinstance(previous, QueueHandler):
+            logger.removeHandler(previous)
+    logger.addHandler(handler)
+    logger.setLevel(settings.LOG_LEVEL.upper())
+    logger.propagate = False
+
+    listener.start()
+    return listener
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware that gives every request an id, taken from the
+    `X-Request-ID` header or generated, stores it for the logs and returns
+    it in the response headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        request_id = dict(scope['headers']).get(REQUEST_ID_HEADER.encode())
+        request_id = (
+            request_id.decode('latin-1')[:128]
+            if request_id
+            else uuid.uuid4().hex
+        )
+
+        async def send_with_request_id(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [
+                    *message.get('headers', []),
+                    (REQUEST_ID_HEADER.encode(), request_id.encode()),
+                ]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
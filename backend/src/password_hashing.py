@@ -0,0 +1,278 @@
+"""This module contains the Argon2 password hashing configuration and the
+bounded worker pool that runs hashing off the request threads."""
+
+import asyncio
+import contextlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from fastapi import Request
+from pwdlib import PasswordHash
+from pwdlib.hashers.argon2 import Argon2Hasher
+
+from src.settings import Settings, get_settings
+
+T = TypeVar('T')
+
+
+class PasswordHashingBusyError(Exception):
+    """Raised when the hashing queue cannot accept more work."""
+
+
+class PasswordHashingRateLimitError(Exception):
+    """Raised when an account or client has too many hashes in flight."""
+
+
+def build_password_hash(settings: Settings | None = None) -> PasswordHash:
+    """
+    Builds the Argon2 password context from the cost parameters in the
+    settings. Hashes created with other parameters are still verified, and
+    reported as needing a rehash.
+    """
+    settings = settings or get_settings()
+    return PasswordHash((
+        Argon2Hasher(
+            time_cost=settings.PASSWORD_HASH_TIME_COST,
+            memory_cost=settings.PASSWORD_HASH_MEMORY_COST,
+            parallelism=settings.PASSWORD_HASH_PARALLELISM,
+        ),
+    ))
+
+
+pwd_context = build_password_hash()
+
+
+class PasswordHashingPool:
+    """
+    PasswordHashingPool runs the Argon2 hashing and verification in a
+    dedicated, bounded thread pool (argon2 releases the GIL), so a login
+    burst cannot take every request thread.
+
+    Work is rejected, instead of queued forever, when the queue is full or
+    when the same account or client already has too many hashes in flight.
+
+    Bulk imports hash on the same threads, one batch at a time and with at
+    most `batch_workers` hashes in flight, so part of the threads is always
+    left for logins. Their hashes count against the queue limit, and an
+    import waits for room in the queue instead of going over it.
+
+    Attributes:
+        workers (int): Number of hashing threads.
+        max_queue_size (int): Maximum number of hashes waiting for a thread.
+        max_per_key (int): Maximum hashes in flight per account or client.
+        max_batches (int): Maximum bulk imports hashing at the same time.
+        batch_workers (int): Maximum hashes in flight per bulk import, half
+            of the threads by default.
+
+    Methods:
+        hash(password: str, keys: Sequence[str]) -> str:
+            Hashes a password.
+        verify_and_update(password: str, hashed: str, keys: Sequence[str])
+        -> Tuple[bool, str | None]:
+            Verifies a password, returning a new hash when the stored one
+            uses outdated parameters.
+        batch_slot():
+            Admits a bulk import.
+        hash_many(passwords: Sequence[str]) -> List[str]:
+            Hashes the passwords of an admitted bulk import.
+        shutdown():
+            Stops the hashing threads.
+        stats() -> Dict[str, Any]:
+            Returns the pool counters.
+    """
+
+    def __init__(  # noqa: PLR0913, PLR0917
+        self,
+        workers: int | None = None,
+        max_queue_size: int | None = None,
+        max_per_key: int | None = None,
+        password_hash: PasswordHash | None = None,
+        max_batches: int | None = None,
+        batch_workers: int | None = None,
+    ):
+        settings = get_settings()
+        self.workers = workers or settings.PASSWORD_HASH_WORKERS
+        self.max_queue_size = (
+            max_queue_size or settings.PASSWORD_HASH_QUEUE_SIZE
+        )
+        self.max_per_key = max_per_key or settings.PASSWORD_HASH_MAX_PER_KEY
+        self.max_batches = max_batches or settings.USER_IMPORT_MAX_CONCURRENT
+        self.batch_workers = batch_workers or max(1, self.workers // 2)
+        self.password_hash = password_hash or pwd_context
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix='password-hash'
+        )
+        self._lock = threading.Lock()
+        # Acorda os imports que esperam por espaço na fila
+        self._released = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._running = 0
+        self._in_flight_by_key: Dict[str, int] = {}
+        self._batches = 0
+        self.completed = 0
+        self.rejected_busy = 0
+        self.rejected_rate_limited = 0
+        self._wait_seconds = 0.0
+        self._hash_seconds = 0.0
+        self._max_hash_seconds = 0.0
+
+    @contextlib.contextmanager
+    def _admit(self, keys: Sequence[str]) -> Iterator[None]:
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue_size:
+                self.rejected_busy += 1
+                raise PasswordHashingBusyError('Password hashing is busy')
+            if any(
+                self._in_flight_by_key.get(key, 0) >= self.max_per_key
+                for key in keys
+            ):
+                self.rejected_rate_limited += 1
+                raise PasswordHashingRateLimitError(
+                    'Too many concurrent password attempts'
+                )
+            self._in_flight += 1
+            for key in keys:
+                self._in_flight_by_key[key] = (
+                    self._in_flight_by_key.get(key, 0) + 1
+                )
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                for key in keys:
+                    self._in_flight_by_key[key] -= 1
+                    if not self._in_flight_by_key[key]:
+                        del self._in_flight_by_key[key]
+                self._released.notify_all()
+
+    def _timed(self, submitted_at: float, fn: Callable[..., T], *args) -> T:
+        started_at = time.perf_counter()
+        with self._lock:
+            self._running += 1
+            self._wait_seconds += started_at - submitted_at
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            with self._lock:
+                self._running -= 1
+                self.completed += 1
+                self._hash_seconds += elapsed
+                self._max_hash_seconds = max(self._max_hash_seconds, elapsed)
+
+    async def _run(
+        self, keys: Sequence[str], fn: Callable[..., T], *args
+    ) -> T:
+        submitted_at = time.perf_counter()
+        with self._admit(keys):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, self._timed, submitted_at, fn, *args
+            )
+
+    async def hash(self, password: str, keys: Sequence[str] = ()) -> str:
+        return await self._run(keys, self.password_hash.hash, password)
+
+    async def verify_and_update(
+        self, password: str, hashed: str, keys: Sequence[str] = ()
+    ) -> Tuple[bool, str | None]:
+        return await self._run(
+            keys, self.password_hash.verify_and_update, password, hashed
+        )
+
+    @contextlib.contextmanager
+    def batch_slot(self) -> Iterator[None]:
+        """
+        Admits a bulk import.
+
+        Raises:
+            PasswordHashingBusyError: If `max_batches` imports are already
+            hashing.
+        """
+        with self._lock:
+            if self._batches >= self.max_batches:
+                self.rejected_busy += 1
+                raise PasswordHashingBusyError('Another import is running')
+            self._batches += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._batches -= 1
+
+    def hash_many(self, passwords: Sequence[str]) -> List[str]:
+        """
+        Hashes the passwords of a bulk import, blocking the calling worker
+        thread. Must run inside `batch_slot`.
+        """
+        hashes: List[str] = []
+        limit = self.workers + self.max_queue_size
+        # Janela de `batch_workers` hashes: as demais threads ficam para os
+        # logins, e a janela só entra quando cabe no limite da fila
+        for start in range(0, len(passwords), self.batch_workers):
+            window = passwords[start : start + self.batch_workers]
+            with self._released:
+                self._released.wait_for(
+                    lambda: self._in_flight + len(window) <= limit
+                )
+                self._in_flight += len(window)
+            submitted_at = time.perf_counter()
+            try:
+                futures = [
+                    self._executor.submit(
+                        self._timed,
+                        submitted_at,
+                        self.password_hash.hash,
+                        password,
+                    )
+                    for password in window
+                ]
+                hashes.extend(future.result() for future in futures)
+            finally:
+                with self._released:
+                    self._in_flight -= len(window)
+                    self._released.notify_all()
+        return hashes
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            completed = self.completed or 1
+            return {
+                'workers': self.workers,
+                'max_queue_size': self.max_queue_size,
+                'running': self._running,
+                'queue_depth': self._in_flight - self._running,
+                'completed': self.completed,
+                'rejected_busy': self.rejected_busy,
+                'rejected_rate_limited': self.rejected_rate_limited,
+                'avg_wait_ms': self._wait_seconds / completed * 1000,
+                'avg_hash_ms': self._hash_seconds / completed * 1000,
+                'max_hash_ms': self._max_hash_seconds * 1000,
+            }
+
+
+def get_password_hashing_pool(request: Request) -> PasswordHashingPool:
+    """
+    FastAPI dependency that returns the hashing pool created in the app
+    lifespan. A pool is created on demand if the lifespan did not run.
+    """
+    pool = getattr(request.app.state, 'password_hashing_pool', None)
+    if pool is None:
+        pool = PasswordHashingPool()
+        request.app.state.password_hashing_pool = pool
+    return pool
@@ -0,0 +1,58 @@
+from http import HTTPStatus
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.analytics import StatKind, get_question_stats, get_stats_summary
+from src.database.database import get_async_session
+from src.schemas.analytics import QuestionStatsList, StatsSummary
+from src.security import get_current_user
+from src.token_cache import UserSnapshot
+
+T_Session = Annotated[AsyncSession, Depends(get_async_session)]
+T_CurrentUser = Annotated[UserSnapshot, Depends(get_current_user)]
+router = APIRouter(
+    prefix='/analytics',
+    tags=['analytics'],
+)
+
+
+@router.get(
+    '/questions',
+    status_code=HTTPStatus.OK,
+    response_model=QuestionStatsList,
+)
+async def read_question_stats(
+    session: T_Session,
+    current_user: T_CurrentUser,
+    kind: StatKind | None = None,
+):
+    if not current_user.is_leader:
+        raise HTTPException(
+            status_code=HTTPStatus.FORBIDDEN,
+            detail='User is not a leader',
+        )
+
+    questions = await session.run_sync(
+        get_question_stats, kind.value if kind else None
+    )
+    return {'questions': questions}
+
+
+@router.get(
+    '/summary',
+    status_code=HTTPStatus.OK,
+    response_model=StatsSummary,
+)
+async def read_stats_summary(
+    session: T_Session,
+    current_user: T_CurrentUser,
+):
+    if not current_user.is_leader:
+        raise HTTPException(
+            status_code=HTTPStatus.FORBIDDEN,
+            detail='User is not a leader',
+        )
+
+    return {'kinds': await session.run_sync(get_stats_summary)}
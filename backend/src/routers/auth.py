@@ -1,24 +1,27 @@
 from http import HTTPStatus
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.database import get_session
+from src.database.database import get_async_session
 from src.database.models import User
 from src.schemas.auth import (
     Token,
 )
 from src.security import (
-    create_access_token,
+    T_PasswordHashingPool,
+    averify_password,
+    create_user_access_token,
     get_current_user,
-    verify_password,
+    password_rate_limit_keys,
 )
+from src.token_cache import UserSnapshot
 
-T_Session = Annotated[Session, Depends(get_session)]
-T_CurrentUser = Annotated[User, Depends(get_current_user)]
+T_Session = Annotated[AsyncSession, Depends(get_async_session)]
+T_CurrentUser = Annotated[UserSnapshot, Depends(get_current_user)]
 T_Oauth2Form = Annotated[OAuth2PasswordRequestForm, Depends()]
 
 router = APIRouter(
@@ -28,29 +31,46 @@ router = APIRouter(
 
 
 @router.post('/token', response_model=Token)
-def login_for_access_token(
+async def login_for_access_token(
+    request: Request,
     session: T_Session,
     form_data: T_Oauth2Form,
+    hashing_pool: T_PasswordHashingPool,
 ):
-    user_db = session.scalar(
+    user_db = await session.scalar(
         select(User).where(
             User.email == form_data.username
         )  # form_data.username = email
     )
-    if not user_db or not verify_password(
-        form_data.password, user_db.password
-    ):
+    if not user_db:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
             detail='Incorrect email or password',
         )
-    access_token = create_access_token(data_payload={'sub': user_db.email})
+
+    is_valid, updated_hash = await averify_password(
+        hashing_pool,
+        form_data.password,
+        user_db.password,
+        password_rate_limit_keys(request, form_data.username),
+    )
+    if not is_valid:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail='Incorrect email or password',
+        )
+
+    # Hash criado com parâmetros antigos do Argon2: regrava com os atuais
+    if updated_hash:
+        user_db.password = updated_hash
+        await session.commit()
+    access_token = create_user_access_token(user_db)
     return {'access_token': access_token, 'token_type': 'Bearer'}
 
 
 @router.post('/refresh_token', response_model=Token)
-def refresh_access_token(
+async def refresh_access_token(
     user: T_CurrentUser,
 ):
-    new_access_token = create_access_token(data_payload={'sub': user.email})
+    new_access_token = create_user_access_token(user)
     return {'access_token': new_access_token, 'token_type': 'Bearer'}
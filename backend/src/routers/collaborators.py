@@ -1,22 +1,50 @@
+import asyncio
+import io
 from http import HTTPStatus
-from typing import Annotated
+from typing import Annotated, Any, Dict, List
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+)
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from src.database.database import get_session
+from src.database.database import engine, get_async_session
 from src.database.models import User
+from src.database.queries import (
+    FeedbackStatus,
+    collaborators_page,
+    collaborators_query,
+    leader_dashboard_query,
+)
+from src.pagination import InvalidCursorError, decode_cursor, encode_cursor
+from src.password_hashing import PasswordHashingBusyError
+from src.schemas.dashboard import LeaderDashboard
 from src.schemas.users import (
+    UserImportReport,
     UserList,
     UserPublic,
     UserSchema,
 )
-from src.security import get_current_user, get_password_hash
+from src.security import (
+    T_PasswordHashingPool,
+    ahash_password,
+    get_current_user,
+    password_rate_limit_keys,
+)
+from src.token_cache import UserSnapshot
+from src.user_import import UserImportFormatError, detect_format, import_users
 
 # noqa: I001
-T_Session = Annotated[Session, Depends(get_session)]
-T_CurrentUser = Annotated[User, Depends(get_current_user)]
+T_Session = Annotated[AsyncSession, Depends(get_async_session)]
+T_CurrentUser = Annotated[UserSnapshot, Depends(get_current_user)]
 router = APIRouter(
     prefix='/users',
     tags=['users'],
@@ -24,8 +52,15 @@ router = APIRouter(
 
 
 @router.post('/', status_code=HTTPStatus.CREATED, response_model=UserPublic)
-def create_user_collaborator(user: UserSchema, session: T_Session):
-    db_user = session.scalar(select(User).where((User.email == user.email)))
+async def create_user_collaborator(
+    request: Request,
+    user: UserSchema,
+    session: T_Session,
+    hashing_pool: T_PasswordHashingPool,
+):
+    db_user = await session.scalar(
+        select(User).where((User.email == user.email))
+    )
 
     if db_user:
         if db_user.email == user.email:
@@ -35,32 +70,176 @@ def create_user_collaborator(user: UserSchema, session: T_Session):
             )
     db_user = User(
         name=user.name,
-        password=get_password_hash(user.password),
+        password=await ahash_password(
+            hashing_pool,
+            user.password,
+            password_rate_limit_keys(request, user.email),
+        ),
         email=user.email,
         is_leader=False,
     )  # type: ignore
 
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.commit()
+    await session.refresh(db_user)
 
     return db_user
 
 
+def _decode_user_cursor(cursor: str) -> List[Any]:
+    try:
+        name, user_id = decode_cursor(cursor, 2)
+    except InvalidCursorError as e:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=str(e),
+        )
+    if not isinstance(name, str) or not isinstance(user_id, int):
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail='Invalid cursor',
+        )
+    return [name, user_id]
+
+
 @router.get('/', status_code=HTTPStatus.OK, response_model=UserList)
-def read_all_collaborators(
+async def read_all_collaborators(  # noqa: PLR0913, PLR0917
     session: T_Session,
     current_user: T_CurrentUser,
-    limit: int = 10,
-    offset: int = 0,
+    limit: Annotated[int, Query(ge=1, le=100)] = 10,
+    cursor: str | None = None,
+    name_prefix: str | None = None,
+    feedback_status: FeedbackStatus | None = None,
+    include_total: bool = False,
 ):
     if not current_user.is_leader:
         raise HTTPException(
             status_code=HTTPStatus.FORBIDDEN,
             detail='User is not a leader',
         )
-    users = session.scalars(
-        select(User).where(~User.is_leader).limit(limit).offset(offset)
+
+    query = collaborators_query(name_prefix, feedback_status)
+    total = None
+    if include_total:
+        total = await session.scalar(
+            select(func.count()).select_from(query.subquery())
+        )
+
+    page_query = collaborators_page(
+        query, limit, _decode_user_cursor(cursor) if cursor else None
     )
+    users = (await session.scalars(page_query)).all()
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_cursor([users[-1].name, users[-1].id])
+
+    return {'users': users, 'next_cursor': next_cursor, 'total': total}
 
-    return {'users': users}
+
+@router.get(
+    '/dashboard', status_code=HTTPStatus.OK, response_model=LeaderDashboard
+)
+async def read_collaborators_dashboard(  # noqa: PLR0913, PLR0917
+    session: T_Session,
+    current_user: T_CurrentUser,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: str | None = None,
+    name_prefix: str | None = None,
+    feedback_status: FeedbackStatus | None = None,
+):
+    if not current_user.is_leader:
+        raise HTTPException(
+            status_code=HTTPStatus.FORBIDDEN,
+            detail='User is not a leader',
+        )
+
+    users = collaborators_page(
+        collaborators_query(name_prefix, feedback_status),
+        limit,
+        _decode_user_cursor(cursor) if cursor else None,
+    ).subquery()
+    rows = (await session.execute(leader_dashboard_query(users))).all()
+
+    # O banco já agregou tudo; aqui as linhas de cada colaborador (uma por
+    # pergunta) só são agrupadas na resposta
+    collaborators: Dict[int, Dict[str, Any]] = {}
+    for row in rows:
+        collaborator = collaborators.setdefault(
+            row.id,
+            {
+                'id': row.id,
+                'name': row.name,
+                'email': row.email,
+                'has_auto_feedback': False,
+                'has_leader_feedback': False,
+                'pdi_count': row.pdi_count,
+                'pdi_last_created_at': row.pdi_last_created_at,
+                'scores': [],
+            },
+        )
+        collaborator['has_auto_feedback'] |= bool(row.has_auto_feedback)
+        collaborator['has_leader_feedback'] |= bool(row.has_leader_feedback)
+        if row.question_number is not None:
+            collaborator['scores'].append({
+                'question_number': row.question_number,
+                'auto_answer': row.auto_answer,
+                'leader_answer': row.leader_answer,
+                'final_score': row.final_score,
+            })
+
+    page = list(collaborators.values())
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor([page[-1]['name'], page[-1]['id']])
+
+    return {'collaborators': page, 'next_cursor': next_cursor}
+
+
+@router.post(
+    '/import', status_code=HTTPStatus.OK, response_model=UserImportReport
+)
+async def import_collaborators(
+    current_user: T_CurrentUser,
+    hashing_pool: T_PasswordHashingPool,
+    file: Annotated[UploadFile, File()],
+    file_format: str | None = None,
+    is_leader: bool = False,
+):
+    if not current_user.is_leader:
+        raise HTTPException(
+            status_code=HTTPStatus.FORBIDDEN,
+            detail='User is not a leader',
+        )
+
+    try:
+        file_format = detect_format(file.filename, file_format)
+    except UserImportFormatError as e:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=str(e),
+        )
+
+    # O upload fica em um arquivo temporário e é lido linha a linha; as
+    # senhas são hasheadas no pool de hashing compartilhado pelo app
+    def _import():
+        stream = io.TextIOWrapper(file.file, encoding='utf-8-sig', newline='')
+        with Session(engine) as session:
+            return import_users(
+                session,
+                stream,
+                file_format,
+                is_leader,
+                hash_passwords=hashing_pool.hash_many,
+            )
+
+    try:
+        with hashing_pool.batch_slot():
+            return await asyncio.to_thread(_import)
+    except PasswordHashingBusyError as e:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={'Retry-After': '5'},
+        )
@@ -0,0 +1,56 @@
+from http import HTTPStatus
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+
+from src.database.database import engine
+from src.export import (
+    MEDIA_TYPES,
+    ExportDataset,
+    ExportError,
+    ExportFormat,
+    check_format,
+    stream_export,
+)
+from src.security import get_current_user
+from src.token_cache import UserSnapshot
+
+T_CurrentUser = Annotated[UserSnapshot, Depends(get_current_user)]
+router = APIRouter(
+    prefix='/export',
+    tags=['export'],
+)
+
+
+@router.get('/{dataset}', status_code=HTTPStatus.OK)
+async def export_dataset(
+    dataset: ExportDataset,
+    current_user: T_CurrentUser,
+    file_format: ExportFormat = ExportFormat.CSV,
+):
+    if not current_user.is_leader:
+        raise HTTPException(
+            status_code=HTTPStatus.FORBIDDEN,
+            detail='User is not a leader',
+        )
+
+    try:
+        check_format(file_format)
+    except ExportError as e:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=str(e),
+        )
+
+    # O gerador é síncrono: o Starlette o consome no threadpool, um chunk
+    # por vez, sem bloquear o event loop
+    return StreamingResponse(
+        stream_export(engine, dataset, file_format),
+        media_type=MEDIA_TYPES[file_format],
+        headers={
+            'Content-Disposition': (
+                f'attachment; filename="{dataset.value}.{file_format.value}"'
+            )
+        },
+    )
@@ -1,22 +1,84 @@
+import logging
 from http import HTTPStatus
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.database import get_session
+from src.analytics import feedback_kind, update_question_stats
+from src.database.database import get_async_session
 from src.database.models import Feedback, FeedbackAnswer, User
-from src.schemas.feedback import FeedbackRequest, FeedbackList
+from src.database.queries import get_user_feedbacks
+from src.schemas.feedback import FeedbackList, FeedbackPublic, FeedbackRequest
+from src.scoring import refresh_final_scores
 from src.security import get_current_user
+from src.token_cache import UserSnapshot
 
+logger = logging.getLogger(__name__)
 router = APIRouter(
     prefix='/feedback',
     tags=['feedback'],
 )
 
-T_Session = Annotated[Session, Depends(get_session)]
-T_CurrentUser = Annotated[User, Depends(get_current_user)]
+T_Session = Annotated[AsyncSession, Depends(get_async_session)]
+T_CurrentUser = Annotated[UserSnapshot, Depends(get_current_user)]
+
+
+async def _save_feedback(
+    session: AsyncSession,
+    feedback_instance: Feedback,
+    feedback: FeedbackRequest,
+):
+    # A unicidade (um auto-feedback e um feedback do líder por usuário, uma
+    # resposta por pergunta) é garantida pelos índices únicos do banco
+    session.add(feedback_instance)
+    try:
+        await session.flush()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail='Feedback for this user already exists',
+        )
+
+    # Insere todas as respostas em um único INSERT em lote (executemany),
+    # dentro da mesma transação do feedback
+    if feedback.answers:
+        try:
+            await session.execute(
+                insert(FeedbackAnswer),
+                [
+                    {
+                        'feedback_id': feedback_instance.id,
+                        'question_number': answer.question_number,
+                        'answer': answer.answer,
+                        'explanation': answer.explanation,
+                    }
+                    for answer in feedback.answers
+                ],
+            )
+        except IntegrityError:
+            await session.rollback()
+            raise HTTPException(
+                status_code=HTTPStatus.BAD_REQUEST,
+                detail='Invalid feedback answers',
+            )
+
+    # Os agregados e as pontuações finais mudam na mesma transação das
+    # respostas
+    await session.run_sync(
+        update_question_stats,
+        feedback_kind(feedback_instance.auto_feedback),
+        added=[
+            (answer.question_number, answer.answer)
+            for answer in feedback.answers
+        ],
+    )
+    await session.run_sync(refresh_final_scores, [feedback_instance.user_id])
+    await session.commit()
+    await session.refresh(feedback_instance)
 
 
 @router.get(
@@ -24,55 +86,30 @@ T_CurrentUser = Annotated[User, Depends(get_current_user)]
     status_code=HTTPStatus.OK,
     response_model=FeedbackList,
 )
-def autofeedback_get_collaborator(
+async def autofeedback_get_collaborator(
     current_user: T_CurrentUser,
     session: T_Session,
 ):
-    db_current_user = session.scalar(
-        select(User).where((User.email == current_user.email))
-    )
-
-    if not db_current_user:
-        raise HTTPException(
-            status_code=HTTPStatus.BAD_REQUEST,
-            detail='User not found',
-        )
-
-    if db_current_user.is_leader:
+    if current_user.is_leader:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
             detail='User is a leader',
         )
 
-    auto_feedback = session.scalar(
-        select(Feedback).where(
-            (Feedback.user_id == db_current_user.id) & (Feedback.auto_feedback)
-        )
-    )
+    auto_feedback = (
+        await session.run_sync(get_user_feedbacks, current_user.id)
+    ).auto
     if not auto_feedback:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
             detail='Feedback for this user does not exist',
         )
 
-    auto_feedback_answers = session.scalars(
-        select(FeedbackAnswer)
-        .where((FeedbackAnswer.feedback_id == auto_feedback.id))
-        .order_by(FeedbackAnswer.question_number)
-    ).all()
-    print({
-        'feedback_id': auto_feedback.id,
-        'user_id': auto_feedback.user_id,
-        'auto_feedback': auto_feedback.auto_feedback,
-        'answers': [
-            {
-                'question_number': fb.question_number,
-                'answer': fb.answer,
-                'explanation': fb.explanation,
-            }
-            for fb in auto_feedback_answers
-        ],
-    })
+    auto_feedback_answers = auto_feedback.answers
+    logger.debug(
+        'Auto feedback read',
+        extra={'user_id': current_user.id, 'feedback_id': auto_feedback.id},
+    )
 
     return {
         'feedback_id': auto_feedback.id,
@@ -94,56 +131,30 @@ def autofeedback_get_collaborator(
     status_code=HTTPStatus.OK,
     response_model=FeedbackList,
 )
-def leader_feedback_get_collaborator(
+async def leader_feedback_get_collaborator(
     current_user: T_CurrentUser,
     session: T_Session,
 ):
-    db_current_user = session.scalar(
-        select(User).where((User.email == current_user.email))
-    )
-
-    if not db_current_user:
-        raise HTTPException(
-            status_code=HTTPStatus.BAD_REQUEST,
-            detail='User not found',
-        )
-
-    if db_current_user.is_leader:
+    if current_user.is_leader:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
             detail='User is a leader',
         )
 
-    leader_feedback = session.scalar(
-        select(Feedback).where(
-            (Feedback.user_id == db_current_user.id)
-            & (~Feedback.auto_feedback)
-        )
-    )
+    leader_feedback = (
+        await session.run_sync(get_user_feedbacks, current_user.id)
+    ).leader
     if not leader_feedback:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
             detail='Leader Feedback for this user does not exist',
         )
 
-    leader_feedback_answers = session.scalars(
-        select(FeedbackAnswer)
-        .where((FeedbackAnswer.feedback_id == leader_feedback.id))
-        .order_by(FeedbackAnswer.question_number)
-    ).all()
-    print({
-        'feedback_id': leader_feedback.id,
-        'user_id': leader_feedback.user_id,
-        'auto_feedback': leader_feedback.auto_feedback,
-        'answers': [
-            {
-                'question_number': fb.question_number,
-                'answer': fb.answer,
-                'explanation': fb.explanation,
-            }
-            for fb in leader_feedback_answers
-        ],
-    })
+    leader_feedback_answers = leader_feedback.answers
+    logger.debug(
+        'Leader feedback read',
+        extra={'user_id': current_user.id, 'feedback_id': leader_feedback.id},
+    )
 
     return {
         'feedback_id': leader_feedback.id,
@@ -161,142 +172,117 @@ def leader_feedback_get_collaborator(
 
 
 @router.put(
-    '/collaborator', status_code=HTTPStatus.OK, response_model=Feedback
+    '/collaborator', status_code=HTTPStatus.OK, response_model=FeedbackPublic
 )
-def feedback_update_collaborator(
+async def feedback_update_collaborator(
     feedback: FeedbackRequest,
     current_user: T_CurrentUser,
     session: T_Session,
 ):
-    print(feedback)
-    db_current_user = session.scalar(
-        select(User).where((User.email == current_user.email))
-    )
-
-    if not db_current_user:
-        raise HTTPException(
-            status_code=HTTPStatus.BAD_REQUEST,
-            detail='User not found',
-        )
-
-    if db_current_user.is_leader:
+    if current_user.is_leader:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
             detail='User is a leader',
         )
 
-    auto_feedback = session.scalar(
-        select(Feedback).where(
-            (Feedback.user_id == db_current_user.id) & (Feedback.auto_feedback)
-        )
-    )
+    auto_feedback = (
+        await session.run_sync(get_user_feedbacks, current_user.id)
+    ).auto
     if not auto_feedback:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
             detail='Feedback for this user does not exist',
         )
 
-    auto_feedback_answers = session.scalars(
-        select(FeedbackAnswer)
-        .where((FeedbackAnswer.feedback_id == auto_feedback.id))
-        .order_by(FeedbackAnswer.question_number)
-    ).all()
+    current_answers = {fb.question_number: fb for fb in auto_feedback.answers}
+    changed_answers = {
+        answer.question_number: answer
+        for answer in feedback.answers
+        if answer.question_number in current_answers
+    }
 
-    for answer in feedback.answers:
-        for fb in auto_feedback_answers:
-            if fb.question_number == answer.question_number:
-                fb.answer = answer.answer
-                fb.explanation = answer.explanation
-                session.commit()
-                session.refresh(fb)
+    # Valores antigos, lidos antes do UPDATE sincronizar a sessão
+    previous_answers = [
+        (question_number, current_answers[question_number].answer)
+        for question_number in changed_answers
+    ]
+
+    # Um único UPDATE em lote (executemany) pela chave primária
+    if changed_answers:
+        await session.execute(
+            update(FeedbackAnswer),
+            [
+                {
+                    'id': current_answers[question_number].id,
+                    'answer': answer.answer,
+                    'explanation': answer.explanation,
+                }
+                for question_number, answer in changed_answers.items()
+            ],
+        )
+        await session.run_sync(
+            update_question_stats,
+            feedback_kind(True),
+            removed=previous_answers,
+            added=[
+                (question_number, answer.answer)
+                for question_number, answer in changed_answers.items()
+            ],
+        )
+        await session.run_sync(refresh_final_scores, [current_user.id])
+    await session.commit()
+    logger.info(
+        'Auto feedback updated',
+        extra={'user_id': current_user.id, 'answers': len(changed_answers)},
+    )
 
     return auto_feedback
 
 
 @router.post(
-    '/collaborator', status_code=HTTPStatus.CREATED, response_model=Feedback
+    '/collaborator',
+    status_code=HTTPStatus.CREATED,
+    response_model=FeedbackPublic,
 )
-def feedback_submit_collaborator(
+async def feedback_submit_collaborator(
     feedback: FeedbackRequest,
     current_user: T_CurrentUser,
     session: T_Session,
 ):
-    db_current_user = session.scalar(
-        select(User).where((User.email == current_user.email))
-    )
-
-    if not db_current_user:
-        raise HTTPException(
-            status_code=HTTPStatus.BAD_REQUEST,
-            detail='User not found',
-        )
-
-    db_feedback = session.scalars(
-        select(Feedback).where((Feedback.user_id == db_current_user.id))
-    )
-    for fb in db_feedback:
-        if fb.auto_feedback:
-            raise HTTPException(
-                status_code=HTTPStatus.BAD_REQUEST,
-                detail='Feedback for this user already exists',
-            )
-
     feedback_instance = Feedback(
-        user_id=db_current_user.id,
+        user_id=current_user.id,
         auto_feedback=True,
     )  # type: ignore
-    print('Auto Feedback created')
-    print(feedback_instance)
 
-    session.add(feedback_instance)
-    session.commit()
-    session.refresh(feedback_instance)
-
-    for answer in feedback.answers:
-        print('auto Feedback answer created')
-        print(answer)
-        print(feedback_instance)
-        feedback_answer_instance = FeedbackAnswer(
-            feedback_id=feedback_instance.id,
-            question_number=answer.question_number,
-            answer=answer.answer,
-            explanation=answer.explanation,
-        )  # type: ignore
-        session.add(feedback_answer_instance)
-        session.commit()
-        session.refresh(feedback_answer_instance)
+    await _save_feedback(session, feedback_instance, feedback)
+    logger.info(
+        'Auto feedback created',
+        extra={
+            'user_id': current_user.id,
+            'feedback_id': feedback_instance.id,
+            'answers': len(feedback.answers),
+        },
+    )
 
     return feedback_instance
 
 
 @router.post(
-    '/leader', status_code=HTTPStatus.CREATED, response_model=Feedback
+    '/leader', status_code=HTTPStatus.CREATED, response_model=FeedbackPublic
 )
-def feedback_submit_leader(
+async def feedback_submit_leader(
     feedback: FeedbackRequest,
     user_to_evaluate_id: int,
     current_user: T_CurrentUser,
     session: T_Session,
 ):
-    db_current_user = session.scalar(
-        select(User).where((User.email == current_user.email))
-    )
-
-    if not db_current_user:
-        raise HTTPException(
-            status_code=HTTPStatus.BAD_REQUEST,
-            detail='User not found',
-        )
-
-    if not db_current_user.is_leader:
+    if not current_user.is_leader:
         raise HTTPException(
             status_code=HTTPStatus.FORBIDDEN,
             detail='Only leaders can submit feedback for other users',
         )
 
-    db_user_to_evaluate = session.scalar(
-        select(User).where((User.id == user_to_evaluate_id))
-    )
+    db_user_to_evaluate = await session.get(User, user_to_evaluate_id)
 
     if not db_user_to_evaluate:
         raise HTTPException(
@@ -304,39 +290,20 @@ def feedback_submit_leader(
             detail='User to evaluate not found',
         )
 
-    db_feedback = session.scalars(
-        select(Feedback).where((Feedback.user_id == user_to_evaluate_id))
-    )
-    for fb in db_feedback:
-        if not fb.auto_feedback:
-            raise HTTPException(
-                status_code=HTTPStatus.BAD_REQUEST,
-                detail='Feedback for this user already exists',
-            )
-
     feedback_instance = Feedback(
         user_id=user_to_evaluate_id,
         auto_feedback=False,
     )  # type: ignore
-    print('leader Feedback created')
-    print(feedback_instance)
 
-    session.add(feedback_instance)
-    session.commit()
-    session.refresh(feedback_instance)
-
-    for answer in feedback.answers:
-        print('leader Feedback answer created')
-        print(answer)
-        print(feedback_instance)
-        feedback_answer_instance = FeedbackAnswer(
-            feedback_id=feedback_instance.id,
-            question_number=answer.question_number,
-            answer=answer.answer,
-            explanation=answer.explanation,
-        )  # type: ignore
-        session.add(feedback_answer_instance)
-        session.commit()
-        session.refresh(feedback_answer_instance)
+    await _save_feedback(session, feedback_instance, feedback)
+    logger.info(
+        'Leader feedback created',
+        extra={
+            'user_id': user_to_evaluate_id,
+            'leader_id': current_user.id,
+            'feedback_id': feedback_instance.id,
+            'answers': len(feedback.answers),
+        },
+    )
 
     return feedback_instance
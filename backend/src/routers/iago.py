@@ -1,180 +1,296 @@
+import asyncio
+import json
 from http import HTTPStatus
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy import select
-from sqlalchemy.orm import Session
-
-from src.assistant.assistant_config import IAgoAssistant
-from src.database.database import get_session
-from src.database.models import Feedback, FeedbackAnswer, IAMessageStore, User
-from src.schemas.message import Message
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.assistant.batch import agenerate_batch
+from src.assistant.cache import GenerationCache, get_generation_cache
+from src.assistant.jobs import (
+    GenerationJob,
+    JobQueueFullError,
+    JobRunner,
+    get_job_runner,
+)
+from src.assistant.pdi import (
+    PDIGenerationError,
+    agenerate_message,
+    aprepare_generation,
+    astream_message,
+)
+from src.assistant.registry import AssistantRegistry, get_assistant_registry
+from src.assistant.resilience import LLMUnavailableError
+from src.database.database import get_async_session
+from src.database.models import IAMessageStore
+from src.schemas.message import (
+    BatchGenerationRequest,
+    BatchGenerationResponse,
+    GenerationCacheStats,
+    GenerationJobPublic,
+    Message,
+)
 from src.security import get_current_user
+from src.token_cache import UserSnapshot
 
 router = APIRouter(
     prefix='/iago',
     tags=['iago'],
 )
 
-T_Session = Annotated[Session, Depends(get_session)]
-T_CurrentUser = Annotated[User, Depends(get_current_user)]
+T_Session = Annotated[AsyncSession, Depends(get_async_session)]
+T_CurrentUser = Annotated[UserSnapshot, Depends(get_current_user)]
+T_AssistantRegistry = Annotated[
+    AssistantRegistry, Depends(get_assistant_registry)
+]
+T_GenerationCache = Annotated[GenerationCache, Depends(get_generation_cache)]
+T_JobRunner = Annotated[JobRunner, Depends(get_job_runner)]
+
+MAX_JOB_WAIT_SECONDS = 60
+
+
+def _sse_event(event: str, data: dict) -> str:
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def _job_public(job: GenerationJob) -> dict:
+    return {
+        'job_id': job.id,
+        'status': job.status.value,
+        'message': job.message,
+        'error': job.error,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+    }
 
 
 @router.get('/', status_code=HTTPStatus.OK, response_model=Message)
-def get_assistant_feedback(
+async def get_assistant_feedback(
     current_user: T_CurrentUser,
     session: T_Session,
+    assistant_registry: T_AssistantRegistry,
+    generation_cache: T_GenerationCache,
+    use_cache: bool = True,
 ):
-    db_current_user = session.scalar(
-        select(User).where((User.email == current_user.email))
-    )
-
-    if not db_current_user:
+    if current_user.is_leader:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
-            detail='User not found',
+            detail='User is a leader',
         )
 
-    if db_current_user.is_leader:
+    try:
+        IAgo = await asyncio.to_thread(assistant_registry.get_assistant)
+    except Exception as e:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
-            detail='User is a leader',
+            detail=str(e),
         )
 
-    auto_feedback = session.scalar(
-        select(Feedback).where(
-            (Feedback.user_id == db_current_user.id) & (Feedback.auto_feedback)
+    try:
+        message = await agenerate_message(
+            IAgo, current_user.id, generation_cache, use_cache, session
         )
-    )
-    if not auto_feedback:
+    except PDIGenerationError as e:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
-            detail='Feedback for this user does not exist',
+            detail=str(e),
+        )
+    except LLMUnavailableError as e:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail=str(e),
         )
+    return {'message': message}
 
-    auto_feedback_answers = session.scalars(
-        select(FeedbackAnswer)
-        .where((FeedbackAnswer.feedback_id == auto_feedback.id))
-        .order_by(FeedbackAnswer.question_number)
-    ).all()
 
-    if not auto_feedback_answers:
+@router.get(
+    '/cache',
+    status_code=HTTPStatus.OK,
+    response_model=GenerationCacheStats,
+)
+async def get_generation_cache_stats(
+    current_user: T_CurrentUser,
+    generation_cache: T_GenerationCache,
+):
+    if not current_user.is_leader:
+        raise HTTPException(
+            status_code=HTTPStatus.FORBIDDEN,
+            detail='User is not a leader',
+        )
+
+    return generation_cache.stats()
+
+
+@router.get('/stream', status_code=HTTPStatus.OK)
+async def stream_assistant_feedback(
+    current_user: T_CurrentUser,
+    session: T_Session,
+    assistant_registry: T_AssistantRegistry,
+    generation_cache: T_GenerationCache,
+    use_cache: bool = True,
+):
+    if current_user.is_leader:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
-            detail='Feedback answers for this user does not exist',
+            detail='User is a leader',
         )
-    print('Auto Feedback')
-    print(auto_feedback)
-    print(auto_feedback_answers)
-    print('End Auto Feedback')
 
-    print('-----------------------------------')
+    try:
+        IAgo = await asyncio.to_thread(assistant_registry.get_assistant)
+    except Exception as e:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=str(e),
+        )
 
-    leader_feedback = session.scalar(
-        select(Feedback).where(
-            (Feedback.user_id == db_current_user.id)
-            & (~Feedback.auto_feedback)
+    try:
+        prepared = await aprepare_generation(
+            IAgo, current_user.id, generation_cache, use_cache, session
         )
-    )
-    if not leader_feedback:
+    except PDIGenerationError as e:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
-            detail='Feedback for this user does not exist',
+            detail=str(e),
         )
-    leader_feedback_answers = session.scalars(
-        select(FeedbackAnswer)
-        .where((FeedbackAnswer.feedback_id == leader_feedback.id))
-        .order_by(FeedbackAnswer.question_number)
-    ).all()
 
-    print('Leader Feedback')
-    print(leader_feedback)
-    print(leader_feedback_answers)
-    print('End Auto Feedback')
+    async def event_stream():
+        try:
+            async for chunk in astream_message(
+                IAgo, prepared, current_user.id, generation_cache
+            ):
+                yield _sse_event('token', {'token': chunk})
+        except Exception as e:
+            yield _sse_event('error', {'detail': str(e)})
+            return
+        yield _sse_event('done', {})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@router.post(
+    '/jobs',
+    status_code=HTTPStatus.ACCEPTED,
+    response_model=GenerationJobPublic,
+)
+async def submit_assistant_feedback_job(
+    current_user: T_CurrentUser,
+    job_runner: T_JobRunner,
+    use_cache: bool = True,
+):
+    """
+    Queues the PDI generation of the current user and returns the job.
 
-    if len(auto_feedback_answers) != len(leader_feedback_answers):
+    The job is tracked in the memory of the worker that accepted it, so the
+    API must run with a single worker (see JobRunner).
+    """
+    if current_user.is_leader:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
-            detail='Feedback answers for this user does not match',
+            detail='User is a leader',
         )
 
-    final_score = []
+    try:
+        job = job_runner.submit(current_user.id, use_cache)
+    except JobQueueFullError as e:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail=str(e),
+        )
 
-    for af in auto_feedback_answers:
-        for lf in leader_feedback_answers:
-            if af.question_number == lf.question_number:
-                mean = (af.answer + lf.answer) / 2
-                final_score.append({
-                    'question_number': af.question_number,
-                    'final_score': (mean * 0.15)
-                    + (af.answer * 0.15)
-                    + (lf.answer * 0.7),
-                })
+    return _job_public(job)
 
-    print(final_score)
 
-    assistant_input = {}
-    for i in range(len(auto_feedback_answers)):
-        assistant_input[f'colaborador_q{i + 1}'] = auto_feedback_answers[
-            i
-        ].answer
-        assistant_input[f'colaborador_q{i + 1}_justificativa'] = (
-            auto_feedback_answers[i].explanation  # type: ignore
-        )
-        assistant_input[f'lider_q{i + 1}'] = leader_feedback_answers[i].answer
-        assistant_input[f'lider_q{i + 1}_justificativa'] = (
-            leader_feedback_answers[i].explanation  # type: ignore
+@router.get(
+    '/jobs/{job_id}',
+    status_code=HTTPStatus.OK,
+    response_model=GenerationJobPublic,
+)
+async def get_assistant_feedback_job(
+    job_id: str,
+    current_user: T_CurrentUser,
+    job_runner: T_JobRunner,
+    wait: Annotated[float, Query(ge=0, le=MAX_JOB_WAIT_SECONDS)] = 0,
+):
+    """
+    Returns the status of a job, optionally waiting for it to finish.
+
+    Only jobs accepted by this worker are found; with more than one worker
+    the lookup returns 404 for jobs submitted to the others.
+    """
+    job = job_runner.get(job_id)
+
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail='Job not found',
         )
-        assistant_input[f'final_q{i + 1}'] = final_score[i]['final_score']  # type: ignore
 
-    assistant_input['nome_colaborador'] = db_current_user.name  # type: ignore
+    if wait and job.is_active:
+        await job_runner.wait(job, wait)
+
+    return _job_public(job)
+
+
+@router.post(
+    '/batch',
+    status_code=HTTPStatus.OK,
+    response_model=BatchGenerationResponse,
+)
+async def batch_assistant_feedback(
+    batch: BatchGenerationRequest,
+    current_user: T_CurrentUser,
+    assistant_registry: T_AssistantRegistry,
+    generation_cache: T_GenerationCache,
+):
+    if not current_user.is_leader:
+        raise HTTPException(
+            status_code=HTTPStatus.FORBIDDEN,
+            detail='User is not a leader',
+        )
 
     try:
-        IAgo = IAgoAssistant()
+        IAgo = await asyncio.to_thread(assistant_registry.get_assistant)
     except Exception as e:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
             detail=str(e),
         )
 
-    IAgo.get_assistant()
-    message = IAgo.run_assistant(assistant_input)
-
-    print('Inserting into message store')
-
-    message_store = IAMessageStore(
-        user_id=db_current_user.id,  # type: ignore
-        message=message,  # type: ignore
-        score=0,  # type: ignore
+    items = await agenerate_batch(
+        IAgo, batch.user_ids, generation_cache, batch.use_cache
     )
-    session.add(message_store)
-    session.commit()
-    session.refresh(message_store)
-    return {'message': message_store.message}
+    return {'results': items}
 
 
 @router.get('/message', status_code=HTTPStatus.OK, response_model=Message)
-def get_assistant_feedback_message(
+async def get_assistant_feedback_message(
     current_user: T_CurrentUser,
     session: T_Session,
+    job_runner: T_JobRunner,
+    response: Response,
 ):
-    db_current_user = session.scalar(
-        select(User).where((User.email == current_user.email))
-    )
-
-    if not db_current_user:
-        raise HTTPException(
-            status_code=HTTPStatus.BAD_REQUEST,
-            detail='User not found',
-        )
-
-    message_store = session.scalar(
+    """
+    Returns the stored PDI of the current user, or 202 while a job of the
+    user is active in this worker.
+    """
+    message_store = await session.scalar(
         select(IAMessageStore).where(
-            (IAMessageStore.user_id == db_current_user.id)
+            (IAMessageStore.user_id == current_user.id)
         )
     )
 
     if not message_store:
+        if job_runner.get_active_job(current_user.id):
+            response.status_code = HTTPStatus.ACCEPTED
+            return {'message': 'Message generation in progress'}
+
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
             detail='Message not found',
@@ -184,23 +300,14 @@ def get_assistant_feedback_message(
 
 
 @router.delete('/', status_code=HTTPStatus.OK, response_model=Message)
-def delete_assistant_feedback(
+async def delete_assistant_feedback(
     current_user: T_CurrentUser,
     session: T_Session,
+    generation_cache: T_GenerationCache,
 ):
-    db_current_user = session.scalar(
-        select(User).where((User.email == current_user.email))
-    )
-
-    if not db_current_user:
-        raise HTTPException(
-            status_code=HTTPStatus.BAD_REQUEST,
-            detail='User not found',
-        )
-
-    message_store = session.scalar(
+    message_store = await session.scalar(
         select(IAMessageStore).where(
-            (IAMessageStore.user_id == db_current_user.id)
+            (IAMessageStore.user_id == current_user.id)
         )
     )
 
@@ -210,18 +317,22 @@ def delete_assistant_feedback(
             detail='Message not found',
         )
 
-    session.delete(message_store)
-    session.commit()
+    await session.delete(message_store)
+    await session.commit()
+    # Sem isso, o "gerar novamente" (DELETE e depois GET) devolveria a
+    # mesma mensagem do cache em memória
+    if message_store.input_hash:
+        generation_cache.discard(message_store.input_hash)
     return {'message': 'Deleted successfully'}
 
 
 @router.put('/score', status_code=HTTPStatus.OK, response_model=Message)
-def score_assistant_feedback(
+async def score_assistant_feedback(
     user: T_CurrentUser,
     score: int,
     session: T_Session,
 ):
-    message_store = session.scalar(
+    message_store = await session.scalar(
         select(IAMessageStore).where((IAMessageStore.user_id == user.id))
     )
 
@@ -232,6 +343,6 @@ def score_assistant_feedback(
         )
 
     message_store.score = bool(score)
-    session.commit()
-    session.refresh(message_store)
+    await session.commit()
+    await session.refresh(message_store)
     return {'message': 'Scored successfully'}
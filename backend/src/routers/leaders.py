@@ -1,21 +1,29 @@
+import logging
 from http import HTTPStatus
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.database import get_session
+from src.database.database import get_async_session
 from src.database.models import User
 from src.schemas.users import (
     UserPublic,
     UserSchema,
 )
-from src.security import get_current_user, get_password_hash
+from src.security import (
+    T_PasswordHashingPool,
+    ahash_password,
+    get_current_user,
+    password_rate_limit_keys,
+)
+from src.token_cache import UserSnapshot
 
 # noqa: I001
-T_Session = Annotated[Session, Depends(get_session)]
-T_CurrentUser = Annotated[User, Depends(get_current_user)]
+T_Session = Annotated[AsyncSession, Depends(get_async_session)]
+T_CurrentUser = Annotated[UserSnapshot, Depends(get_current_user)]
+logger = logging.getLogger(__name__)
 router = APIRouter(
     prefix='/leaders',
     tags=['leaders'],
@@ -23,8 +31,15 @@ router = APIRouter(
 
 
 @router.post('/', status_code=HTTPStatus.CREATED, response_model=UserPublic)
-def create_user_leader(user: UserSchema, session: T_Session):
-    db_user = session.scalar(select(User).where((User.email == user.email)))
+async def create_user_leader(
+    request: Request,
+    user: UserSchema,
+    session: T_Session,
+    hashing_pool: T_PasswordHashingPool,
+):
+    db_user = await session.scalar(
+        select(User).where((User.email == user.email))
+    )
 
     if db_user:
         raise HTTPException(
@@ -33,14 +48,18 @@ def create_user_leader(user: UserSchema, session: T_Session):
         )
     db_user = User(
         name=user.name,
-        password=get_password_hash(user.password),
+        password=await ahash_password(
+            hashing_pool,
+            user.password,
+            password_rate_limit_keys(request, user.email),
+        ),
         email=user.email,
         is_leader=True,
     )  # type: ignore
 
-    print(db_user)
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.commit()
+    await session.refresh(db_user)
+    logger.info('Leader created', extra={'user_id': db_user.id})
 
     return db_user
@@ -0,0 +1,108 @@
+from http import HTTPStatus
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from src.assistant.jobs import JobRunner, get_job_runner
+from src.database.database import async_pool_metrics, pool_metrics
+from src.instrumentation import render_metrics
+from src.schemas.metrics import (
+    DatabaseMetrics,
+    GenerationJobStats,
+    PasswordHashingStats,
+    TokenCacheStats,
+)
+from src.security import T_PasswordHashingPool, get_current_user
+from src.token_cache import UserSnapshot, token_cache
+
+T_CurrentUser = Annotated[UserSnapshot, Depends(get_current_user)]
+T_JobRunner = Annotated[JobRunner, Depends(get_job_runner)]
+router = APIRouter(
+    prefix='/metrics',
+    tags=['metrics'],
+)
+
+
+@router.get(
+    '',
+    status_code=HTTPStatus.OK,
+    response_class=PlainTextResponse,
+)
+async def get_prometheus_metrics():
+    # Sem autenticação, para ser lido pelo Prometheus; restrinja o acesso
+    # na rede
+    return PlainTextResponse(
+        render_metrics(), media_type='text/plain; version=0.0.4'
+    )
+
+
+@router.get(
+    '/database',
+    status_code=HTTPStatus.OK,
+    response_model=DatabaseMetrics,
+)
+async def get_database_pool_stats(current_user: T_CurrentUser):
+    if not current_user.is_leader:
+        raise HTTPException(
+            status_code=HTTPStatus.FORBIDDEN,
+            detail='User is not a leader',
+        )
+
+    return {
+        'sync_pool': pool_metrics.stats(),
+        'async_pool': (
+            async_pool_metrics.stats() if async_pool_metrics else None
+        ),
+    }
+
+
+@router.get(
+    '/auth',
+    status_code=HTTPStatus.OK,
+    response_model=TokenCacheStats,
+)
+async def get_token_cache_stats(current_user: T_CurrentUser):
+    if not current_user.is_leader:
+        raise HTTPException(
+            status_code=HTTPStatus.FORBIDDEN,
+            detail='User is not a leader',
+        )
+
+    return token_cache.stats()
+
+
+@router.get(
+    '/hashing',
+    status_code=HTTPStatus.OK,
+    response_model=PasswordHashingStats,
+)
+async def get_password_hashing_stats(
+    current_user: T_CurrentUser,
+    hashing_pool: T_PasswordHashingPool,
+):
+    if not current_user.is_leader:
+        raise HTTPException(
+            status_code=HTTPStatus.FORBIDDEN,
+            detail='User is not a leader',
+        )
+
+    return hashing_pool.stats()
+
+
+@router.get(
+    '/jobs',
+    status_code=HTTPStatus.OK,
+    response_model=GenerationJobStats,
+)
+async def get_generation_job_stats(
+    current_user: T_CurrentUser,
+    job_runner: T_JobRunner,
+):
+    if not current_user.is_leader:
+        raise HTTPException(
+            status_code=HTTPStatus.FORBIDDEN,
+            detail='User is not a leader',
+        )
+
+    return job_runner.stats()
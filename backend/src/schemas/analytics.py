@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+
+
+class StatsPublic(BaseModel):
+    kind: str
+    count: int
+    mean: float | None
+    histogram: dict[int, int]
+
+
+class QuestionStatsPublic(StatsPublic):
+    question_number: int
+
+
+class QuestionStatsList(BaseModel):
+    questions: list[QuestionStatsPublic]
+
+
+class StatsSummary(BaseModel):
+    kinds: list[StatsPublic]
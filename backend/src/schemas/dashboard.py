@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class QuestionScore(BaseModel):
+    question_number: int
+    auto_answer: int | None
+    leader_answer: int | None
+    final_score: float | None
+
+
+class CollaboratorDashboard(BaseModel):
+    id: int
+    name: str
+    email: str
+    has_auto_feedback: bool
+    has_leader_feedback: bool
+    pdi_count: int
+    pdi_last_created_at: datetime | None
+    scores: list[QuestionScore]
+
+
+class LeaderDashboard(BaseModel):
+    collaborators: list[CollaboratorDashboard]
+    next_cursor: str | None = None
@@ -1,9 +1,12 @@
-from pydantic import BaseModel, ConfigDict
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class FeedbackResponse(BaseModel):
     question_number: int
-    answer: int
+    # Escala de 1 a 5, a mesma das faixas do histograma em analytics
+    answer: int = Field(ge=1, le=5)
     explanation: str = ''
 
 
@@ -22,3 +25,12 @@ class FeedbackRequestDB(FeedbackRequest):
     id: int
     user_id: int
     auto_feedback: bool
+
+
+class FeedbackPublic(BaseModel):
+    id: int
+    user_id: int
+    auto_feedback: bool
+    created_at: datetime
+    updated_at: datetime
+    model_config = ConfigDict(from_attributes=True)
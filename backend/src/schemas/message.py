@@ -1,5 +1,42 @@
-from pydantic import BaseModel
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict
 
 
 class Message(BaseModel):
     message: str
+
+
+class GenerationCacheStats(BaseModel):
+    size: int
+    max_size: int
+    ttl_seconds: float
+    hits: int
+    store_hits: int
+    misses: int
+
+
+class GenerationJobPublic(BaseModel):
+    job_id: str
+    status: str
+    message: str | None = None
+    error: str | None = None
+    created_at: datetime
+    finished_at: datetime | None = None
+
+
+class BatchGenerationRequest(BaseModel):
+    # None gera o PDI de todos os colaboradores
+    user_ids: list[int] | None = None
+    use_cache: bool = True
+
+
+class BatchGenerationItem(BaseModel):
+    user_id: int
+    status: str
+    detail: str | None = None
+    model_config = ConfigDict(from_attributes=True)
+
+
+class BatchGenerationResponse(BaseModel):
+    results: list[BatchGenerationItem]
@@ -0,0 +1,48 @@
+from pydantic import BaseModel
+
+
+class DatabasePoolStats(BaseModel):
+    pool_class: str
+    connects: int
+    checkouts: int
+    checkins: int
+    invalidations: int
+    size: int | None = None
+    checked_in: int | None = None
+    checked_out: int | None = None
+    overflow: int | None = None
+
+
+class DatabaseMetrics(BaseModel):
+    sync_pool: DatabasePoolStats
+    async_pool: DatabasePoolStats | None = None
+
+
+class TokenCacheStats(BaseModel):
+    size: int
+    max_size: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    invalidations: int
+
+
+class PasswordHashingStats(BaseModel):
+    workers: int
+    max_queue_size: int
+    running: int
+    queue_depth: int
+    completed: int
+    rejected_busy: int
+    rejected_rate_limited: int
+    avg_wait_ms: float
+    avg_hash_ms: float
+    max_hash_ms: float
+
+
+class GenerationJobStats(BaseModel):
+    queue_size: int
+    pending: int
+    running: int
+    done: int
+    failed: int
@@ -21,3 +21,23 @@ class UserPublic(BaseModel):
 
 class UserList(BaseModel):
     users: list[UserPublic]
+    next_cursor: str | None = None
+    total: int | None = None
+
+
+class UserImportRow(UserSchema):
+    is_leader: bool | None = None
+
+
+class UserImportError(BaseModel):
+    row: int
+    email: str | None
+    detail: str
+    model_config = ConfigDict(from_attributes=True)
+
+
+class UserImportReport(BaseModel):
+    created: int
+    failed: int
+    errors: list[UserImportError]
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,148 @@
+"""This module contains the final score engine: the weighted final score
+of every question is computed with pandas, many users at a time, and
+materialized in the `final_scores` table.
+
+The scores of a user are refreshed in the same transaction that changes
+their feedback answers, so reports read them instead of recomputing."""
+
+from typing import Iterable, List
+
+import pandas as pd
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from src.analytics import update_question_stats
+from src.database.models import Feedback, FeedbackAnswer, FinalScore, User
+from src.database.queries import final_score
+from src.settings import get_settings
+
+SCORE_COLUMNS = [
+    'user_id',
+    'question_number',
+    'auto_answer',
+    'leader_answer',
+    'final_score',
+]
+
+
+def load_answers(session: Session, user_ids: List[int]) -> pd.DataFrame:
+    """
+    Loads the auto and leader answers of many users in a single query.
+
+    Returns:
+        pd.DataFrame: One row per answer, with the `user_id`,
+        `auto_feedback`, `question_number` and `answer` columns.
+    """
+    rows = session.execute(
+        select(
+            Feedback.user_id,
+            Feedback.auto_feedback,
+            FeedbackAnswer.question_number,
+            FeedbackAnswer.answer,
+        )
+        .join(FeedbackAnswer, FeedbackAnswer.feedback_id == Feedback.id)
+        .where(Feedback.user_id.in_(user_ids))
+    ).all()
+    return pd.DataFrame(
+        rows,
+        columns=['user_id', 'auto_feedback', 'question_number', 'answer'],
+    )
+
+
+def compute_final_scores(answers: pd.DataFrame) -> pd.DataFrame:
+    """
+    Computes the final score of every question answered in both the auto
+    and the leader feedback.
+
+    Args:
+        answers (pd.DataFrame): The answers, as returned by `load_answers`.
+
+    Returns:
+        pd.DataFrame: One row per user and question, with the columns in
+        `SCORE_COLUMNS`.
+    """
+    if answers.empty:
+        return pd.DataFrame(columns=SCORE_COLUMNS)
+
+    # Uma coluna para cada tipo de feedback, alinhadas por
+    # (user_id, question_number), no lugar do loop aninhado
+    scores = (
+        answers.pivot(
+            index=['user_id', 'question_number'],
+            columns='auto_feedback',
+            values='answer',
+        )
+        .reindex(columns=[True, False])
+        .rename(columns={True: 'auto_answer', False: 'leader_answer'})
+        .dropna()
+        .astype(int)
+        .reset_index()
+    )
+    scores['final_score'] = final_score(
+        scores['auto_answer'], scores['leader_answer']
+    )
+    return scores[SCORE_COLUMNS]
+
+
+def refresh_final_scores(session: Session, user_ids: Iterable[int]) -> int:
+    """
+    Recomputes and stores the final scores of the given users. The caller
+    commits, so the scores can change in the same transaction as the
+    answers.
+
+    Args:
+        session (Session): The database session.
+        user_ids (Iterable[int]): The users to refresh.
+
+    Returns:
+        int: The number of scores stored.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+
+    previous = session.execute(
+        select(FinalScore.question_number, FinalScore.final_score).where(
+            FinalScore.user_id.in_(user_ids)
+        )
+    ).all()
+    scores = compute_final_scores(load_answers(session, user_ids))
+    session.execute(delete(FinalScore).where(FinalScore.user_id.in_(user_ids)))
+    if not scores.empty:
+        session.execute(
+            insert(FinalScore),
+            scores.to_dict('records'),
+        )
+
+    update_question_stats(
+        session,
+        'final',
+        removed=previous,
+        added=zip(scores['question_number'], scores['final_score']),
+    )
+    return len(scores)
+
+
+def rebuild_final_scores(
+    session: Session, batch_size: int | None = None
+) -> int:
+    """
+    Recomputes the final scores of every user, committing one batch of
+    users at a time.
+
+    Args:
+        session (Session): The database session.
+        batch_size (int | None): Users computed per batch.
+
+    Returns:
+        int: The number of scores stored.
+    """
+    batch_size = batch_size or get_settings().SCORING_BATCH_SIZE
+    user_ids = session.scalars(select(User.id).order_by(User.id)).all()
+    total = 0
+    for start in range(0, len(user_ids), batch_size):
+        total += refresh_final_scores(
+            session, user_ids[start : start + batch_size]
+        )
+        session.commit()
+    return total
@@ -1,56 +1,145 @@
+import contextlib
 from datetime import datetime, timedelta
 from http import HTTPStatus
-from typing import Annotated
+from typing import Annotated, Sequence, Tuple
 from zoneinfo import ZoneInfo
 
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
 from jwt import decode, encode
 from jwt.exceptions import ExpiredSignatureError, PyJWTError
-from pwdlib import PasswordHash
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.database import get_session
+from src.database.database import get_async_session
 from src.database.models import User
-from src.settings import Settings
-
-T_Session = Annotated[Session, Depends(get_session)]
-pwd_context = PasswordHash.recommended()
+from src.password_hashing import (
+    PasswordHashingBusyError,
+    PasswordHashingPool,
+    PasswordHashingRateLimitError,
+    get_password_hashing_pool,
+)
+from src.settings import Settings, get_settings
+from src.token_cache import UserSnapshot, token_cache
+
+T_Session = Annotated[AsyncSession, Depends(get_async_session)]
+T_Settings = Annotated[Settings, Depends(get_settings)]
+T_PasswordHashingPool = Annotated[
+    PasswordHashingPool, Depends(get_password_hashing_pool)
+]
 
 
 OAUTH2_SCHEME = OAuth2PasswordBearer(tokenUrl='auth/token')
 
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+def password_rate_limit_keys(request: Request, email: str) -> Tuple[str, ...]:
+    """
+    Returns the keys used to limit the concurrent password hashes of an
+    account and of the client address.
+    """
+    client = request.client.host if request.client else 'unknown'
+    return (f'account:{email.lower()}', f'ip:{client}')
 
 
-def create_access_token(data_payload: dict) -> str:
+@contextlib.contextmanager
+def _password_hashing_errors():
+    try:
+        yield
+    except PasswordHashingRateLimitError as e:
+        raise HTTPException(
+            status_code=HTTPStatus.TOO_MANY_REQUESTS,
+            detail=str(e),
+        )
+    except PasswordHashingBusyError as e:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={'Retry-After': '1'},
+        )
+
+
+async def ahash_password(
+    hashing_pool: PasswordHashingPool,
+    password: str,
+    keys: Sequence[str] = (),
+) -> str:
+    """
+    Hashes a password in the hashing pool.
+
+    Raises:
+        HTTPException: 429 if the account or client has too many hashes in
+        flight, 503 if the hashing pool is busy.
+    """
+    with _password_hashing_errors():
+        return await hashing_pool.hash(password, keys)
+
+
+async def averify_password(
+    hashing_pool: PasswordHashingPool,
+    plain_password: str,
+    hashed_password: str,
+    keys: Sequence[str] = (),
+) -> Tuple[bool, str | None]:
+    """
+    Verifies a password in the hashing pool.
+
+    Returns:
+        Tuple[bool, str | None]: Whether the password is valid, and the new
+        hash to store when the stored one uses outdated Argon2 parameters.
+
+    Raises:
+        HTTPException: 429 if the account or client has too many hashes in
+        flight, 503 if the hashing pool is busy.
+    """
+    with _password_hashing_errors():
+        return await hashing_pool.verify_and_update(
+            plain_password, hashed_password, keys
+        )
+
+
+def create_access_token(
+    data_payload: dict, settings: Settings | None = None
+) -> str:
+    settings = settings or get_settings()
     to_encode = data_payload.copy()
     expire = datetime.now(tz=ZoneInfo('UTC')) + timedelta(
-        minutes=Settings().ACCESS_TOKEN_EXPIRE_MINUTES  # type: ignore
+        minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
     )
 
     to_encode.update({'exp': expire})
 
     encoded_jwt = encode(
         to_encode,
-        Settings().SECRET_KEY,  # type: ignore
-        algorithm=Settings().ALGORITHM,  # type: ignore
-    )  # type: ignore
+        settings.SECRET_KEY,
+        algorithm=settings.ALGORITHM,
+    )
 
     return encoded_jwt
 
 
-def get_current_user(
+def create_user_access_token(
+    user: User | UserSnapshot, settings: Settings | None = None
+) -> str:
+    """
+    Creates the access token of a user, with the email as subject and the
+    user id in the 'uid' claim.
+    """
+    return create_access_token(
+        data_payload={'sub': user.email, 'uid': user.id}, settings=settings
+    )
+
+
+async def get_current_user(
     session: T_Session,
+    settings: T_Settings,
     token: str = Depends(OAUTH2_SCHEME),
-) -> User:
+) -> UserSnapshot:
+    # Tokens já verificados são servidos do cache, sem decodificar o JWT
+    # nem consultar o banco
+    cached_user = token_cache.get(token)
+    if cached_user is not None:
+        return cached_user
+
     credentials_exception = HTTPException(
         status_code=HTTPStatus.UNAUTHORIZED,
         detail='Could not validate credentials',
@@ -59,11 +148,12 @@ def get_current_user(
     try:
         payload = decode(
             token,
-            Settings().SECRET_KEY,  # type: ignore
-            algorithms=[Settings().ALGORITHM],  # type: ignore
+            settings.SECRET_KEY,
+            algorithms=[settings.ALGORITHM],
         )  # type: ignore
 
         email: str = payload.get('sub')
+        user_id: int | None = payload.get('uid')
 
         if not email:
             raise credentials_exception
@@ -73,9 +163,17 @@ def get_current_user(
     except PyJWTError:
         raise credentials_exception
 
-    user_db = session.scalar(select(User).where(User.email == email))
+    if user_id is not None:
+        user_db = await session.get(User, user_id)
+        if user_db is not None and user_db.email != email:
+            user_db = None
+    else:
+        # Tokens emitidos antes da claim 'uid'
+        user_db = await session.scalar(select(User).where(User.email == email))
 
     if user_db is None:
         raise credentials_exception
 
-    return user_db
+    user = UserSnapshot.from_user(user_db)
+    token_cache.set(token, user, payload['exp'])
+    return user
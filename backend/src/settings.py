@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -11,3 +13,59 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int
     ASSISTANT_CONFIG_PATH: str
     GOOGLE_API_KEY: str
+    IAGO_CACHE_MAX_SIZE: int = 1024
+    IAGO_CACHE_TTL_SECONDS: int = 86400
+    # O backend 'inprocess' guarda o status dos jobs na memória do processo:
+    # com ele, a API deve rodar com um único worker
+    IAGO_JOB_BACKEND: str = 'inprocess'
+    IAGO_JOB_CONCURRENCY: int = 4
+    IAGO_JOB_QUEUE_SIZE: int = 100
+    IAGO_JOB_RETENTION: int = 1000
+    IAGO_BATCH_CONCURRENCY: int = 8
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: int = 30000
+    DB_SQLITE_JOURNAL: str = 'WAL'
+    DB_SQLITE_SYNC: str = 'NORMAL'
+    ASYNC_DATABASE: bool = True
+    AUTH_CACHE_MAX_SIZE: int = 10000
+    AUTH_CACHE_TTL_SECONDS: int = 60
+    PASSWORD_HASH_TIME_COST: int = 3
+    PASSWORD_HASH_MEMORY_COST: int = 65536
+    PASSWORD_HASH_PARALLELISM: int = 4
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE_SIZE: int = 32
+    PASSWORD_HASH_MAX_PER_KEY: int = 2
+    USER_IMPORT_BATCH_SIZE: int = 500
+    USER_IMPORT_WORKERS: int = 4
+    USER_IMPORT_MAX_CONCURRENT: int = 1
+    SCORING_BATCH_SIZE: int = 1000
+    EXPORT_CHUNK_SIZE: int = 1000
+    LOG_LEVEL: str = 'INFO'
+    LOG_SAMPLE_RATE: float = 1.0
+    SLOW_REQUEST_MS: int = 1000
+    SLOW_REQUEST_QUERIES: int = 50
+    IAGO_PROMPT_TOKEN_BUDGET: int = 16000
+    IAGO_CONTEXT_CACHE: bool = False
+    IAGO_CONTEXT_CACHE_TTL_SECONDS: int = 3600
+    IAGO_CONTEXT_CACHE_MIN_TOKENS: int = 4096
+    IAGO_LLM_TIMEOUT_SECONDS: float = 120
+    IAGO_LLM_MAX_RETRIES: int = 2
+    IAGO_LLM_BACKOFF_SECONDS: float = 0.5
+    IAGO_LLM_BACKOFF_MAX_SECONDS: float = 8
+    IAGO_LLM_CIRCUIT_FAILURES: int = 5
+    IAGO_LLM_CIRCUIT_RESET_SECONDS: float = 30
+    IAGO_LLM_HEDGE_AFTER_SECONDS: float = 0
+    IAGO_LLM_MAX_CONCURRENCY: int = 16
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """
+    Returns the application settings. The `.env` file is read once, on the
+    first call, and the same instance is reused afterwards.
+    """
+    return Settings()  # type: ignore
@@ -0,0 +1,154 @@
+"""This module contains the cache of verified access tokens used by
+`get_current_user` to skip the JWT decoding and the user lookup on every
+authenticated request."""
+
+import dataclasses
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Set, Tuple
+
+from sqlalchemy import event
+
+from src.database.models import User
+from src.settings import get_settings
+
+
+@dataclasses.dataclass(frozen=True)
+class UserSnapshot:
+    """
+    UserSnapshot is an immutable copy of the authenticated user, safe to
+    share between requests.
+
+    Attributes:
+        id (int): The user id.
+        name (str): The user name.
+        email (str): The user email.
+        is_leader (bool): Whether the user is a leader.
+    """
+
+    id: int
+    name: str
+    email: str
+    is_leader: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> 'UserSnapshot':
+        return cls(
+            id=user.id,
+            name=user.name,
+            email=user.email,
+            is_leader=user.is_leader,
+        )
+
+
+class TokenCache:
+    """
+    TokenCache is a bounded, thread-safe TTL cache of verified access
+    tokens to user snapshots. An entry never outlives the token expiration,
+    and every entry of a user is dropped when the user is updated or
+    deleted through the ORM.
+
+    The cache is local to the process: other workers only see a change to
+    a user once their entries expire, so the TTL bounds how stale a
+    snapshot can be.
+
+    Attributes:
+        max_size (int): Maximum number of cached tokens.
+        ttl_seconds (float): Maximum time a token stays cached.
+
+    Methods:
+        get(token: str) -> UserSnapshot | None:
+            Returns the cached user of a token, or None.
+        set(token: str, user: UserSnapshot, expires_at: float):
+            Caches the user of a verified token.
+        invalidate_user(user_id: int):
+            Drops every cached token of a user.
+        clear():
+            Drops every cached token.
+        stats() -> Dict[str, Any]:
+            Returns the cache counters.
+    """
+
+    def __init__(
+        self,
+        max_size: int | None = None,
+        ttl_seconds: float | None = None,
+    ):
+        settings = get_settings()
+        self.max_size = max_size or settings.AUTH_CACHE_MAX_SIZE
+        self.ttl_seconds = ttl_seconds or settings.AUTH_CACHE_TTL_SECONDS
+        self._entries: OrderedDict[str, Tuple[float, UserSnapshot]] = (
+            OrderedDict()
+        )
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _drop(self, token: str):
+        _, user = self._entries.pop(token)
+        tokens = self._tokens_by_user.get(user.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user.id]
+
+    def get(self, token: str) -> UserSnapshot | None:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, user = entry
+            if expires_at <= time.time():
+                self._drop(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return user
+
+    def set(self, token: str, user: UserSnapshot, expires_at: float):
+        expires_at = min(expires_at, time.time() + self.ttl_seconds)
+        with self._lock:
+            if token in self._entries:
+                self._drop(token)
+            self._entries[token] = (expires_at, user)
+            self._tokens_by_user.setdefault(user.id, set()).add(token)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._drop(token)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+            }
+
+
+token_cache = TokenCache()
+
+
+# Updates e deletes feitos com update()/delete() em lote não disparam
+# esses eventos; nesses casos as entradas expiram pelo TTL
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user_tokens(mapper, connection, target: User):
+    token_cache.invalidate_user(target.id)
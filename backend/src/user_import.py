@@ -0,0 +1,295 @@
+"""This module contains the bulk import of collaborators and leaders from
+CSV or JSONL files.
+
+The input is read as a stream and processed in batches: each batch is
+validated, checked for existing emails with a single query, hashed in
+parallel and inserted in its own transaction. The API hashes on the
+long-lived password hashing pool of the app; the command line, which has
+no such pool, hashes on a pool created for the import."""
+
+import contextlib
+import csv
+import dataclasses
+import json
+from typing import IO, Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from src.database.models import User
+from src.password_hashing import PasswordHashingPool
+from src.schemas.users import UserImportRow
+from src.settings import get_settings
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+PasswordHasher = Callable[[Sequence[str]], List[str]]
+
+
+class UserImportFormatError(ValueError):
+    """Raised when the import file format is not supported."""
+
+
+@dataclasses.dataclass
+class UserImportError:
+    """
+    UserImportError describes a row that was not imported.
+
+    Attributes:
+        row (int): The row number in the file, starting at 1.
+        email (str | None): The row email, if present.
+        detail (str): Why the row was rejected.
+    """
+
+    row: int
+    email: str | None
+    detail: str
+
+
+@dataclasses.dataclass
+class UserImportReport:
+    """
+    UserImportReport summarizes an import.
+
+    Attributes:
+        created (int): Number of users created.
+        failed (int): Number of rows rejected.
+        errors (List[UserImportError]): The rejected rows.
+    """
+
+    created: int = 0
+    failed: int = 0
+    errors: List[UserImportError] = dataclasses.field(default_factory=list)
+
+    def add_error(self, row: int, email: str | None, detail: str):
+        self.failed += 1
+        self.errors.append(UserImportError(row, email, detail))
+
+
+def detect_format(filename: str | None, file_format: str | None) -> str:
+    """
+    Returns the import format, given explicitly or taken from the file
+    extension.
+
+    Raises:
+        UserImportFormatError: If the format is not supported.
+    """
+    if file_format is None and filename:
+        extension = filename.rsplit('.', 1)[-1].lower()
+        file_format = (
+            'jsonl' if extension in {'jsonl', 'ndjson'} else extension
+        )
+    if file_format not in IMPORT_FORMATS:
+        raise UserImportFormatError(
+            'Unsupported import format, use one of '
+            + ', '.join(IMPORT_FORMATS)
+        )
+    return file_format
+
+
+def iter_rows(
+    stream: IO[str], file_format: str
+) -> Iterator[Tuple[int, Dict[str, Any] | None]]:
+    """
+    Reads the rows of the file one at a time.
+
+    Yields:
+        Tuple[int, Dict[str, Any] | None]: The row number and its fields,
+        or None when the row cannot be parsed.
+    """
+    if file_format == 'csv':
+        for number, record in enumerate(csv.DictReader(stream), start=1):
+            # Colunas vazias no CSV usam o valor padrão
+            yield number, {k: v for k, v in record.items() if k and v}
+        return
+
+    number = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            record = None
+        yield number, record if isinstance(record, dict) else None
+
+
+def _insert_batch(
+    session: Session,
+    batch: List[Tuple[int, Dict[str, Any]]],
+    report: UserImportReport,
+):
+    try:
+        session.execute(insert(User), [values for _, values in batch])
+        session.commit()
+        report.created += len(batch)
+        return
+    except IntegrityError:
+        session.rollback()
+
+    # Algum email foi criado por outra requisição durante o import: insere
+    # linha a linha para identificar quais falharam
+    for number, values in batch:
+        try:
+            with session.begin_nested():
+                session.execute(insert(User), [values])
+            report.created += 1
+        except IntegrityError:
+            report.add_error(number, values['email'], 'Email already exists')
+    session.commit()
+
+
+@contextlib.contextmanager
+def import_hasher(workers: int) -> Iterator[PasswordHasher]:
+    """
+    Hashes the passwords of an import on a hashing pool that lives for the
+    duration of the import. Meant for the command line; the API uses the
+    password hashing pool of the app.
+
+    Args:
+        workers (int): Number of hashing threads.
+
+    Yields:
+        PasswordHasher: A function that hashes a list of passwords.
+    """
+    # O pool é exclusivo do import, então todas as threads hasheiam o lote
+    pool = PasswordHashingPool(workers=workers, batch_workers=workers)
+    try:
+        with pool.batch_slot():
+            yield pool.hash_many
+    finally:
+        pool.shutdown()
+
+
+def _import_batch(
+    session: Session,
+    hash_passwords: PasswordHasher,
+    batch: List[Tuple[int, UserImportRow]],
+    report: UserImportReport,
+):
+    existing_emails = set(
+        session.scalars(
+            select(User.email).where(
+                User.email.in_([row.email for _, row in batch])
+            )
+        )
+    )
+    new_rows = []
+    for number, row in batch:
+        if row.email in existing_emails:
+            report.add_error(number, row.email, 'Email already exists')
+        else:
+            new_rows.append((number, row))
+    if not new_rows:
+        return
+
+    hashes = hash_passwords([row.password for _, row in new_rows])
+    _insert_batch(
+        session,
+        [
+            (
+                number,
+                {
+                    'name': row.name,
+                    'email': row.email,
+                    'password': password,
+                    'is_leader': row.is_leader,
+                },
+            )
+            for (number, row), password in zip(new_rows, hashes)
+        ],
+        report,
+    )
+
+
+def import_users(  # noqa: PLR0913, PLR0917
+    session: Session,
+    stream: IO[str],
+    file_format: str,
+    is_leader: bool = False,
+    batch_size: int | None = None,
+    workers: int | None = None,
+    hash_passwords: PasswordHasher | None = None,
+) -> UserImportReport:
+    """
+    Imports the users of a CSV or JSONL file. The CSV header, or the JSON
+    keys, are `name`, `email`, `password` and, optionally, `is_leader`.
+
+    Args:
+        session (Session): The database session.
+        stream (IO[str]): The file, read as a stream.
+        file_format (str): 'csv' or 'jsonl'.
+        is_leader (bool): Default role of rows without `is_leader`.
+        batch_size (int | None): Rows validated, hashed and inserted per
+        transaction.
+        workers (int | None): Number of hashing threads, when
+        `hash_passwords` is not given.
+        hash_passwords (PasswordHasher | None): Hashes a batch of
+        passwords; defaults to a pool created for the import.
+
+    Returns:
+        UserImportReport: The number of created users and the rejected
+        rows.
+    """
+    settings = get_settings()
+    batch_size = batch_size or settings.USER_IMPORT_BATCH_SIZE
+
+    with contextlib.ExitStack() as stack:
+        if hash_passwords is None:
+            hash_passwords = stack.enter_context(
+                import_hasher(workers or settings.USER_IMPORT_WORKERS)
+            )
+        report = _import_rows(
+            session, stream, file_format, is_leader, batch_size, hash_passwords
+        )
+
+    report.errors.sort(key=lambda error: error.row)
+    return report
+
+
+def _import_rows(  # noqa: PLR0913, PLR0917
+    session: Session,
+    stream: IO[str],
+    file_format: str,
+    is_leader: bool,
+    batch_size: int,
+    hash_passwords: PasswordHasher,
+) -> UserImportReport:
+    report = UserImportReport()
+    seen_emails: set[str] = set()
+    batch: List[Tuple[int, UserImportRow]] = []
+
+    for number, record in iter_rows(stream, file_format):
+        if record is None:
+            report.add_error(number, None, 'Invalid row')
+            continue
+        try:
+            row = UserImportRow.model_validate(record)
+        except ValidationError as e:
+            report.add_error(
+                number,
+                record.get('email'),
+                '; '.join(
+                    f'{".".join(map(str, err["loc"]))}: {err["msg"]}'
+                    for err in e.errors()
+                ),
+            )
+            continue
+        if row.email in seen_emails:
+            report.add_error(number, row.email, 'Duplicated email in file')
+            continue
+        seen_emails.add(row.email)
+        if row.is_leader is None:
+            row.is_leader = is_leader
+
+        batch.append((number, row))
+        if len(batch) >= batch_size:
+            _import_batch(session, hash_passwords, batch, report)
+            batch = []
+
+    if batch:
+        _import_batch(session, hash_passwords, batch, report)
+    return report
@@ -1,7 +1,10 @@
+import logging
 from typing import Any, Dict
 
 import yaml
 
+logger = logging.getLogger(__name__)
+
 
 def read_yaml_file(file_name: str) -> Dict[str, Any]:
     """
@@ -13,6 +16,8 @@ def read_yaml_file(file_name: str) -> Dict[str, Any]:
     with open(file_name, 'r', encoding='utf-8') as stream:
         try:
             return yaml.safe_load(stream)
-        except yaml.YAMLError as exc:
-            print(exc)
+        except yaml.YAMLError:
+            logger.exception(
+                'Invalid YAML file', extra={'file_name': file_name}
+            )
             return {}
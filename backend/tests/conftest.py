@@ -0,0 +1,38 @@
+import os
+
+# Valores mínimos para carregar as configurações sem um arquivo .env
+for key, value in {
+    'DATABASE_URL': 'sqlite:///:memory:',
+    'SECRET_KEY': 'test-secret',
+    'ALGORITHM': 'HS256',
+    'ACCESS_TOKEN_EXPIRE_MINUTES': '30',
+    'ASSISTANT_CONFIG_PATH': 'src/assistant/iago_assistant.yaml',
+    'GOOGLE_API_KEY': 'test-key',
+}.items():
+    os.environ.setdefault(key, value)
+
+import pytest  # noqa: E402
+
+from src.settings import get_settings  # noqa: E402
+
+
+@pytest.fixture
+def llm_settings():
+    """Settings with a fast resilience policy, overridable per test."""
+
+    def _settings(**overrides):
+        return get_settings().model_copy(
+            update={
+                'IAGO_LLM_TIMEOUT_SECONDS': 5,
+                'IAGO_LLM_MAX_RETRIES': 2,
+                'IAGO_LLM_BACKOFF_SECONDS': 0.001,
+                'IAGO_LLM_BACKOFF_MAX_SECONDS': 0.01,
+                'IAGO_LLM_CIRCUIT_FAILURES': 2,
+                'IAGO_LLM_CIRCUIT_RESET_SECONDS': 60,
+                'IAGO_LLM_HEDGE_AFTER_SECONDS': 0,
+                'IAGO_LLM_MAX_CONCURRENCY': 4,
+                **overrides,
+            }
+        )
+
+    return _settings
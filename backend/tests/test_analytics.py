@@ -0,0 +1,75 @@
+import pytest
+from sqlalchemy import create_engine, literal, select
+from sqlalchemy.orm import Session
+
+from src.analytics import (
+    get_question_stats,
+    rebuild_question_stats,
+    score_bucket,
+)
+from src.database.models import FinalScore, User, table_registry
+from src.database.queries import final_score
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    table_registry.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+@pytest.mark.parametrize(
+    ('auto_answer', 'leader_answer', 'bucket'),
+    [(1, 1, 1), (3, 3, 3), (4, 3, 3), (2, 4, 3), (5, 5, 5)],
+)
+def test_final_score_lands_in_its_bucket(auto_answer, leader_answer, bucket):
+    assert score_bucket(final_score(auto_answer, leader_answer)) == bucket
+
+
+def test_bucket_ignores_float_error():
+    assert score_bucket(2.9999999999999996) == 3  # noqa: PLR2004
+
+
+@pytest.mark.parametrize('value', [0.5, 5.5])
+def test_bucket_rejects_values_outside_the_scale(value):
+    with pytest.raises(ValueError, match='1 to 5 scale'):
+        score_bucket(value)
+
+
+def test_sql_final_score_matches_python(session):
+    score = session.scalar(select(final_score(literal(3), literal(3))))
+    assert score == final_score(3, 3) == 3  # noqa: PLR2004
+
+
+def test_rebuild_buckets_like_score_bucket(session):
+    # Valores ainda não arredondados, como os gravados antes do ROUND
+    values = [1.0, 1.9999, 2.9999999999999996, 3.225, 4.1, 5.0]
+    for index, value in enumerate(values):
+        user = User(
+            name=f'User {index}',
+            password='x',
+            email=f'user{index}@a.com',
+            is_leader=False,
+        )
+        session.add(user)
+        session.flush()
+        session.add(
+            FinalScore(
+                user_id=user.id,
+                question_number=1,
+                auto_answer=3,
+                leader_answer=3,
+                final_score=value,
+            )
+        )
+    session.commit()
+
+    rebuild_question_stats(session)
+
+    [stats] = get_question_stats(session, 'final')
+    expected = {bucket: 0 for bucket in range(1, 6)}
+    for value in values:
+        expected[score_bucket(value)] += 1
+    assert stats['histogram'] == expected
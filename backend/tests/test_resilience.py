@@ -0,0 +1,214 @@
+import asyncio
+import time
+
+import pytest
+
+from src.assistant.providers import FakeChatModel
+from src.assistant.resilience import (
+    CircuitState,
+    LLMUnavailableError,
+    ResilientLLM,
+    get_resilient_llm,
+)
+from src.instrumentation import LLM_HEDGES, LLM_RETRIES
+
+PROMPT = 'Gere o PDI da Ana'
+
+
+def fake(**options) -> FakeChatModel:
+    return FakeChatModel(**{
+        'latency_ms': 0,
+        'tokens_per_second': 0,
+        'response_tokens': 8,
+        **options,
+    })
+
+
+def scripted(*models: FakeChatModel):
+    """Returns a call that uses the next model on every attempt."""
+    attempts = []
+
+    def call():
+        model = models[min(len(attempts), len(models) - 1)]
+        attempts.append(model)
+        return model.ainvoke(PROMPT)
+
+    return call, attempts
+
+
+def test_retries_transient_errors_until_success(llm_settings):
+    client = ResilientLLM('test-retry', llm_settings())
+    call, attempts = scripted(fake(error_rate=1), fake(error_rate=1), fake())
+
+    result = asyncio.run(client.acall(call, 'ainvoke'))
+
+    assert result.content == fake().invoke(PROMPT).content
+    assert len(attempts) == 3  # noqa: PLR2004
+    assert LLM_RETRIES._values[('test-retry', 'ainvoke')] == 2  # noqa: PLR2004
+    assert client.breaker.state == CircuitState.CLOSED
+
+
+def test_gives_up_after_max_retries(llm_settings):
+    client = ResilientLLM('test-give-up', llm_settings())
+    call, attempts = scripted(fake(error_rate=1))
+
+    with pytest.raises(LLMUnavailableError, match='LLM call failed'):
+        asyncio.run(client.acall(call, 'ainvoke'))
+    assert len(attempts) == 3  # noqa: PLR2004
+
+
+def test_failed_call_counts_once_in_circuit_breaker(llm_settings):
+    client = ResilientLLM('test-breaker', llm_settings())
+    call, attempts = scripted(fake(error_rate=1))
+
+    with pytest.raises(LLMUnavailableError, match='LLM call failed'):
+        asyncio.run(client.acall(call, 'ainvoke'))
+    # Três tentativas, uma única falha: o circuito continua fechado
+    assert client.breaker.state == CircuitState.CLOSED
+
+    with pytest.raises(LLMUnavailableError, match='LLM call failed'):
+        asyncio.run(client.acall(call, 'ainvoke'))
+    assert client.breaker.state == CircuitState.OPEN
+
+    attempts.clear()
+    with pytest.raises(LLMUnavailableError, match='circuit breaker is open'):
+        asyncio.run(client.acall(call, 'ainvoke'))
+    assert not attempts
+
+
+def test_half_open_probe_closes_or_reopens_the_circuit(llm_settings):
+    client = ResilientLLM(
+        'test-half-open',
+        llm_settings(
+            IAGO_LLM_CIRCUIT_FAILURES=1,
+            IAGO_LLM_CIRCUIT_RESET_SECONDS=0.05,
+            IAGO_LLM_MAX_RETRIES=0,
+        ),
+    )
+    failing, _ = scripted(fake(error_rate=1))
+    healthy, _ = scripted(fake())
+
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(client.acall(failing, 'ainvoke'))
+    assert client.breaker.state == CircuitState.OPEN
+
+    time.sleep(0.06)
+    with pytest.raises(LLMUnavailableError, match='LLM call failed'):
+        asyncio.run(client.acall(failing, 'ainvoke'))
+    assert client.breaker.state == CircuitState.OPEN
+
+    time.sleep(0.06)
+    asyncio.run(client.acall(healthy, 'ainvoke'))
+    assert client.breaker.state == CircuitState.CLOSED
+
+
+def test_deadline_covers_the_retries(llm_settings):
+    client = ResilientLLM(
+        'test-deadline', llm_settings(IAGO_LLM_TIMEOUT_SECONDS=0.1)
+    )
+    call, attempts = scripted(fake(latency_ms=1000))
+
+    started_at = time.monotonic()
+    with pytest.raises(LLMUnavailableError, match='TimeoutError'):
+        asyncio.run(client.acall(call, 'ainvoke'))
+
+    assert time.monotonic() - started_at < 0.5  # noqa: PLR2004
+    assert len(attempts) == 1
+
+
+def test_hedged_request_answers_first(llm_settings):
+    client = ResilientLLM(
+        'test-hedge', llm_settings(IAGO_LLM_HEDGE_AFTER_SECONDS=0.02)
+    )
+    call, attempts = scripted(fake(latency_ms=1000), fake())
+
+    started_at = time.monotonic()
+    result = asyncio.run(client.acall(call, 'ainvoke'))
+
+    assert result.content == fake().invoke(PROMPT).content
+    assert time.monotonic() - started_at < 0.5  # noqa: PLR2004
+    assert len(attempts) == 2  # noqa: PLR2004
+    assert LLM_HEDGES._values[('test-hedge', 'hedge')] == 1
+
+
+def test_hedge_success_wins_over_a_simultaneous_failure(llm_settings):
+    client = ResilientLLM(
+        'test-hedge-tie',
+        llm_settings(
+            IAGO_LLM_HEDGE_AFTER_SECONDS=0.01, IAGO_LLM_MAX_RETRIES=0
+        ),
+    )
+
+    async def run():
+        release = asyncio.Event()
+        calls = []
+
+        async def call():
+            calls.append(None)
+            is_primary = len(calls) == 1
+            if not is_primary:
+                # As duas requisições terminam no mesmo ciclo do loop
+                asyncio.get_running_loop().call_soon(release.set)
+            await release.wait()
+            if is_primary:
+                raise ConnectionError('primary failed')
+            return 'hedge answer'
+
+        return await client.acall(call, 'ainvoke')
+
+    assert asyncio.run(run()) == 'hedge answer'
+
+
+def test_stream_retries_until_the_first_chunk(llm_settings):
+    client = ResilientLLM('test-stream', llm_settings())
+    models = iter([fake(error_rate=1), fake()])
+
+    async def run():
+        return ''.join([
+            chunk.content
+            async for chunk in client.astream(
+                lambda: next(models).astream(PROMPT), 'astream'
+            )
+        ])
+
+    assert asyncio.run(run()) == fake().invoke(PROMPT).content
+    assert LLM_RETRIES._values[('test-stream', 'astream')] == 1
+
+
+def test_stream_closes_the_failed_attempt(llm_settings):
+    client = ResilientLLM('test-stream-close', llm_settings())
+    closed = []
+
+    async def failing():
+        try:
+            raise ConnectionError('stream failed')
+            yield  # pragma: no cover
+        finally:
+            closed.append('failing')
+
+    async def healthy():
+        try:
+            yield 'a'
+            yield 'b'
+        finally:
+            closed.append('healthy')
+
+    streams = iter([failing, healthy])
+
+    def stream():
+        return next(streams)()
+
+    async def run():
+        chunks = client.astream(stream, 'astream')
+        first = await anext(chunks)
+        # O cliente desiste depois do primeiro trecho
+        await chunks.aclose()
+        return first
+
+    assert asyncio.run(run()) == 'a'
+    assert closed == ['failing', 'healthy']
+
+
+def test_resilient_llm_is_shared_per_model():
+    assert get_resilient_llm('test-shared') is get_resilient_llm('test-shared')
+    assert get_resilient_llm('test-shared') is not get_resilient_llm('other')